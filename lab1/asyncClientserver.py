@@ -0,0 +1,159 @@
+"""
+Phonebook client and server using asyncio
+
+Requests and responses are frames (see framing), so a client can pipeline many requests on one
+connection. The server answers them in order.
+"""
+
+import asyncio
+import logging
+import socket
+from collections import deque
+
+import const_cs
+import framing
+import myClientserver
+import phonebook
+from context import lab_logging
+
+lab_logging.setup(stream_level=logging.INFO)  # init loging channels for the lab
+
+# pylint: disable=logging-not-lazy, line-too-long
+
+class Server:
+    """ The server (one coroutine per connection) """
+    _logger = logging.getLogger("vs2lab.lab1.asyncClientserver.Server")
+    _serving = True
+    phoneNmbers = myClientserver.Server.phoneNmbers
+
+    def __init__(self, port=const_cs.PORT, backlog=const_cs.BACKLOG, store=None):
+        self.store = store if store is not None else phonebook.DictStore(self.phoneNmbers)  # data tier
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # prevents errors due to "addresses in use"
+        self.sock.bind((const_cs.HOST, port))
+        self.sock.listen(backlog)  # listen right away, clients connecting before serving wait in the backlog
+        self._logger.info("Server bound to socket " + str(self.sock))
+
+    async def serve(self, poll_interval=1.0):
+        """ Serve phonebook requests until _serving is reset """
+        server = await asyncio.start_server(self._connection, sock=self.sock)
+        async with server:
+            while self._serving:  # as long as _serving (checked every poll_interval)
+                await asyncio.sleep(poll_interval)
+        self._logger.info("Server down.")
+
+    async def _connection(self, reader, writer):
+        """ Answer the requests of a connection in order """
+        try:
+            while True:
+                try:
+                    header = await reader.readexactly(framing.HEADER.size)  # receive next request
+                except asyncio.IncompleteReadError:
+                    break  # stop if client stopped
+                opcode, length = framing.HEADER.unpack(header)
+                framing.check(opcode, length)
+                response = self.handle((opcode, await reader.readexactly(length)))
+                if isinstance(response, bytes):
+                    writer.write(response)
+                    await writer.drain()  # only waits if the client does not keep up
+                else:
+                    for chunk in response:  # stream GET ALL chunk by chunk
+                        writer.write(chunk)
+                        await writer.drain()
+        except (ConnectionError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()  # close the connection
+
+    def handle(self, request):
+        """ Answer a request frame from the store (not logged, requests arrive at line rate) """
+        return phonebook.answer(self.store, request)
+
+
+class Client:
+    """
+    The client. Requests are sent right away and answered in order, concurrent calls
+    (and call_many) share the connection without waiting for each other's responses.
+    """
+    logger = logging.getLogger("vs2lab.lab1.asyncClientserver.Client")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.pending = deque()  # (response type, future) of sent requests, in order
+        self.arrived = asyncio.Event()  # set when pending requests wait for the receiver
+        self.receiver = asyncio.get_running_loop().create_task(self._receive())
+
+    @classmethod
+    async def connect(cls, port=const_cs.PORT):
+        """ Connect to the server """
+        reader, writer = await asyncio.open_connection(const_cs.HOST, port)
+        cls.logger.info("Client connected to " + str(writer.get_extra_info('peername')))
+        return cls(reader, writer)
+
+    def _request(self, opcode, payload=b''):
+        """ Send a request and return a future for its response """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((opcode, future))
+        self.arrived.set()
+        self.writer.write(framing.pack(opcode, payload))
+        return future
+
+    async def _frame(self):
+        """ Receive the next response frame """
+        opcode, length = framing.HEADER.unpack(await self.reader.readexactly(framing.HEADER.size))
+        framing.check(opcode, length)
+        return opcode, await self.reader.readexactly(length)
+
+    async def _receive(self):
+        """ Resolve the pending requests with the responses in order """
+        try:
+            while True:
+                if not self.pending:
+                    self.arrived.clear()
+                    await self.arrived.wait()
+                    continue
+                request, future = self.pending[0]
+                opcode, payload = await self._frame()
+                if request == framing.GET_ALL:
+                    entries = {}
+                    while opcode != framing.END:  # collect the chunks
+                        entries.update(framing.parse_entries(payload))
+                        opcode, payload = await self._frame()
+                    data = str(entries)
+                else:
+                    data = int.from_bytes(payload, byteorder='big') if opcode == framing.NUMBER else None
+                self.pending.popleft()
+                if not future.done():
+                    future.set_result(data)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            while self.pending:  # connection lost: fail the outstanding requests
+                _, future = self.pending.popleft()
+                if not future.done():
+                    future.set_exception(ConnectionError(e))
+
+    async def call_search(self, name):
+        """ Look up the number of a name (None if unknown) """
+        future = self._request(framing.GET, name.encode('utf-8'))
+        await self.writer.drain()
+        return await future
+
+    async def call_all(self):
+        """ Get all numbers """
+        future = self._request(framing.GET_ALL)
+        await self.writer.drain()
+        return await future
+
+    async def call_many(self, names):
+        """ Look up many names pipelined on the connection and return a dict of names and numbers """
+        names = list(names)
+        futures = [self._request(framing.GET, name.encode('utf-8')) for name in names]
+        await self.writer.drain()
+        return dict(zip(names, await asyncio.gather(*futures)))
+
+    async def close(self):
+        """ Close the connection """
+        self.receiver.cancel()
+        self.writer.close()
+        await self.writer.wait_closed()
+        self.logger.info("Client down.")
@@ -6,27 +6,28 @@ import logging
 import socket
 
 import const_cs
+from concurrentserver import ConcurrentServer
 from context import lab_logging
 
 lab_logging.setup(stream_level=logging.INFO)  # init loging channels for the lab
 
 # pylint: disable=logging-not-lazy, line-too-long
 
-class Server:
-    """ The server """
+class Server(ConcurrentServer):
+    """ The server (serve() handles one client at a time, serve_concurrent() many) """
     _logger = logging.getLogger("vs2lab.lab1.clientserver.Server")
     _serving = True
 
-    def __init__(self):
+    def __init__(self, port=const_cs.PORT, backlog=1):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # prevents errors due to "addresses in use"
-        self.sock.bind((const_cs.HOST, const_cs.PORT))
+        self.sock.bind((const_cs.HOST, port))
         self.sock.settimeout(3)  # time out in order not to block forever
+        self.sock.listen(backlog)  # listen right away, clients connecting before serving wait in the backlog
         self._logger.info("Server bound to socket " + str(self.sock))
 
     def serve(self):
         """ Serve echo """
-        self.sock.listen(1)
         while self._serving:  # as long as _serving (checked after connections or socket timeouts)
             try:
                 # pylint: disable=unused-variable
@@ -35,21 +36,25 @@ class Server:
                     data = connection.recv(1024)  # receive data from client
                     if not data:
                         break  # stop if client stopped
-                    connection.send(data + "*".encode('ascii'))  # return sent data plus an "*"
+                    connection.send(self.handle(data))  # return sent data plus an "*"
                 connection.close()  # close the connection
             except socket.timeout:
                 pass  # ignore timeouts
         self.sock.close()
         self._logger.info("Server down.")
 
+    def handle(self, data):
+        """ Echo request data plus an "*" """
+        return data + "*".encode('ascii')
+
 
 class Client:
     """ The client """
     logger = logging.getLogger("vs2lab.a1_layers.clientserver.Client")
 
-    def __init__(self):
+    def __init__(self, port=const_cs.PORT):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((const_cs.HOST, const_cs.PORT))
+        self.sock.connect((const_cs.HOST, port))
         self.logger.info("Client connected to socket " + str(self.sock))
 
     def call(self, msg_in="Hello, world"):
@@ -0,0 +1,258 @@
+"""
+Concurrent serving mode for the lab1 servers based on selectors (epoll on Linux)
+"""
+
+import logging
+import selectors
+import socket
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import const_cs
+
+# pylint: disable=logging-not-lazy, line-too-long
+
+
+class Connection:
+    """ State of a client connection """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.inp = bytearray()  # received data not split into requests yet
+        self.out = bytearray()  # response data not sent yet
+        self.pending = deque()  # responses (bytes or iterators of bytes) not moved to out yet
+        self.busy = False  # a request is handled by a worker thread (no further reads until it is done)
+        self.fetching = False  # a worker thread takes the next chunk off the streamed response pending[0]
+        self.events = 0  # events the connection is registered for (0: not registered)
+
+
+class ConcurrentServer:
+    """
+    Mixin adding a concurrent serving mode to a server class. The server provides a bound and
+    listening socket (self.sock), the _serving flag and handle(request), which maps a request to
+    the response data (bytes or an iterator of bytes, streamed as the socket takes them).
+    split() cuts the received data into requests (by default every read is one request).
+
+    serve_concurrent() multiplexes all client connections over non-blocking sockets in a single
+    thread with a selector. Requests are handled in the selector thread or, with workers > 0, in a
+    thread pool (one request per connection at a time, so responses keep their order). With workers,
+    the chunks of streamed responses are produced in the pool as well. Beyond max_connections the
+    server stops accepting, further clients wait in the listen backlog. A connection with more than
+    max_pending responses not sent yet is not read from until the client takes them (backpressure).
+    """
+    _logger = logging.getLogger("vs2lab.lab1.concurrentserver.ConcurrentServer")
+
+    def handle(self, request):
+        """ Handle a request and return the response data """
+        raise NotImplementedError
+
+    def split(self, buffer):
+        """ Take the complete requests off the received data (bytearray) """
+        request = bytes(buffer)
+        buffer.clear()
+        return [request]
+
+    def serve_concurrent(self, workers=0, max_connections=const_cs.MAX_CONNECTIONS, poll_interval=1.0,
+                         max_pending=const_cs.MAX_PENDING):
+        """
+        Serve many clients concurrently until _serving is reset.
+        :param workers: size of the worker thread pool for handle(), 0 handles requests in the selector thread
+        :param max_connections: maximum number of open client connections
+        :param poll_interval: seconds between checks of the _serving flag
+        :param max_pending: number of unsent responses per connection above which its requests are not read
+        """
+        self._selector = selectors.DefaultSelector()
+        self._connections = {}  # open connections by socket
+        self._done = deque()  # (method, connection, result or exception) of tasks finished by workers
+        self._max_connections = max_connections
+        self._max_pending = max_pending
+        self._view = memoryview(bytearray(const_cs.BUFSIZE))  # receive buffer shared by all connections
+        self._accepting = True
+        self.sock.setblocking(False)
+        self._selector.register(self.sock, selectors.EVENT_READ)  # data None marks the listening socket
+        # workers wake up the selector by writing to a socket pair
+        self._wakeup, self._wakeup_writer = socket.socketpair()
+        self._wakeup.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._selector.register(self._wakeup, selectors.EVENT_READ, self._wakeup)
+        self._pool = ThreadPoolExecutor(workers) if workers > 0 else None
+        self._logger.info("Serving concurrently with " + str(workers) + " workers")
+
+        try:
+            while self._serving:  # as long as _serving (checked after events or poll timeouts)
+                for key, events in self._selector.select(poll_interval):
+                    if key.data is None:
+                        self._accept()
+                    elif key.data is self._wakeup:
+                        self._drain_wakeup()
+                    else:
+                        if events & selectors.EVENT_WRITE:
+                            self._write(key.data)
+                        if events & selectors.EVENT_READ and key.data.sock in self._connections:
+                            self._read(key.data)
+                # pass responses and chunks of the workers on to their connections
+                while self._done:
+                    method, connection, result = self._done.popleft()
+                    if connection.sock in self._connections:
+                        method(connection, result)
+        finally:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+            for connection in list(self._connections.values()):
+                self._close(connection)
+            self._selector.close()
+            self._wakeup.close()
+            self._wakeup_writer.close()
+            self.sock.close()
+            self._logger.info("Server down.")
+
+    def _accept(self):
+        """ Accept pending connections up to the connection limit """
+        while len(self._connections) < self._max_connections:
+            try:
+                (sock, address) = self.sock.accept()  # returns new socket and address of client
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            connection = Connection(sock)
+            self._connections[sock] = connection
+            self._update(connection)
+            self._logger.debug("Connection from " + str(address))
+        # limit reached: leave further clients in the backlog until a connection is closed
+        self._selector.unregister(self.sock)
+        self._accepting = False
+        self._logger.info("Connection limit reached (" + str(self._max_connections) + ")")
+
+    def _read(self, connection):
+        """ Receive requests and handle them (or pass them to the worker pool) """
+        try:
+            size = connection.sock.recv_into(self._view)  # receive data from client
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            size = 0
+        if not size:
+            self._close(connection)  # stop if client stopped
+            return
+        connection.inp += self._view[:size]
+        try:
+            requests = self.split(connection.inp)
+        except ValueError as e:  # malformed data
+            self._respond(connection, e)
+            return
+        if not requests:
+            return  # wait for the rest of a request
+        if self._pool is None:
+            try:
+                response = [self.handle(request) for request in requests]
+            except Exception as e:  # pylint: disable=broad-except
+                response = e
+            self._respond(connection, response)
+            return
+        connection.busy = True
+        self._update(connection)
+        self._submit(self._respond, connection, lambda: [self.handle(request) for request in requests])
+
+    def _submit(self, method, connection, task):
+        """ Run a task in the worker pool and pass its result (or exception) to method in the selector thread """
+
+        def work():
+            try:
+                result = task()
+            except Exception as e:  # pylint: disable=broad-except
+                result = e
+            self._done.append((method, connection, result))
+            try:
+                self._wakeup_writer.send(b'\0')
+            except (BlockingIOError, OSError):
+                pass  # selector is awake anyway (or shutting down)
+
+        self._pool.submit(work)
+
+    def _respond(self, connection, response):
+        """ Send the responses to requests (or close the connection after a failed request) """
+        connection.busy = False
+        if isinstance(response, Exception):
+            self._logger.warning("Request failed: " + repr(response))
+            self._close(connection)
+            return
+        connection.pending.extend(response)
+        self._write(connection)
+
+    def _stream(self, connection, data):
+        """ Append the chunk of a streamed response fetched by a worker to the output (None: stream ended) """
+        connection.fetching = False
+        if isinstance(data, Exception):
+            self._logger.warning("Request failed: " + repr(data))
+            self._close(connection)
+            return
+        if data is None:
+            connection.pending.popleft()
+        else:
+            connection.out += data
+        self._write(connection)
+
+    def _write(self, connection):
+        """ Send as much of the pending response data as the socket takes """
+        try:
+            # move pending responses to the output buffer, streamed responses a chunk at a time
+            # (taken off by a worker if there is a pool, the selector thread only sends)
+            while len(connection.out) < const_cs.CHUNKSIZE and connection.pending and not connection.fetching:
+                data = connection.pending[0]
+                if isinstance(data, (bytes, bytearray)):
+                    connection.pending.popleft()
+                elif self._pool is not None:
+                    connection.fetching = True
+                    self._submit(self._stream, connection, lambda stream=data: next(stream, None))
+                    break
+                else:
+                    data = next(data, None)
+                    if data is None:
+                        connection.pending.popleft()  # stream ended
+                        continue
+                connection.out += data
+            sent = connection.sock.send(connection.out)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except Exception as e:  # pylint: disable=broad-except
+            self._logger.warning("Sending failed: " + repr(e))
+            self._close(connection)
+            return
+        del connection.out[:sent]
+        self._update(connection)
+
+    def _update(self, connection):
+        """ Register the connection for the events it waits for """
+        # wait for writability while there is data to send (not while a worker fetches the next chunk),
+        # read no requests while one is handled by a worker or too many responses are not sent yet
+        writing = connection.out or (connection.pending and not connection.fetching)
+        reading = not connection.busy and len(connection.pending) <= self._max_pending
+        events = (selectors.EVENT_WRITE if writing else 0) | (selectors.EVENT_READ if reading else 0)
+        if events == connection.events:
+            return
+        if connection.events == 0:
+            self._selector.register(connection.sock, events, connection)
+        elif events == 0:
+            self._selector.unregister(connection.sock)
+        else:
+            self._selector.modify(connection.sock, events, connection)
+        connection.events = events
+
+    def _close(self, connection):
+        """ Close a connection and accept again if the limit was reached """
+        if connection.events:
+            self._selector.unregister(connection.sock)
+            connection.events = 0
+        del self._connections[connection.sock]
+        connection.sock.close()  # close the connection
+        if not self._accepting and len(self._connections) < self._max_connections:
+            self._selector.register(self.sock, selectors.EVENT_READ)
+            self._accepting = True
+
+    def _drain_wakeup(self):
+        """ Empty the wake-up socket """
+        try:
+            while self._wakeup.recv(1024):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
@@ -4,3 +4,8 @@ Constant definitions
 
 HOST = '127.0.0.1'
 PORT = 50007
+BUFSIZE = 1024  # size of the receive buffers
+CHUNKSIZE = 16384  # bytes per chunk of streamed responses (GET ALL)
+BACKLOG = 1024  # length of the listen queue of the concurrent servers
+MAX_CONNECTIONS = 10000  # open connections per concurrent server (mind the file descriptor limit, see ulimit -n)
+MAX_PENDING = 64  # unsent responses per connection above which a concurrent server stops reading its requests
@@ -0,0 +1,131 @@
+"""
+Framed wire protocol of the phonebook service
+
+Every message is a frame: a header with an opcode (1 byte) and the length of the payload
+(4 bytes, big endian) followed by the payload. Frames can be sent back to back (pipelining),
+the receiver reads them into a reusable buffer.
+
+Requests:
+- GET: payload is the name (utf-8)
+- GET_ALL: no payload
+- PREFIX: payload is a prefix, asks for all entries with names starting with it
+- RANGE: payload is "<start>\0<stop>", asks for the entries from start (inclusive) to stop
+  (exclusive, an empty stop means to the end)
+- PAGE: payload is the maximum number of entries (4 bytes, big endian, 1 to MAX_PAGE) followed
+  by a cursor, asks for the next entries with names after the cursor (empty for the first page)
+
+Responses:
+- NUMBER: payload is the number (4 bytes, big endian)
+- NOT_FOUND: no payload
+- ENTRIES: a chunk of entries in order of names, one "<name>\t<number>\n" line (utf-8) per entry
+- END: ends the ENTRIES frames answering GET_ALL, PREFIX, RANGE or PAGE, the payload is empty
+  or the cursor of the next page (PAGE)
+"""
+
+import struct
+
+import const_cs
+
+GET, GET_ALL, NUMBER, NOT_FOUND, ENTRIES, END, PREFIX, RANGE, PAGE = 1, 2, 3, 4, 5, 6, 7, 8, 9
+OPCODES = (GET, GET_ALL, NUMBER, NOT_FOUND, ENTRIES, END, PREFIX, RANGE, PAGE)
+HEADER = struct.Struct('!BI')
+MAX_PAYLOAD = 1 << 24  # refuse larger frames (protects the receive buffers)
+MAX_PAGE = 10000  # maximum number of entries per page
+
+
+def pack(opcode, payload=b''):
+    """ Encode a frame """
+    return HEADER.pack(opcode, len(payload)) + payload
+
+
+def check(opcode, length):
+    """ Validate a frame header """
+    if opcode not in OPCODES or length > MAX_PAYLOAD:
+        raise ValueError("invalid frame (opcode " + str(opcode) + ", length " + str(length) + ")")
+
+
+def split(buffer):
+    """ Take the complete frames off received data (bytearray), return them as (opcode, payload) tuples """
+    frames = []
+    pos = 0
+    while len(buffer) - pos >= HEADER.size:
+        opcode, length = HEADER.unpack_from(buffer, pos)
+        check(opcode, length)
+        end = pos + HEADER.size + length
+        if end > len(buffer):
+            break  # wait for the rest of the frame
+        frames.append((opcode, bytes(buffer[pos + HEADER.size:end])))
+        pos = end
+    del buffer[:pos]
+    return frames
+
+
+def entries(items, chunk_size=const_cs.CHUNKSIZE, end=b''):
+    """ Stream (name, number) items as ENTRIES frames of about chunk_size bytes, followed by END (with payload end) """
+    chunk = []
+    size = 0
+    for name, number in items:
+        line = (name + "\t" + str(number) + "\n").encode('utf-8')
+        chunk.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield pack(ENTRIES, b''.join(chunk))
+            chunk = []
+            size = 0
+    if chunk:
+        yield pack(ENTRIES, b''.join(chunk))
+    yield pack(END, end)
+
+
+def parse_entries(payload):
+    """ Decode the payload of an ENTRIES frame to (name, number) tuples """
+    for line in bytes(payload).decode('utf-8').splitlines():
+        name, _, number = line.rpartition("\t")
+        yield name, int(number)
+
+
+class FrameReader:
+    """ Reads frames from a blocking socket with recv_into() into a reusable buffer """
+
+    def __init__(self, sock, size=const_cs.BUFSIZE):
+        self.sock = sock
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = 0  # first byte not returned yet
+        self.end = 0  # end of received data
+
+    def _fill(self, needed):
+        """ Receive until the buffer holds needed bytes after start, False at the end of the stream """
+        if self.start == self.end:
+            self.start = self.end = 0  # everything returned, start over at the front
+        if self.start + needed > len(self.buffer):
+            # move the rest of the data to the front, grow the buffer for large frames
+            rest = self.end - self.start
+            if needed > len(self.buffer):
+                self.buffer = bytearray(max(needed, 2 * len(self.buffer)))
+                self.buffer[:rest] = self.view[self.start:self.end]
+                self.view = memoryview(self.buffer)
+            else:
+                self.view[:rest] = self.view[self.start:self.end]
+            self.start, self.end = 0, rest
+        while self.end - self.start < needed:
+            size = self.sock.recv_into(self.view[self.end:])
+            if not size:
+                return False
+            self.end += size
+        return True
+
+    def read(self):
+        """
+        Read the next frame. The payload is a view of the buffer, valid until the next read.
+        :return: (opcode, payload) tuple or None at the end of the stream
+        """
+        if not self._fill(HEADER.size):
+            return None
+        opcode, length = HEADER.unpack_from(self.buffer, self.start)
+        check(opcode, length)
+        if not self._fill(HEADER.size + length):
+            return None
+        payload = self.view[self.start + HEADER.size:self.start + HEADER.size + length]
+        self.start += HEADER.size + length
+        return opcode, payload
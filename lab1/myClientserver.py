@@ -1,65 +1,68 @@
 """
-Client and server using classes
+Client and server using classes (phonebook service, see framing for the protocol)
 """
 
 import logging
 import socket
 
 import const_cs
+import framing
+import phonebook
+from concurrentserver import ConcurrentServer
 from context import lab_logging
 
 lab_logging.setup(stream_level=logging.INFO)  # init loging channels for the lab
 
 # pylint: disable=logging-not-lazy, line-too-long
 
-class Server:
-    """ The server """
+class Server(ConcurrentServer):
+    """ The server (serve() handles one client at a time, serve_concurrent() many) """
     _logger = logging.getLogger("vs2lab.lab1.clientserver.Server")
     _serving = True
-
-    def __init__(self):
+    phoneNmbers = {
+        "mustermann": 71743,
+        "musterfrau": 12345,
+        "lustig": 55467,
+        "traurig": 11987,
+        "müller": 22387,
+        "fischer": 23454
+    }
+
+    def __init__(self, port=const_cs.PORT, backlog=1, store=None):
+        self.store = store if store is not None else phonebook.DictStore(self.phoneNmbers)  # data tier
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)  # prevents errors due to "addresses in use"
-        self.sock.bind((const_cs.HOST, const_cs.PORT))
+        self.sock.bind((const_cs.HOST, port))
         self.sock.settimeout(3)  # time out in order not to block forever
+        self.sock.listen(backlog)  # listen right away, clients connecting before serving wait in the backlog
         self._logger.info("Server bound to socket " + str(self.sock))
 
     def serve(self):
         """ Serve echo """
-
-        phoneNmbers = {
-            "mustermann": 71743,
-            "musterfrau": 12345,
-            "lustig": 55467,
-            "traurig": 11987,
-            "müller": 22387,
-            "fischer": 23454
-        }
-
-
-        self.sock.listen(1)
         while self._serving:  # as long as _serving (checked after connections or socket timeouts)
             try:
                 # pylint: disable=unused-variable
                 (connection, address) = self.sock.accept()  # returns new socket and address of client
-                while True:  # forever
-                    data = connection.recv(1024)  # receive data from client
-                    data = data.decode('utf-8')
-            
-                    if not data:
-                        break  # stop if client stopped
-
-                    if data == "1":
-                        self._logger.info("GET ALL called")
-                        byte_data = str(phoneNmbers).encode("utf-8") #send all numbers dictionary
-
-                    else:
-                        self._logger.info("GET called")
-                        normalized_data = data.lower() #make input to lower 
-                        byte_data = phoneNmbers[normalized_data].to_bytes(4, byteorder='big') #request data and prepare for send
-                        
-                    connection.send(byte_data)  # return send number for name in data
-                    self._logger.info("Data sent")
+                connection.settimeout(3)  # time out idle clients, they would block the server forever
+                reader = framing.FrameReader(connection)  # receive frames into a reusable buffer
+                try:
+                    while True:  # forever
+                        frame = reader.read()  # receive next request from client
+
+                        if frame is None:
+                            break  # stop if client stopped
+
+                        response = self.handle(frame)
+                        if isinstance(response, bytes):
+                            connection.sendall(response)  # return number for name in frame
+                        else:
+                            for chunk in response:
+                                connection.sendall(chunk)  # stream all numbers chunk by chunk
+                        self._logger.info("Data sent")
+                except ValueError as e:
+                    self._logger.warning("Invalid request: " + str(e))  # drop the client
+                except socket.timeout:
+                    self._logger.warning("Client timed out")  # treat as closed connection
 
                 connection.close()  # close the connection
             except socket.timeout:
@@ -67,34 +70,84 @@ class Server:
         self.sock.close()
         self._logger.info("Server down.")
 
+    def split(self, buffer):
+        """ Take the complete request frames off received data (concurrent mode) """
+        return framing.split(buffer)
+
+    def handle(self, request):
+        """ Answer a request frame from the store (lists of entries are streamed as ENTRIES frames) """
+        self._logger.info("Request " + str(request[0]) + " called")
+        return phonebook.answer(self.store, request)
+
 
 class Client:
     """ The client """
     logger = logging.getLogger("vs2lab.a1_layers.clientserver.Client")
 
-    def __init__(self):
+    def __init__(self, port=const_cs.PORT):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.sock.connect((const_cs.HOST, const_cs.PORT))
+        self.sock.connect((const_cs.HOST, port))
+        self.reader = framing.FrameReader(self.sock)  # receive frames into a reusable buffer
         self.logger.info("Client connected to socket " + str(self.sock))
 
+    def _response(self):
+        """ Receive the next response frame """
+        frame = self.reader.read()
+        if frame is None:
+            raise ConnectionError("connection closed by server")
+        return frame
+
     def call_search(self, msg_in):
-        """ Search for name- call server """
+        """ Search for name- call server (None if the name is unknown) """
         self.logger.info("GET called")
-        self.sock.send(msg_in.encode('utf-8'))  # send encoded string
+        self.sock.sendall(framing.pack(framing.GET, msg_in.encode('utf-8')))  # send GET frame with encoded name
 
-        data = self.sock.recv(1024)  # receive the response
-        msg_out = int.from_bytes(data, byteorder='big')
+        opcode, payload = self._response()  # receive the response
+        msg_out = int.from_bytes(payload, byteorder='big') if opcode == framing.NUMBER else None
         print("Number for " + msg_in + ": ")  # print the result
         print(msg_out)
         return msg_out
 
-    def call_all(self, msg_in="1"):
-        """ get all numbers- call server """
-        self.logger.info("GET ALL called")
-        self.sock.send(msg_in.encode('utf-8'))  # send a 1 as sign for all 
+    def _entries(self, opcode, payload=b''):
+        """ Send a request answered with entries, yield (name, number) tuples as the chunks arrive """
+        self.sock.sendall(framing.pack(opcode, payload))  # send request frame
 
-        data = self.sock.recv(1024)  # receive the response
-        msg_out = data.decode('utf-8')
+        while True:
+            opcode, payload = self._response()  # receive the next chunk
+            if opcode == framing.END:
+                return
+            yield from framing.parse_entries(payload)
+
+    def call_entries(self):
+        """ Get all numbers- call server, yields (name, number) tuples as the chunks arrive """
+        self.logger.info("GET ALL called")
+        return self._entries(framing.GET_ALL)
+
+    def call_prefix(self, prefix):
+        """ Get the entries with names starting with prefix """
+        self.logger.info("PREFIX called")
+        return list(self._entries(framing.PREFIX, prefix.encode('utf-8')))
+
+    def call_range(self, start, stop=""):
+        """ Get the entries with names from start to stop (exclusive, empty for all following names) """
+        self.logger.info("RANGE called")
+        return list(self._entries(framing.RANGE, (start + "\0" + stop).encode('utf-8')))
+
+    def call_page(self, cursor="", limit=100):
+        """ Get the next page of entries after cursor, returns the entries and the next cursor (None after the last page) """
+        self.logger.info("PAGE called")
+        self.sock.sendall(framing.pack(framing.PAGE, phonebook.PAGE.pack(limit) + cursor.encode('utf-8')))
+
+        entries = []
+        while True:
+            opcode, payload = self._response()  # receive the next chunk
+            if opcode == framing.END:
+                return entries, bytes(payload).decode('utf-8') or None
+            entries.extend(framing.parse_entries(payload))
+
+    def call_all(self):
+        """ get all numbers- call server """
+        msg_out = str(dict(self.call_entries()))
         print(msg_out)  # print the result
         return msg_out
 
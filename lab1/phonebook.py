@@ -0,0 +1,196 @@
+"""
+Phonebook stores (data tier of the phonebook service)
+
+A store maps names (lower case) to numbers and keeps the names sorted, so besides exact lookups
+it answers prefix and range queries and returns the phonebook page by page:
+
+- DictStore: in-memory dictionary (plus a sorted list of the names)
+- IndexedStore: memory-mapped index file, see build() for the layout. Opening it does not read
+  the entries, lookups are binary searches on the mapped pages (O(log n)).
+
+answer() implements the phonebook requests of the framed protocol (see framing) on a store.
+"""
+
+import bisect
+import itertools
+import mmap
+import os
+import struct
+
+import framing
+
+MAGIC = b'VSPB'
+HEADER = struct.Struct('!4sQ')  # magic, number of entries
+OFFSET = struct.Struct('!Q')  # offset of an entry
+ENTRY = struct.Struct('!HI')  # length of the name, number (followed by the name)
+PAGE = struct.Struct('!I')  # maximum number of entries of a page request (followed by the cursor)
+MAX_NUMBER = (1 << 32) - 1  # numbers are sent as 4 bytes
+
+
+def check_number(name, number):
+    """ Validate the number of an entry """
+    if not 0 <= number <= MAX_NUMBER:
+        raise ValueError("number of " + name + " out of range: " + str(number))
+
+
+def check_name(name):
+    """ Validate the name of an entry (ENTRIES frames send one entry per line) """
+    if "".join(name.splitlines()) != name:
+        raise ValueError("name contains a line break: " + repr(name))
+
+
+class Store:
+    """ Base class of the stores, the entries are sorted by name """
+
+    def get(self, name):
+        """ Return the number of a name or None """
+        raise NotImplementedError
+
+    def items(self, start=None, stop=None):
+        """ Iterate (name, number) entries in order of names, from start (inclusive) to stop (exclusive) """
+        raise NotImplementedError
+
+    def prefix(self, prefix):
+        """ Iterate the entries with names starting with prefix """
+        return itertools.takewhile(lambda item: item[0].startswith(prefix), self.items(prefix))
+
+    def page(self, after, limit):
+        """ Return up to limit entries with names after the cursor (a name, '' for the first page) """
+        items = self.items(after)
+        first = next(items, None)
+        if first is None:
+            return []
+        if first[0] != after:
+            items = itertools.chain([first], items)
+        return list(itertools.islice(items, limit))
+
+
+class DictStore(Store):
+    """ Store keeping the phonebook in a dictionary """
+
+    def __init__(self, entries):
+        self.entries = {name.lower(): number for name, number in dict(entries).items()}
+        for name, number in self.entries.items():
+            check_name(name)
+            check_number(name, number)
+        self.names = sorted(self.entries)
+
+    def __len__(self):
+        return len(self.names)
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def items(self, start=None, stop=None):
+        first = 0 if start is None else bisect.bisect_left(self.names, start)
+        last = len(self.names) if stop is None else bisect.bisect_left(self.names, stop)
+        for name in self.names[first:last]:
+            yield name, self.entries[name]
+
+
+class IndexedStore(Store):
+    """ Store reading a memory-mapped index file (see build()) """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise ValueError(path + " is not a phonebook index")
+
+    @staticmethod
+    def build(path, entries):
+        """
+        Write an index file for (name, number) entries. Layout: HEADER, one OFFSET per entry
+        (sorted by name), the entries (ENTRY followed by the utf-8 name). The file is replaced atomically.
+        """
+        encoded = sorted((name.lower().encode('utf-8'), number) for name, number in entries)
+        for name, number in encoded:
+            check_name(name.decode('utf-8'))
+            check_number(name.decode('utf-8'), number)
+        tmp = path + '.' + str(os.getpid()) + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, len(encoded)))
+            offset = HEADER.size + OFFSET.size * len(encoded)
+            offsets = bytearray(OFFSET.size * len(encoded))
+            for i, (name, _) in enumerate(encoded):
+                OFFSET.pack_into(offsets, OFFSET.size * i, offset)
+                offset += ENTRY.size + len(name)
+            f.write(offsets)
+            for name, number in encoded:
+                f.write(ENTRY.pack(len(name), number))
+                f.write(name)
+        os.replace(tmp, path)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        """ Unmap the index file """
+        self.map.close()
+
+    def _entry(self, i):
+        """ Return name (bytes) and number of the i-th entry """
+        (offset,) = OFFSET.unpack_from(self.map, HEADER.size + OFFSET.size * i)
+        length, number = ENTRY.unpack_from(self.map, offset)
+        start = offset + ENTRY.size
+        return self.map[start:start + length], number
+
+    def _lower_bound(self, name):
+        """ Index of the first entry with a name not less than name (bytes) """
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._entry(middle)[0] < name:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def get(self, name):
+        name = name.encode('utf-8')
+        i = self._lower_bound(name)
+        if i < self.count:
+            found, number = self._entry(i)
+            if found == name:
+                return number
+        return None
+
+    def items(self, start=None, stop=None):
+        i = 0 if start is None else self._lower_bound(start.encode('utf-8'))
+        stop = None if stop is None else stop.encode('utf-8')
+        while i < self.count:
+            name, number = self._entry(i)
+            if stop is not None and name >= stop:
+                return
+            yield name.decode('utf-8'), number
+            i += 1
+
+
+def answer(store, request):
+    """ Answer a request frame, returns the response frame or an iterator of frames """
+    opcode, payload = request
+    payload = bytes(payload)
+    if opcode == framing.GET:
+        number = store.get(payload.decode('utf-8').lower())
+        if number is None:
+            return framing.pack(framing.NOT_FOUND)
+        return framing.pack(framing.NUMBER, number.to_bytes(4, byteorder='big'))
+    if opcode == framing.GET_ALL:
+        return framing.entries(store.items())
+    if opcode == framing.PREFIX:
+        return framing.entries(store.prefix(payload.decode('utf-8').lower()))
+    if opcode == framing.RANGE:
+        start, _, stop = payload.decode('utf-8').lower().partition("\0")
+        return framing.entries(store.items(start, stop or None))
+    if opcode == framing.PAGE:
+        if len(payload) < PAGE.size:
+            raise ValueError("page request too short (" + str(len(payload)) + " bytes)")
+        limit = min(PAGE.unpack_from(payload)[0], framing.MAX_PAGE)
+        if limit == 0:
+            raise ValueError("page request without entries")  # the END frame could not carry a cursor
+        entries = store.page(payload[PAGE.size:].decode('utf-8').lower(), limit)
+        # the END frame carries the cursor of the next page (empty after the last page)
+        cursor = entries[-1][0].encode('utf-8') if entries and len(entries) == limit else b''
+        return framing.entries(entries, end=cursor)
+    raise ValueError("unexpected request " + str(opcode))
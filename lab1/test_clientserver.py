@@ -3,10 +3,13 @@ Simple client server unit test
 """
 
 import logging
+import socket
 import threading
+import time
 import unittest
 
 import clientserver
+import const_cs
 from context import lab_logging
 
 lab_logging.setup(stream_level=logging.INFO)
@@ -39,5 +42,128 @@ class TestEchoService(unittest.TestCase):
         cls._server_thread.join()  # wait for server thread to terminate
 
 
+class TestConcurrentEchoService(unittest.TestCase):
+    """Test the concurrent serving mode"""
+    _server = clientserver.Server(port=const_cs.PORT + 1, backlog=const_cs.BACKLOG)
+    _server_thread = threading.Thread(target=_server.serve_concurrent)
+
+    @classmethod
+    def setUpClass(cls):
+        cls._server_thread.start()
+
+    def test_srv_get(self):
+        """Test simple call"""
+        msg = clientserver.Client(port=const_cs.PORT + 1).call("Hello VS2Lab")
+        self.assertEqual(msg, 'Hello VS2Lab*')
+
+    def test_concurrent_clients(self):
+        """Test many clients connected at the same time"""
+        clients = [clientserver.Client(port=const_cs.PORT + 1) for _ in range(200)]
+        for i, client in enumerate(clients):  # the later clients are served while the first ones stay connected
+            client.sock.send(str(i).encode('ascii'))
+        for i, client in enumerate(reversed(clients)):
+            self.assertEqual(client.sock.recv(1024).decode('ascii'), str(len(clients) - 1 - i) + '*')
+        for client in clients:
+            client.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server._serving = False  # pylint: disable=protected-access
+        cls._server_thread.join()
+
+
+class TestLimitedEchoService(unittest.TestCase):
+    """Test the worker pool and the connection limit of the concurrent serving mode"""
+    _server = clientserver.Server(port=const_cs.PORT + 2, backlog=const_cs.BACKLOG)
+    _server_thread = threading.Thread(target=_server.serve_concurrent, kwargs={'workers': 4, 'max_connections': 2})
+
+    @classmethod
+    def setUpClass(cls):
+        cls._server_thread.start()
+
+    def test_connection_limit(self):
+        """Test that a client beyond the limit waits for a free connection"""
+        first, second = clientserver.Client(port=const_cs.PORT + 2), clientserver.Client(port=const_cs.PORT + 2)
+        self.assertEqual(first.call("1"), '1*')  # served and closed
+        second.sock.send(b'2')
+        self.assertEqual(second.sock.recv(1024), b'2*')
+        third, fourth = clientserver.Client(port=const_cs.PORT + 2), clientserver.Client(port=const_cs.PORT + 2)
+        third.sock.send(b'3')
+        self.assertEqual(third.sock.recv(1024), b'3*')
+        fourth.sock.send(b'4')  # connected in the backlog, not accepted yet
+        fourth.sock.settimeout(0.5)
+        self.assertRaises(socket.timeout, fourth.sock.recv, 1024)
+        second.close()  # frees a connection
+        fourth.sock.settimeout(5)
+        self.assertEqual(fourth.sock.recv(1024), b'4*')
+        third.close()
+        fourth.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server._serving = False  # pylint: disable=protected-access
+        cls._server_thread.join()
+
+
+class StreamingServer(clientserver.Server):
+    """ Echo server streaming large responses, recording the threads that produce the chunks """
+
+    def __init__(self, port):
+        super().__init__(port=port, backlog=const_cs.BACKLOG)
+        self.handled = 0
+        self.threads = set()
+
+    def handle(self, data):
+        self.handled += 1
+        return self.chunks(data)
+
+    def chunks(self, data):
+        for _ in range(16):
+            self.threads.add(threading.current_thread().name)
+            yield data * const_cs.CHUNKSIZE
+
+
+class TestStreamingEchoService(unittest.TestCase):
+    """Test streamed responses and backpressure of the concurrent serving mode with a worker pool"""
+    _server = StreamingServer(port=const_cs.PORT + 7)
+    _server_thread = threading.Thread(target=_server.serve_concurrent, kwargs={'workers': 2, 'max_pending': 2},
+                                      name='selector')
+
+    @classmethod
+    def setUpClass(cls):
+        cls._server_thread.start()
+
+    def receive(self, client, size):
+        data = bytearray()
+        while len(data) < size:
+            data += client.sock.recv(size - len(data))
+        return data
+
+    def test_chunks_produced_by_workers(self):
+        """Test that the selector thread does not run the response generators"""
+        client = clientserver.Client(port=const_cs.PORT + 7)
+        client.sock.send(b'x')
+        self.assertEqual(self.receive(client, 16 * const_cs.CHUNKSIZE), b'x' * 16 * const_cs.CHUNKSIZE)
+        client.close()
+        self.assertNotIn('selector', self._server.threads)
+
+    def test_backpressure(self):
+        """Test that requests of a client not taking its responses are not read"""
+        client = clientserver.Client(port=const_cs.PORT + 7)
+        handled = self._server.handled
+        for _ in range(20):
+            client.sock.send(b'y' * 16)  # responses of 4 MB, more than the socket buffers take
+            time.sleep(0.01)
+        time.sleep(0.5)
+        self.assertLessEqual(self._server.handled - handled, 6)  # max_pending and the responses in the buffers
+        self.assertEqual(self.receive(client, 256 * const_cs.CHUNKSIZE), b'y' * 256 * const_cs.CHUNKSIZE)
+        client.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server._serving = False  # pylint: disable=protected-access
+        cls._server_thread.join()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,11 +2,17 @@
 Simple client server unit test
 """
 
+import asyncio
 import logging
 import threading
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 
+import asyncClientserver
+import const_cs
+import framing
 import myClientserver
+import phonebook
 from context import lab_logging
 
 lab_logging.setup(stream_level=logging.INFO)
@@ -14,7 +20,7 @@ lab_logging.setup(stream_level=logging.INFO)
 
 class TestEchoService(unittest.TestCase):
     """The test"""
-    _server = myClientserver.Server()  # create single server in class variable
+    _server = myClientserver.Server(port=const_cs.PORT + 3)  # create single server in class variable (own port, see test_clientserver)
     _server_thread = threading.Thread(target=_server.serve)  # define thread for running server
 
     @classmethod
@@ -23,7 +29,7 @@ class TestEchoService(unittest.TestCase):
 
     def setUp(self):
         super().setUp()
-        self.client = myClientserver.Client()  # create new client for each test
+        self.client = myClientserver.Client(port=const_cs.PORT + 3)  # create new client for each test
 
     def test_srv_get_mustermann(self):
         msg = self.client.call_search("mustermann")
@@ -35,7 +41,32 @@ class TestEchoService(unittest.TestCase):
 
     def test_srv_get_all(self):
         msg = self.client.call_all()
-        self.assertEqual(msg, "{'mustermann': 71743, 'musterfrau': 12345, 'lustig': 55467, 'traurig': 11987, 'müller': 22387, 'fischer': 23454}")
+        self.assertEqual(msg, "{'fischer': 23454, 'lustig': 55467, 'musterfrau': 12345, 'mustermann': 71743, 'müller': 22387, 'traurig': 11987}")
+
+    def test_srv_get_all_large(self):
+        """Test a GET ALL streamed in many chunks"""
+        entries = {"name" + str(i): i for i in range(5000)}
+        store, self._server.store = self._server.store, phonebook.DictStore(entries)
+        try:
+            self.assertEqual(dict(self.client.call_entries()), entries)
+            self.assertEqual(self.client.call_search("Name42"), 42)
+        finally:
+            self._server.store = store
+
+    def test_srv_invalid_request(self):
+        """Test that a malformed request drops the client, not the server"""
+        self.client.sock.sendall(framing.pack(framing.PAGE, b'\0'))  # page request without limit
+        self.assertRaises(ConnectionError, self.client._response)  # pylint: disable=protected-access
+        client = myClientserver.Client(port=const_cs.PORT + 3)
+        self.assertEqual(client.call_search("mustermann"), 71743)
+        client.close()
+
+    def test_srv_idle_client(self):
+        """Test that an idle client times out instead of blocking the server"""
+        client = myClientserver.Client(port=const_cs.PORT + 3)  # waits until the idle client is dropped
+        self.assertEqual(client.call_search("mustermann"), 71743)
+        client.close()
+        self.assertRaises(ConnectionError, self.client._response)  # pylint: disable=protected-access
 
     def tearDown(self):
         self.client.close()  # terminate client after each test
@@ -46,5 +77,102 @@ class TestEchoService(unittest.TestCase):
         cls._server_thread.join()  # wait for server thread to terminate
 
 
+class TestConcurrentPhonebookService(unittest.TestCase):
+    """Test the concurrent serving mode with a worker pool"""
+    _server = myClientserver.Server(port=const_cs.PORT + 4, backlog=const_cs.BACKLOG)
+    _server_thread = threading.Thread(target=_server.serve_concurrent, kwargs={'workers': 4})
+
+    @classmethod
+    def setUpClass(cls):
+        cls._server_thread.start()
+
+    def test_concurrent_lookups(self):
+        """Test many clients looking up numbers at the same time"""
+        names = list(myClientserver.Server.phoneNmbers) * 20
+
+        def lookup(name):
+            client = myClientserver.Client(port=const_cs.PORT + 4)
+            try:
+                return client.call_search(name)
+            finally:
+                client.close()
+
+        with ThreadPoolExecutor(32) as executor:
+            numbers = list(executor.map(lookup, names))
+        self.assertEqual(numbers, [myClientserver.Server.phoneNmbers[name] for name in names])
+
+    def test_srv_get_all(self):
+        client = myClientserver.Client(port=const_cs.PORT + 4)
+        msg = client.call_all()
+        client.close()
+        self.assertEqual(msg, str(dict(sorted(myClientserver.Server.phoneNmbers.items()))))
+
+    def test_unknown_name(self):
+        """Test that an unknown name is answered and the connection stays usable"""
+        client = myClientserver.Client(port=const_cs.PORT + 4)
+        self.assertIsNone(client.call_search("unbekannt"))
+        self.assertEqual(client.call_search("lustig"), 55467)
+        client.close()
+
+    def test_pipelined_frames(self):
+        """Test requests sent back to back in one segment and a GET ALL larger than the buffers"""
+        server = TestConcurrentPhonebookService._server
+        entries = {"name" + str(i): i for i in range(5000)}
+        store, server.store = server.store, phonebook.DictStore(entries)
+        try:
+            client = myClientserver.Client(port=const_cs.PORT + 4)
+            client.sock.sendall(framing.pack(framing.GET, b"name1") + framing.pack(framing.GET, b"name4999"))
+            self.assertEqual(client.reader.read(), (framing.NUMBER, (1).to_bytes(4, byteorder='big')))
+            self.assertEqual(client.reader.read(), (framing.NUMBER, (4999).to_bytes(4, byteorder='big')))
+            self.assertEqual(dict(client.call_entries()), entries)
+            client.close()
+        finally:
+            server.store = store
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server._serving = False  # pylint: disable=protected-access
+        cls._server_thread.join()
+
+
+class TestAsyncPhonebookService(unittest.IsolatedAsyncioTestCase):
+    """Test the asyncio server and the pipelining client"""
+    _server = asyncClientserver.Server(port=const_cs.PORT + 5)
+    _server_thread = threading.Thread(target=lambda: asyncio.run(TestAsyncPhonebookService._server.serve()))
+
+    @classmethod
+    def setUpClass(cls):
+        cls._server_thread.start()
+
+    async def asyncSetUp(self):
+        self.client = await asyncClientserver.Client.connect(port=const_cs.PORT + 5)
+
+    async def test_srv_get(self):
+        self.assertEqual(await self.client.call_search("FiScher"), 23454)
+        self.assertIsNone(await self.client.call_search("unbekannt"))
+
+    async def test_srv_get_all(self):
+        self.assertEqual(await self.client.call_all(), str(dict(sorted(myClientserver.Server.phoneNmbers.items()))))
+
+    async def test_pipelined_calls(self):
+        """Test concurrent calls sharing the connection"""
+        names = list(myClientserver.Server.phoneNmbers) * 100
+        numbers = await asyncio.gather(*(self.client.call_search(name) for name in names), self.client.call_all())
+        self.assertEqual(numbers[:-1], [myClientserver.Server.phoneNmbers[name] for name in names])
+        self.assertEqual(numbers[-1], str(dict(sorted(myClientserver.Server.phoneNmbers.items()))))
+
+    async def test_call_many(self):
+        result = await self.client.call_many(["lustig", "Traurig", "unbekannt"])
+        self.assertEqual(result, {"lustig": 55467, "Traurig": 11987, "unbekannt": None})
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server._serving = False  # pylint: disable=protected-access
+        cls._server_thread.join()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,164 @@
+"""
+Phonebook store unit test
+"""
+
+import logging
+import os
+import tempfile
+import threading
+import unittest
+
+import const_cs
+import framing
+import myClientserver
+import phonebook
+from context import lab_logging
+
+lab_logging.setup(stream_level=logging.INFO)
+
+ENTRIES = {"name" + str(i): i for i in range(2000)}
+ENTRIES.update(myClientserver.Server.phoneNmbers)
+
+
+class TestDictStore(unittest.TestCase):
+    """Test the queries of the in-memory store"""
+
+    def setUp(self):
+        self.store = self.create()
+
+    def create(self):
+        return phonebook.DictStore(ENTRIES)
+
+    def test_get(self):
+        self.assertEqual(self.store.get("müller"), 22387)
+        self.assertEqual(self.store.get("name1999"), 1999)
+        self.assertIsNone(self.store.get("name2000"))
+        self.assertIsNone(self.store.get(""))
+
+    def test_items(self):
+        self.assertEqual(list(self.store.items()), sorted(ENTRIES.items()))
+        self.assertEqual(len(self.store), len(ENTRIES))
+
+    def test_prefix(self):
+        self.assertEqual(list(self.store.prefix("muster")), [("musterfrau", 12345), ("mustermann", 71743)])
+        self.assertEqual(len(list(self.store.prefix("name1"))), 1111)
+        self.assertEqual(list(self.store.prefix("x")), [])
+
+    def test_range(self):
+        self.assertEqual(list(self.store.items("lustig", "musterfrau")), [("lustig", 55467)])
+        self.assertEqual([name for name, _ in self.store.items("name1998")], [name for name in sorted(ENTRIES) if name >= "name1998"])
+
+    def test_page(self):
+        names, cursor = [], ""
+        while True:
+            page = self.store.page(cursor, 300)
+            if not page:
+                break
+            names.extend(name for name, _ in page)
+            cursor = page[-1][0]
+        self.assertEqual(names, sorted(ENTRIES))
+
+    def test_invalid_request(self):
+        self.assertRaises(ValueError, phonebook.answer, self.store, (framing.PAGE, b'\0'))
+        self.assertRaises(ValueError, phonebook.answer, self.store, (framing.PAGE, phonebook.PAGE.pack(0)))
+        self.assertRaises(ValueError, phonebook.answer, self.store, (framing.NUMBER, b''))
+
+
+class TestNumbers(unittest.TestCase):
+    """Test that the stores only take numbers the protocol can send"""
+
+    def test_number_out_of_range(self):
+        self.assertRaises(ValueError, phonebook.DictStore, {"big": 1 << 32})
+        self.assertRaises(ValueError, phonebook.DictStore, {"negative": -1})
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "phonebook.idx")
+            self.assertRaises(ValueError, phonebook.IndexedStore.build, path, [("big", 1 << 32)])
+            self.assertFalse(os.listdir(directory))
+        self.assertEqual(phonebook.DictStore({"max": phonebook.MAX_NUMBER}).get("max"), phonebook.MAX_NUMBER)
+
+
+class TestNames(unittest.TestCase):
+    """Test that the stores only take names the ENTRIES frames can send"""
+
+    def test_line_break(self):
+        for name in ["new\nline", "return\r", "separator\u2028"]:
+            self.assertRaises(ValueError, phonebook.DictStore, {name: 1})
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "phonebook.idx")
+                self.assertRaises(ValueError, phonebook.IndexedStore.build, path, [(name, 1)])
+                self.assertFalse(os.listdir(directory))
+        self.assertEqual(phonebook.DictStore({"tab\tname": 1}).get("tab\tname"), 1)
+
+
+class TestIndexedStore(TestDictStore):
+    """Test the queries of the memory-mapped store"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._dir = tempfile.TemporaryDirectory()
+        cls._path = os.path.join(cls._dir.name, "phonebook.idx")
+        phonebook.IndexedStore.build(cls._path, ENTRIES.items())
+
+    def create(self):
+        return phonebook.IndexedStore(self._path)
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_empty(self):
+        path = os.path.join(self._dir.name, "empty.idx")
+        phonebook.IndexedStore.build(path, [])
+        store = phonebook.IndexedStore(path)
+        self.assertIsNone(store.get("name"))
+        self.assertEqual(list(store.items()), [])
+        store.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._dir.cleanup()
+
+
+class TestIndexedPhonebookService(unittest.TestCase):
+    """Test the queries of the service on a memory-mapped store"""
+    _dir = tempfile.TemporaryDirectory()
+    phonebook.IndexedStore.build(os.path.join(_dir.name, "phonebook.idx"), ENTRIES.items())
+    _server = myClientserver.Server(port=const_cs.PORT + 6, backlog=const_cs.BACKLOG,
+                                    store=phonebook.IndexedStore(os.path.join(_dir.name, "phonebook.idx")))
+    _server_thread = threading.Thread(target=_server.serve_concurrent, kwargs={'workers': 2})
+
+    @classmethod
+    def setUpClass(cls):
+        cls._server_thread.start()
+
+    def setUp(self):
+        self.client = myClientserver.Client(port=const_cs.PORT + 6)
+
+    def test_srv_get(self):
+        self.assertEqual(self.client.call_search("Fischer"), 23454)
+        self.assertIsNone(self.client.call_search("unbekannt"))
+
+    def test_srv_prefix_range(self):
+        self.assertEqual(self.client.call_prefix("MUSTER"), [("musterfrau", 12345), ("mustermann", 71743)])
+        self.assertEqual(self.client.call_range("lustig", "musterfrau"), [("lustig", 55467)])
+        self.assertEqual(self.client.call_range("traurig"), [("traurig", 11987)])
+
+    def test_srv_pages(self):
+        names, cursor = [], ""
+        while cursor is not None:
+            entries, cursor = self.client.call_page(cursor, 700)
+            names.extend(name for name, _ in entries)
+        self.assertEqual(names, sorted(ENTRIES))
+
+    def tearDown(self):
+        self.client.close()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server._serving = False  # pylint: disable=protected-access
+        cls._server_thread.join()
+        cls._server.store.close()
+        cls._dir.cleanup()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -7,6 +7,7 @@ class Server:
         self.ci = lab_channel.Channel()
         self.server = self.ci.join('server')
         self.timeout = 3
+        self.batch = 100
 
         # create instance logger
         self.logger = logging.getLogger('vs2lab.lab2.channel.Server')
@@ -15,8 +16,9 @@ class Server:
     def run(self):
         self.ci.bind(self.server)
         while True:
-            message = self.ci.receive_from_any(self.timeout)
-            if message is not None:
+            # take all queued requests (up to a batch) in one go
+            messages = self.ci.receive_many(max_count=self.batch, timeout=self.timeout)
+            for message in messages:
                 try:
                     self.ci.send_to({message[0]}, 'Received ' + message[1])
                 except AssertionError:
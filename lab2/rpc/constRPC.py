@@ -1,2 +1,12 @@
 OK = '1'
 APPEND = '2'
+ACK = '3'
+RESULT = '4'
+CANCEL = '5'
+ERROR = '6'
+CREATE = '7'
+LIST_APPEND = '8'
+EXTEND = '9'
+SLICE = '10'
+LENGTH = '11'
+DROP = '12'
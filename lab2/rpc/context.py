@@ -20,4 +20,4 @@ def add_parent_path(steps_up=1):
 add_parent_path(2)
 
 # following imports are used by other modules to access shared packages
-from lib import lab_logging, lab_channel
+from lib import lab_logging, lab_channel, lab_wire
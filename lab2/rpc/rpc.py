@@ -1,10 +1,15 @@
+import asyncio
+import concurrent.futures
+import heapq
+import itertools
+import logging
 import threading
 import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
 import constRPC
-import threading
-import time
 
-from context import lab_channel
+from context import lab_channel, lab_wire
 
 
 class DBList:
@@ -12,45 +17,247 @@ class DBList:
         self.value = list(basic_list)
 
     def append(self, data):
-        self.value = self.value + [data]
+        self.value.append(data)
         return self
 
 
+class RemoteError(Exception):
+    """
+    A call failed on the server.
+    """
+
+
+class ListStore:
+    """
+    Server-resident lists addressed by handles (see RemoteList). The operations take and return
+    deltas only: an append ships one item and returns the new length, a slice returns the items
+    asked for. The server applies them in its receive loop, one at a time and in the order the
+    requests of a client arrive, so they need no locks.
+    """
+
+    OPERATIONS = {constRPC.CREATE: 'create', constRPC.LIST_APPEND: 'append', constRPC.EXTEND: 'extend',
+                  constRPC.SLICE: 'slice', constRPC.LENGTH: 'length', constRPC.DROP: 'drop'}
+
+    def __init__(self):
+        self.lists = {}
+
+    def apply(self, call):
+        """
+        Apply an operation.
+        :param call: tuple of operation and parameters
+        :return: result of the operation
+        """
+        return getattr(self, self.OPERATIONS[call[0]])(*call[1:])
+
+    def create(self, handle, items):
+        self.lists[handle] = list(items)
+        return len(self.lists[handle])
+
+    def append(self, handle, item):
+        self.lists[handle].append(item)
+        return len(self.lists[handle])
+
+    def extend(self, handle, items):
+        self.lists[handle].extend(items)
+        return len(self.lists[handle])
+
+    def slice(self, handle, start, stop):
+        return self.lists[handle][start:stop]
+
+    def length(self, handle):
+        return len(self.lists[handle])
+
+    def drop(self, handle):
+        del self.lists[handle]
+
+
+class RemoteList:
+    """
+    Client-side proxy of a server-resident list. Every operation is an asynchronous call
+    returning a future (see Client.call). Calls of one client are applied in order, so the
+    operations can be issued without waiting for each other.
+    """
+
+    def __init__(self, client, handle):
+        self.client = client
+        self.handle = handle
+
+    def append(self, item, timeout=None):
+        """
+        :return: future of the new length
+        """
+        return self.client.call((constRPC.LIST_APPEND, self.handle, item), timeout)
+
+    def extend(self, items, timeout=None):
+        """
+        Append many items with one call.
+        :return: future of the new length
+        """
+        return self.client.call((constRPC.EXTEND, self.handle, list(items)), timeout)
+
+    def slice(self, start=None, stop=None, timeout=None):
+        """
+        :return: future of the items list[start:stop]
+        """
+        return self.client.call((constRPC.SLICE, self.handle, start, stop), timeout)
+
+    def length(self, timeout=None):
+        """
+        :return: future of the length
+        """
+        return self.client.call((constRPC.LENGTH, self.handle), timeout)
+
+    def drop(self, timeout=None):
+        """
+        Delete the list on the server.
+        """
+        return self.client.call((constRPC.DROP, self.handle), timeout)
+
+
+def execute(call, delay):
+    """
+    Execute a call in a worker (thread or process, see Server).
+    :param call: tuple of operation and parameters
+    :param delay: seconds of simulated work before the call is executed
+    :return: result of the call
+    """
+    time.sleep(delay)
+    if constRPC.APPEND == call[0]:  # check what is being requested
+        return Server.append(call[1], call[2])  # do local call
+    raise ValueError('unsupported request {}'.format(call[0]))
+
+
 class Client:
+    """
+    Every request carries an id that is unique for the client, ACK, RESULT and ERROR messages of
+    the server carry the id of their request. A single receiver thread (see WaitForResult) takes all
+    replies off the channel and resolves the future of a request by its id, so the client can have
+    many outstanding calls with a constant number of threads.
+
+    Calls return a concurrent.futures.Future (append) or an awaitable asyncio future (append_async).
+    A call fails with TimeoutError if its result does not arrive in time and with RemoteError if it
+    failed on the server. Cancelling the future of a call (or a timeout) tells the server to drop
+    the call unless it has already started.
+    """
+
     def __init__(self):
         self.chan = lab_channel.Channel()
         self.client = self.chan.join('client')
         self.server = None
+        self.ids = itertools.count(1)  # request ids
+        self.pending = {}  # futures of outstanding calls by request id
+        self.receiver = None
+        self.logger = logging.getLogger('vs2lab.lab2.rpc.Client')
 
     def run(self):
         self.chan.bind(self.client)
         self.server = self.chan.subgroup('server')
+        self.receiver = WaitForResult(self.chan, self.server, self.pending)
+        self.receiver.start()
 
     def stop(self):
+        self.receiver.stop()
         self.chan.leave('client')
 
-    def append(self, data, db_list, callback):
+    def call(self, msg, timeout=None):
+        """
+        Send a request.
+        :param msg: tuple of operation and parameters
+        :param timeout: seconds to wait for the result (None waits forever)
+        :return: future of the result
+        """
+        request_id = next(self.ids)
+        future = Future()
+        self.pending[request_id] = future
+        if timeout is not None:
+            self.receiver.expire(request_id, time.monotonic() + timeout)
+        future.add_done_callback(lambda done: self.cancel(request_id, done) if done.cancelled() else None)
+        self.chan.send_to(self.server, (msg[0], request_id) + tuple(msg[1:]))  # send msg to server
+        self.logger.info("Request %s sent", request_id)
+        return future
+
+    def cancel(self, request_id, future):
+        """
+        Forget a cancelled request and ask the server to drop it.
+        """
+        self.pending.pop(request_id, None)
+        WaitForResult.claim(future)  # notify waiters (concurrent.futures.wait, as_completed)
+        self.chan.send_to(self.server, (constRPC.CANCEL, request_id))
+
+    def append(self, data, db_list, callback=None, timeout=None):
+        """
+        Call append asynchronously.
+        :param callback: optional function called with the result (in the receiver thread)
+        :param timeout: seconds to wait for the result (None waits forever)
+        :return: future of the result
+        """
         assert isinstance(db_list, DBList)
-        msglst = (constRPC.APPEND, data, db_list)  # message payload
-        self.chan.send_to(self.server, msglst)  # send msg to server
-        print("Message gesendet")
-        ackrcv = self.chan.receive_from(self.server)  # wait for response (ACK)
-        if ackrcv[1] == 'ACK':
-            print("Ack erhalten")
-            background = WaitForResult(self.chan, self.server, callback)
-            background.start()
-            
-        else:
-            print("kein ACK erhalten")
-           
+        future = self.call((constRPC.APPEND, data, db_list), timeout)
+        if callback is not None:
+            future.add_done_callback(
+                lambda done: callback(done.result()) if not done.cancelled() and done.exception() is None else None)
+        return future
 
+    def create_list(self, basic_list=(), name=None):
+        """
+        Create a list on the server (see ListStore), the initial items are shipped once.
+        :param name: handle of the list, other clients can address it by name (default: a handle unique for the client)
+        :return: RemoteList proxy, usable right away
+        """
+        handle = name if name is not None else '{}:{}'.format(self.client, next(self.ids))
+        self.call((constRPC.CREATE, handle, list(basic_list)))
+        return RemoteList(self, handle)
+
+    def append_async(self, data, db_list, timeout=None):
+        """
+        Call append from a coroutine.
+        :return: asyncio future of the result (of the running event loop)
+        """
+        return asyncio.wrap_future(self.append(data, db_list, timeout=timeout))
+
+    @staticmethod
+    def gather(futures, timeout=None, return_exceptions=False):
+        """
+        Wait for the results of many calls.
+        :param futures: futures of the calls
+        :param timeout: seconds to wait for all results (None waits forever)
+        :param return_exceptions: return exceptions of failed calls as results instead of raising the first one
+        :return: list of results in order of the futures
+        """
+        futures = list(futures)
+        done, not_done = concurrent.futures.wait(futures, timeout)
+        if not_done:
+            raise TimeoutError('{} of {} calls did not finish in time'.format(len(not_done), len(futures)))
+        results = []
+        for future in futures:
+            if future.cancelled():
+                error = concurrent.futures.CancelledError()
+            else:
+                error = future.exception()
+            if error is not None and not return_exceptions:
+                raise error
+            results.append(error if error is not None else future.result())
+        return results
 
 
 class Server:
-    def __init__(self):
+    """
+    The server acknowledges every request right away and executes it in a pool of worker threads
+    ('thread' mode) or processes ('process' mode, for CPU bound calls). Replies are sent as soon
+    as the calls are done, in any order, and carry the id of their request.
+    """
+
+    def __init__(self, workers=4, mode='thread', delay=10):
+        assert mode in ('thread', 'process'), 'unknown worker mode'
         self.chan = lab_channel.Channel()
         self.server = self.chan.join('server')
         self.timeout = 3
+        self.workers = workers
+        self.mode = mode
+        self.delay = delay  # simulated duration of a call in seconds
+        self.calls = {}  # futures of submitted calls by (client, request id)
+        self.store = ListStore()  # server-resident lists
+        self.logger = logging.getLogger('vs2lab.lab2.rpc.Server')
 
     @staticmethod
     def append(data, db_list):
@@ -59,30 +266,132 @@ class Server:
 
     def run(self):
         self.chan.bind(self.server)
-        while True:
-            msgreq = self.chan.receive_from_any(self.timeout)  # wait for any request
-            if msgreq is not None:
-                client = msgreq[0]  # see who is the caller
-                self.chan.send_to({client},"ACK")  # return ACK
-                time.sleep(10)
-                
-                msgrpc = msgreq[1]  # fetch call & parameters
-                
-                if constRPC.APPEND == msgrpc[0]:  # check what is being requested
-                    result = self.append(msgrpc[1], msgrpc[2])  # do local call
-                    self.chan.send_to({client}, result)  # return response
-                else:
-                    pass  # unsupported request, simply ignore
+        pool_class = ThreadPoolExecutor if self.mode == 'thread' else ProcessPoolExecutor
+        with pool_class(self.workers) as pool:
+            while True:
+                msgreq = self.chan.receive_from_any(self.timeout)  # wait for any request
+                if msgreq is not None:
+                    client = msgreq[0]  # see who is the caller
+                    msgrpc = msgreq[1]  # fetch call & parameters
+                    request_id = msgrpc[1]
+                    if constRPC.CANCEL == msgrpc[0]:
+                        future = self.calls.pop((client, request_id), None)
+                        if future is not None and future.cancel():  # only possible until a worker takes it
+                            self.logger.info("Request %s of %s cancelled", request_id, client)
+                        continue
+                    call = (msgrpc[0],) + tuple(msgrpc[2:])
+                    if msgrpc[0] in ListStore.OPERATIONS:
+                        # list store operations are cheap, answer them right away (no ACK)
+                        future = Future()
+                        try:
+                            future.set_result(self.store.apply(call))
+                        except Exception as e:  # pylint: disable=broad-except
+                            future.set_exception(e)
+                        self.reply(client, request_id, future)
+                        continue
+                    self.chan.send_to({client}, (constRPC.ACK, request_id))  # return ACK
+
+                    future = pool.submit(execute, call, self.delay)  # execute call in a worker
+                    self.calls[(client, request_id)] = future
+                    future.add_done_callback(
+                        lambda done, client=client, request_id=request_id: self.reply(client, request_id, done))
+
+    def reply(self, client, request_id, done):
+        """
+        Send the result of a finished call (called in a thread of the server process).
+        """
+        self.calls.pop((client, request_id), None)
+        if done.cancelled():
+            return
+        if done.exception() is not None:
+            error = done.exception()
+            self.logger.warning("Request %s of %s failed: %r", request_id, client, error)
+            reply = (constRPC.ERROR, request_id, '{}: {}'.format(type(error).__name__, error))
+        else:
+            reply = (constRPC.RESULT, request_id, done.result())
+        try:
+            self.chan.send_to({client}, reply)  # return response
+        except AssertionError:
+            self.logger.warning('Client %s has already left the channel.', client)
 
 
 class WaitForResult(threading.Thread):
-    def __init__(self,chan, server, callback):
-        threading.Thread.__init__(self)
-        self.server= server
-        self.callback = callback 
+    """
+    Receiver thread of a client: takes the replies of the server off the channel and resolves
+    the future of a request with its result (running its callbacks). Fails the futures of
+    requests whose deadline passed.
+    """
+
+    def __init__(self, chan, server, pending):
+        threading.Thread.__init__(self, daemon=True)
+        self.server = server
+        self.pending = pending  # futures by request id
         self.chan = chan            # Kanal, um Ergebnis zu empfangen
+        self.running = True
+        self.timeout = 1  # seconds between checks of the running flag
+        self.deadlines = []  # heap of (deadline, request id)
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('vs2lab.lab2.rpc.WaitForResult')
+
+    def expire(self, request_id, deadline):
+        """
+        Fail a request with TimeoutError unless its result arrives before the deadline (time.monotonic()).
+        """
+        with self.lock:
+            heapq.heappush(self.deadlines, (deadline, request_id))
+
+    def stop(self):
+        self.running = False
+        self.join()
+        for future in list(self.pending.values()):
+            future.cancel()  # nobody is going to receive the results
 
     def run(self):
-        result_msg = self.chan.receive_from(self.server)
-        self.callback(result_msg[1])
+        while self.running:
+            msg = self.chan.receive_from(self.server, self.__expire_due())
+            if msg is None:
+                continue
+            reply = msg[1]
+            if reply[0] == constRPC.ACK:
+                self.logger.info("Request %s acknowledged", reply[1])
+            elif reply[0] == constRPC.RESULT:
+                future = self.pending.pop(reply[1], None)
+                if future is None:
+                    self.logger.info("Result of cancelled or unknown request %s", reply[1])
+                elif self.claim(future):
+                    future.set_result(reply[2])
+            elif reply[0] == constRPC.ERROR:
+                future = self.pending.pop(reply[1], None)
+                if future is not None and self.claim(future):
+                    future.set_exception(RemoteError(reply[2]))
+
+    @staticmethod
+    def claim(future):
+        """
+        Mark a future as running before its result is set, notify waiters if it was cancelled.
+        :return: False if the future was cancelled
+        """
+        try:
+            return future.set_running_or_notify_cancel()
+        except RuntimeError:
+            return False  # cancelled and notified meanwhile
 
+    def __expire_due(self):
+        """
+        Fail the requests whose deadline passed.
+        :return: seconds until the next deadline (at most self.timeout)
+        """
+        now = time.monotonic()
+        expired = []
+        with self.lock:
+            # also expire requests due within the shortest blocking timeout (shorter ones block forever)
+            while self.deadlines and self.deadlines[0][0] <= now + lab_wire.MIN_TIMEOUT:
+                expired.append(heapq.heappop(self.deadlines)[1])
+            timeout = min(self.deadlines[0][0] - now, self.timeout) if self.deadlines else self.timeout
+        for request_id in expired:
+            future = self.pending.get(request_id)
+            if future is not None and self.claim(future):
+                self.pending.pop(request_id, None)
+                future.set_exception(TimeoutError('request {} timed out'.format(request_id)))
+                self.chan.send_to(self.server, (constRPC.CANCEL, request_id))  # the result is not needed any more
+        return timeout
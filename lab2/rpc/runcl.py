@@ -15,11 +15,25 @@ def result_callback(result):
     print("Ergebnis empfangen: {}".format(result.value))
 
 cl.append('bar', base_list, result_callback)
+cl.append('baz', base_list, result_callback)  # second call outstanding at the same time
 
 for x in range (11):
     print("Client schreibt etwas", x)
     time.sleep(1)
 
 
+# batch of calls: wait for all results (futures)
+futures = [cl.append(data, base_list, timeout=30) for data in ('a', 'b', 'c')]
+for result in cl.gather(futures):
+    print("Ergebnis im Batch: {}".format(result.value))
+
+# list kept on the server: only the changes travel
+remote = cl.create_list(['foo'])
+remote.append('bar')
+remote.extend(['x', 'y', 'z'])
+print("Länge der Liste auf dem Server: {}".format(remote.length().result(timeout=30)))
+print("Anfang der Liste: {}".format(remote.slice(0, 3).result(timeout=30)))
+remote.drop()
+
 #time.sleep(12)
 cl.stop()
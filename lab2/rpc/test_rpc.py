@@ -0,0 +1,80 @@
+"""
+RPC unit test (needs a running redis server, its keys are flushed)
+"""
+
+import concurrent.futures
+import logging
+import multiprocessing
+import time
+import unittest
+
+import rpc
+from context import lab_channel, lab_logging
+
+lab_logging.setup(stream_level=logging.INFO)
+
+DELAY = 0.5  # seconds per call
+
+
+def serve(ready):
+    server = rpc.Server(workers=1, delay=DELAY)
+    ready.set()
+    server.run()
+
+
+class TestRPC(unittest.TestCase):
+    """Test calls of a client to a live server with one worker (in its own process, members are bound to processes)"""
+
+    @classmethod
+    def setUpClass(cls):
+        lab_channel.flushall()
+        ready = multiprocessing.Event()
+        cls._server_process = multiprocessing.Process(target=serve, args=(ready,))
+        cls._server_process.start()
+        ready.wait(10)
+        cls.client = rpc.Client()
+        cls.client.run()
+        # the server receives from the new client after its current receive call timed out
+        cls.client.create_list().length().result(timeout=10)
+
+    def test_gather_keeps_order(self):
+        """Test that gather returns the results in order of the calls"""
+        futures = [self.client.append(data, rpc.DBList({'foo'})) for data in ('a', 'b', 'c')]
+        results = rpc.Client.gather(futures, timeout=10 * DELAY)
+        self.assertEqual([result.value for result in results], [['foo', 'a'], ['foo', 'b'], ['foo', 'c']])
+
+    def test_timeout(self):
+        """Test that a call without result in time fails with TimeoutError"""
+        future = self.client.append('late', rpc.DBList({'foo'}), timeout=0.05)
+        self.assertIsInstance(future.exception(timeout=2), TimeoutError)
+        self.assertRaises(TimeoutError, rpc.Client.gather, [self.client.append('late', rpc.DBList({'foo'}))], 0.05)
+        time.sleep(2 * DELAY)  # let the server finish the calls
+
+    def test_cancel_before_start(self):
+        """Test that the server drops a cancelled call waiting for the worker"""
+        start = time.monotonic()
+        first = self.client.append('first', rpc.DBList({'foo'}))
+        second = self.client.append('second', rpc.DBList({'foo'}))  # waits for the worker
+        self.assertTrue(second.cancel())
+        third = self.client.append('third', rpc.DBList({'foo'}))
+        self.assertEqual(first.result(timeout=10 * DELAY).value, ['foo', 'first'])
+        self.assertEqual(third.result(timeout=10 * DELAY).value, ['foo', 'third'])
+        self.assertLess(time.monotonic() - start, 2.8 * DELAY)  # the second call was not executed
+        self.assertRaises(concurrent.futures.CancelledError, second.result)
+
+    def test_unknown_handle(self):
+        """Test that an operation on a list unknown to the server fails with RemoteError"""
+        future = rpc.RemoteList(self.client, 'unknown').length()
+        self.assertIsInstance(future.exception(timeout=2), rpc.RemoteError)
+        remote_list = self.client.create_list(['x'])
+        self.assertEqual(remote_list.append('y').result(timeout=2), 2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.stop()
+        cls._server_process.terminate()
+        cls._server_process.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -15,10 +15,13 @@ logger.info("Connected.")
 dblist = conn.root
 
 ret = dblist.append(2)  # Call an exposed operation,
-logger.info("Append 2: '{}'".format(str(ret)))
+logger.info("Append 2, length: '{}'".format(str(ret)))
 
 ret = dblist.append(4)  # and append two elements
-logger.info("Append 4: '{}'".format(str(ret)))
+logger.info("Append 4, length: '{}'".format(str(ret)))
 
-ret = dblist.value()  # Print the result
-logger.info("Stored value: '{}'".format(str(ret)))
+ret = dblist.extend(tuple(range(10)))  # many elements with one call
+logger.info("Extend, length: '{}'".format(str(ret)))
+
+ret = dblist.value(0, 4)  # Print part of the result
+logger.info("Stored value (first 4): '{}'".format(str(ret)))
@@ -1,2 +1,4 @@
 SERVER = "127.0.0.1"
 PORT = 12345
+REDIS_HOST = "localhost"
+REDIS_PORT = 6379
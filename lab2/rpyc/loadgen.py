@@ -0,0 +1,94 @@
+"""
+Load generator for the DBList server
+
+Starts the server in each serving mode, runs N concurrent clients (processes, each with its own
+rpyc.connect) making calls as fast as they can and reports calls per second and latencies.
+"""
+
+import argparse
+import multiprocessing
+import statistics
+import subprocess
+import sys
+import time
+
+import constRPYC
+import rpyc
+
+
+def client(port, calls, operation, shared, barrier):
+    """ Make calls and return their latencies (seconds) """
+    conn = rpyc.connect(constRPYC.SERVER, port)
+    dblist = conn.root
+    if shared:
+        dblist.use('loadgen')
+    dblist.extend(tuple(range(10)))
+    call = {'append': lambda i: dblist.append(i),
+            'extend': lambda i: dblist.extend(tuple(range(100))),
+            'value': lambda i: dblist.value(0, 10)}[operation]
+    latencies = []
+    barrier.wait()  # start all clients together
+    for i in range(calls):
+        start = time.perf_counter()
+        call(i)
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+    return latencies
+
+
+def start_server(mode, store, port):
+    """ Start a server process and wait until it accepts connections """
+    command = [sys.executable, 'server.py', '--mode', mode, '--store', store, '--port', str(port)]
+    server = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            rpyc.connect(constRPYC.SERVER, port).close()
+            return server
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("server (mode " + mode + ") did not start")
+
+
+def measure(port, clients, calls, operation, shared):
+    """ Run the clients against a server, return calls per second and all latencies """
+    with multiprocessing.Manager() as manager:
+        barrier = manager.Barrier(clients + 1)
+        with multiprocessing.Pool(clients) as pool:
+            results = pool.starmap_async(client, [(port, calls, operation, shared, barrier)] * clients)
+            barrier.wait()
+            start = time.perf_counter()
+            latencies = [latency for result in results.get() for latency in result]
+            elapsed = time.perf_counter() - start
+    return len(latencies) / elapsed, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the DBList server in its serving modes")
+    parser.add_argument('--modes', nargs='+', default=['thread', 'threadpool', 'fork'])
+    parser.add_argument('--store', choices=['memory', 'redis'], default='redis',
+                        help="store of all modes (memory does not work with fork)")
+    parser.add_argument('--clients', type=int, default=8, help="number of concurrent clients")
+    parser.add_argument('--calls', type=int, default=1000, help="calls per client")
+    parser.add_argument('--operation', choices=['append', 'extend', 'value'], default='append')
+    parser.add_argument('--shared', action='store_true', help="all clients use one named list")
+    parser.add_argument('--port', type=int, default=constRPYC.PORT + 1)
+    args = parser.parse_args()
+    if args.store == 'memory' and 'fork' in args.modes:
+        parser.error("mode fork needs the redis store")
+
+    print("{:<12}{:>12}{:>12}{:>12}{:>12}".format("mode", "calls/s", "mean ms", "p50 ms", "p99 ms"))
+    for mode in args.modes:
+        server = start_server(mode, args.store, args.port)
+        try:
+            rate, latencies = measure(args.port, args.clients, args.calls, args.operation, args.shared)
+        finally:
+            server.terminate()
+            server.wait()
+        percentiles = statistics.quantiles(latencies, n=100)
+        print("{:<12}{:>12.0f}{:>12.3f}{:>12.3f}{:>12.3f}".format(
+            mode, rate, 1000 * statistics.mean(latencies), 1000 * percentiles[49], 1000 * percentiles[98]))
+
+
+if __name__ == "__main__":
+    main()
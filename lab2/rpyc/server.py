@@ -1,9 +1,16 @@
+import argparse
 import logging
-from typing import List, Any
+import pickle
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
 
 import constRPYC
+import redis
 import rpyc
-from rpyc.utils.server import ThreadedServer
+from rpyc.utils.helpers import classpartial
+from rpyc.utils.server import ForkingServer, Server, ThreadedServer
 
 from context import lab_logging
 
@@ -11,19 +18,225 @@ lab_logging.setup()
 logger = logging.getLogger("vs2lab.lab2.rpyc.server")
 
 
+class ListStore:
+    """
+    Named lists shared by all connections. Every list has a lock of its own, so calls on
+    different lists do not wait for each other. A list is created when the first connection
+    acquires it and dropped when the last one releases it.
+    """
+
+    def __init__(self):
+        self.lists: Dict[str, List[Any]] = {}
+        self.locks: Dict[str, threading.Lock] = {}
+        self.users: Dict[str, int] = {}  # number of connections using a list
+        self.lock = threading.Lock()  # guards creating and dropping lists
+
+    def acquire(self, name):
+        with self.lock:
+            if name not in self.lists:
+                self.lists[name] = []
+                self.locks[name] = threading.Lock()
+                self.users[name] = 0
+            self.users[name] += 1
+
+    def release(self, name):
+        with self.lock:
+            self.users[name] -= 1
+            if self.users[name] == 0:
+                del self.lists[name], self.locks[name], self.users[name]
+
+    def extend(self, name, items):
+        with self.locks[name]:
+            self.lists[name].extend(items)  # amortized O(1) per item, no copy
+            return len(self.lists[name])
+
+    def slice(self, name, start=None, stop=None):
+        with self.locks[name]:
+            return tuple(self.lists[name][start:stop])
+
+    def length(self, name):
+        return len(self.lists[name])
+
+
+class RedisStore:
+    """
+    Named lists kept in redis (items pickled), shared by all processes of the server. Every
+    operation is a single atomic redis command (or script), so no locks are needed. The numbers
+    of connections using the lists are kept in the hash USERS.
+    """
+
+    USERS = "rpyc:users"
+
+    # drop the list with its last user (KEYS: USERS, list, ARGV: name)
+    RELEASE_SCRIPT = """
+if redis.call('HINCRBY', KEYS[1], ARGV[1], -1) <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+    redis.call('DEL', KEYS[2])
+end
+"""
+
+    def __init__(self, host=constRPYC.REDIS_HOST, port=constRPYC.REDIS_PORT):
+        self.redis = redis.StrictRedis(host=host, port=port, db=0)  # reconnects in forked processes
+        self.release_script = self.redis.register_script(self.RELEASE_SCRIPT)
+
+    @staticmethod
+    def key(name):
+        return "rpyc:list:" + name
+
+    def acquire(self, name):
+        self.redis.hincrby(self.USERS, name, 1)  # the list comes into being with the first item
+
+    def release(self, name):
+        self.release_script(keys=[self.USERS, self.key(name)], args=[name])
+
+    def extend(self, name, items):
+        if not items:
+            return self.length(name)
+        return self.redis.rpush(self.key(name), *(pickle.dumps(item) for item in items))
+
+    def slice(self, name, start=None, stop=None):
+        # LRANGE includes the stop index, negative indices count from the end like in python
+        if stop == 0:
+            return ()
+        last = -1 if stop is None else stop - 1
+        items = self.redis.lrange(self.key(name), start or 0, last)
+        return tuple(pickle.loads(item) for item in items)
+
+    def length(self, name):
+        return self.redis.llen(self.key(name))
+
+
 class DBList(rpyc.Service):
-    value: List[Any] = [] # not visible from remote
+    """
+    Every connection works on a private list until it switches to a named list shared with
+    other connections (exposed_use). Results are lengths or slices (tuples, passed by value),
+    never the whole list. Names starting with SESSION are reserved for the private lists.
+    """
+
+    SESSION = "session-"
+
+    def __init__(self, store):
+        self.store = store  # not visible from remote
+        self.private = None
+        self.name = None
+
+    def on_connect(self, conn):
+        self.private = self.name = self.SESSION + uuid.uuid4().hex  # unique in forked processes, too
+        self.store.acquire(self.private)
+
+    def on_disconnect(self, conn):
+        if self.name != self.private:
+            self.store.release(self.name)
+        self.store.release(self.private)
 
     # visible functions start with 'exposed_'
+    def exposed_use(self, name=None):
+        """ Work on the named list (created if needed, dropped when no connection uses it any more), None: the private list """
+        if name is not None and name.startswith(self.SESSION):
+            raise ValueError("list names starting with '" + self.SESSION + "' are reserved")
+        name = self.private if name is None else name
+        if name == self.name:
+            return
+        if name != self.private:
+            self.store.acquire(name)
+        if self.name != self.private:
+            self.store.release(self.name)
+        self.name = name
+
     def exposed_append(self, data):
-        self.value = self.value + [data]
-        return self.value
+        """ Append an item, returns the new length """
+        return self.store.extend(self.name, (data,))
+
+    def exposed_extend(self, items):
+        """ Append many items with one call (pass a tuple, a list would be fetched item by item), returns the new length """
+        return self.store.extend(self.name, tuple(items))
+
+    def exposed_value(self, start=None, stop=None):
+        """ Return the items value[start:stop] (all items by default) """
+        return self.store.slice(self.name, start, stop)
+
+    def exposed_length(self):
+        return self.store.length(self.name)
+
+
+class PooledServer(Server):
+    """
+    A server serving the connections in a fixed pool of threads, a thread per connection.
+    Connections beyond the size of the pool wait until a thread is free (a warning is logged).
+    (rpyc's ThreadPoolServer polls the idle connections in 0.1 s intervals, which adds up to 0.1 s
+    to every call.) It implements the hooks of rpyc's Server for subclasses (_accept_method,
+    _authenticate_and_serve_client), these are not part of the public API, so rpyc is pinned to
+    6.0 in the Pipfile.
+    """
+
+    def __init__(self, *args, workers=20, **kwargs):
+        Server.__init__(self, *args, **kwargs)
+        self.workers = workers
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix='PooledServer')
+        self.connections = 0  # served and waiting connections
+        self.connections_lock = threading.Lock()
+
+    def _accept_method(self, sock):
+        with self.connections_lock:
+            self.connections += 1
+            if self.connections > self.workers:
+                logger.warning("All %d threads busy, connection waits (%d waiting)",
+                               self.workers, self.connections - self.workers)
+        try:
+            self.pool.submit(self._serve_pooled, sock)
+        except RuntimeError:  # accepted while the server was closed
+            self._reject(sock)
+
+    def _serve_pooled(self, sock):
+        if self.active:
+            try:
+                self._authenticate_and_serve_client(sock)
+            finally:
+                with self.connections_lock:
+                    self.connections -= 1
+        else:
+            self._reject(sock)  # closed while waiting for a thread
+
+    def _reject(self, sock):
+        sock.close()
+        self.clients.discard(sock)
+        with self.connections_lock:
+            self.connections -= 1
+
+    def close(self):
+        """ Close the server and all connections, wait for the threads to finish """
+        Server.close(self)
+        self.pool.shutdown(wait=True)
+
+
+# serving modes: a thread per connection, a fixed pool of threads, or a process per connection
+SERVERS = {'thread': ThreadedServer, 'threadpool': PooledServer, 'fork': ForkingServer}
+
 
-    def exposed_value(self):
-        return self.value
+def create_server(mode='thread', store=None, port=constRPYC.PORT, workers=20):
+    """
+    Create a DBList server.
+    :param mode: one of SERVERS
+    :param store: ListStore or RedisStore (default: ListStore, RedisStore for mode 'fork')
+    :param workers: number of threads of mode 'threadpool'
+    """
+    if store is None:
+        store = RedisStore() if mode == 'fork' else ListStore()
+    assert mode != 'fork' or isinstance(store, RedisStore), 'forked processes need a shared store'
+    options = {'workers': workers} if mode == 'threadpool' else {}
+    return SERVERS[mode](classpartial(DBList, store), port=port, **options)
 
 
 if __name__ == "__main__":
-    server = ThreadedServer(DBList, port=constRPYC.PORT)
-    logger.info("Server starting...")
+    parser = argparse.ArgumentParser(description="DBList server")
+    parser.add_argument('--mode', choices=sorted(SERVERS), default='thread')
+    parser.add_argument('--store', choices=['memory', 'redis'], help="default: memory, redis for mode fork")
+    parser.add_argument('--port', type=int, default=constRPYC.PORT)
+    parser.add_argument('--workers', type=int, default=20, help="threads of mode threadpool")
+    args = parser.parse_args()
+    if args.mode == 'fork' and args.store == 'memory':
+        parser.error("mode fork needs the redis store")
+    store = {'memory': ListStore, 'redis': RedisStore}[args.store]() if args.store else None
+    server = create_server(args.mode, store, args.port, args.workers)
+    logger.info("Server starting (mode %s)...", args.mode)
     server.start()
@@ -0,0 +1,28 @@
+"""
+Load generator test (a short run in one serving mode)
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+import constRPYC
+
+
+class TestLoadgen(unittest.TestCase):
+    """Test a short run of the load generator"""
+
+    def test_threadpool(self):
+        result = subprocess.run([sys.executable, 'loadgen.py', '--modes', 'threadpool', '--store', 'memory',
+                                 '--clients', '2', '--calls', '20', '--port', str(constRPYC.PORT + 2)],
+                                cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+                                timeout=120)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        header, line = result.stdout.splitlines()
+        self.assertEqual(header.split()[0], 'mode')
+        self.assertEqual(line.split()[0], 'threadpool')
+
+
+if __name__ == '__main__':
+    unittest.main()
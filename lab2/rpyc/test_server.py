@@ -0,0 +1,121 @@
+"""
+DBList server unit test (the redis store needs a running redis server)
+"""
+
+import threading
+import time
+import unittest
+
+import constRPYC
+import redis
+import rpyc
+
+import server
+
+
+class TestListStore(unittest.TestCase):
+    """Test named lists on a threaded server with the in-memory store"""
+
+    def create_store(self):
+        return server.ListStore()
+
+    def names(self):
+        return set(self.store.lists)
+
+    def setUp(self):
+        self.store = self.create_store()
+        self.server = server.create_server('thread', self.store, port=0)
+        self.server_thread = threading.Thread(target=self.server.start)
+        self.conns = []
+        self.server_thread.start()
+        while not self.server.active:
+            time.sleep(0.01)  # the server listens when it starts
+
+    def connect(self):
+        conn = rpyc.connect(constRPYC.SERVER, self.server.port)
+        self.conns.append(conn)
+        return conn
+
+    def wait_for_names(self, names):
+        deadline = time.monotonic() + 2
+        while self.names() != names and time.monotonic() < deadline:
+            time.sleep(0.01)  # connections are closed in the server thread
+        self.assertEqual(self.names(), names)
+
+    def test_session_names_reserved(self):
+        first, second = self.connect(), self.connect()
+        self.assertEqual(first.root.length() + second.root.length(), 0)  # connected on the server
+        self.assertEqual(len(self.names()), 2)
+        for name in self.names():
+            self.assertRaises(ValueError, second.root.use, name)
+        self.assertRaises(ValueError, first.root.use, server.DBList.SESSION)
+
+    def test_named_list_dropped_with_last_user(self):
+        first, second = self.connect(), self.connect()
+        first.root.use('shared')
+        second.root.use('shared')
+        self.assertEqual(first.root.append('a'), 1)
+        self.assertEqual(second.root.append('b'), 2)
+        first.close()
+        self.assertEqual(second.root.value(), ('a', 'b'))
+        second.root.use()  # back to the private list
+        self.assertEqual(second.root.length(), 0)
+        second.close()
+        self.wait_for_names(set())
+
+    def tearDown(self):
+        for conn in self.conns:
+            conn.close()
+        self.wait_for_names(set())  # the private lists are dropped, too
+        self.server.close()
+        self.server_thread.join()
+
+
+class TestRedisStore(TestListStore):
+    """Test named lists on a threaded server with the redis store"""
+
+    def create_store(self):
+        store = server.RedisStore()
+        try:
+            store.redis.delete(store.USERS)
+        except redis.ConnectionError:
+            self.skipTest('no redis server')
+        return store
+
+    def names(self):
+        return {name.decode() for name in self.store.redis.hkeys(self.store.USERS)}
+
+
+class TestPooledServer(unittest.TestCase):
+    """Test the thread pool of mode threadpool"""
+
+    def setUp(self):
+        self.server = server.create_server('threadpool', server.ListStore(), port=0, workers=1)
+        self.server_thread = threading.Thread(target=self.server.start)
+        self.server_thread.start()
+        while not self.server.active:
+            time.sleep(0.01)
+
+    def test_saturation(self):
+        first = rpyc.connect(constRPYC.SERVER, self.server.port)
+        self.assertEqual(first.root.append('a'), 1)
+        with self.assertLogs('vs2lab.lab2.rpyc.server', 'WARNING'):
+            second = rpyc.connect(constRPYC.SERVER, self.server.port)  # waits for the thread
+            deadline = time.monotonic() + 2
+            while self.server.connections < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        first.close()
+        self.assertEqual(second.root.append('b'), 1)  # served when the first connection is closed
+        third = rpyc.connect(constRPYC.SERVER, self.server.port)
+        self.server.close()  # closes the connections, waits for the threads
+        self.assertFalse([thread for thread in threading.enumerate() if thread.name.startswith('PooledServer')])
+        second.close()
+        third.close()
+
+    def tearDown(self):
+        self.server.close()
+        self.server_thread.join()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -120,7 +120,7 @@ class ChordNode:
 
         # Initialize the node
         # Get all nodes from channel for bootstrapping
-        nodes = {node.decode() for node in self.channel.channel.smembers('node')}
+        nodes = self.channel.subgroup('node')
         others = list(nodes - {str(self.node_id)})
         for other_node in others:  # for all other ring nodes
             # register current ring locally (might change later)
@@ -138,7 +138,7 @@ class ChordNode:
             request = message[1]  # And the actual request
 
             # If sender is a node (that stays in the ring) then update known nodes
-            if request[0] != constChord.LEAVE and self.channel.channel.sismember('node', sender):
+            if request[0] != constChord.LEAVE and self.channel.in_subgroup('node', sender):
                 self.add_node(sender)  # remember sender node
 
             if request[0] == constChord.STOP:  # this node is requested to shutdown
@@ -35,7 +35,7 @@ class DummyChordClient:
     def run(self):
           	
         # Randomly select a node from the channel and a random key to lookup
-        rand_node = random.choice([node.decode() for node in list(self.channel.channel.smembers('node'))])
+        rand_node = random.choice(list(self.channel.subgroup('node')))
         rand_key = randint(0, self.channel.MAXPROC)
         time.sleep(1)  # wait for a while to let the nodes join the channel
         
@@ -48,7 +48,7 @@ class DummyChordClient:
         print("\n###### NODE " + str(responsible_node) + " IS RESPONSIBLE FOR KEY " + str(rand_key))
 
         self.channel.send_to(  # a final multicast
-            {node.decode() for node in list(self.channel.channel.smembers('node'))},
+            self.channel.subgroup('node'),
             constChord.STOP)
         
     def sendRequest(self, node_id, key):
@@ -81,8 +81,7 @@ if __name__ == "__main__":  # if script is started from command line
         n = int(sys.argv[2])
 
     # Flush communication channel
-    chan = lab_channel.Channel()
-    chan.channel.flushall()
+    lab_channel.flushall()
 
     # we need to spawn processes for support of windows
     mp.set_start_method('spawn')
@@ -40,8 +40,7 @@ if __name__ == "__main__":  # if script is started from command line
     n = 3  # Number of participants in the group
 
     # Flush communication channel
-    chan = lab_channel.Channel()
-    chan.channel.flushall()
+    lab_channel.flushall()
 
     # we need to spawn processes for support of windows
     mp.set_start_method('spawn')
@@ -1 +1 @@
-__all__ = ['lab_channel.py', 'lab_logging.py']
+__all__ = ['lab_async_channel.py', 'lab_bench.py', 'lab_channel.py', 'lab_channel_local.py', 'lab_codec.py', 'lab_logging.py', 'lab_metrics.py', 'lab_wire.py']
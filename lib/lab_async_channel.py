@@ -0,0 +1,399 @@
+import logging
+import time
+from collections import deque
+
+import redis.asyncio
+
+from lib import lab_codec
+from lib.lab_channel import Channel, JOIN_SCRIPT, LEAVE_SCRIPT, PUSH_SCRIPT, POP_MANY_SCRIPT
+from lib.lab_wire import MAX_LANES, CHUNK, CHUNK_HEADER, queue_key, queue_sender, inbox_key, pool_key, \
+    remaining_timeout, wrap, unwrap, stamp, unstamp
+
+
+class AsyncChannel:
+    """
+    AsyncChannel is an asyncio variant of lab_channel.Channel based on redis.asyncio.
+    It offers the same operations as coroutines, so many members can run as tasks in a single process
+    instead of one os process per member.
+
+    Other than Channel, an AsyncChannel instance represents a single member: bind() associates the
+    instance (not the os process) with a member id. Instances are cheap and can share one redis client
+    and its connection pool (see the 'client' parameter). Each member blocked in a receive call holds
+    one connection of the pool.
+
+    The redis data structures and message formats are the same as for Channel in 'queue' and 'inbox'
+    mode (see lab_wire), so synchronous and asynchronous members can communicate over the same channel
+    (also on priority lanes, if both use the same number of lanes).
+
+    Supported subset of Channel: 'queue' and 'inbox' mode, priority lanes, message expiry (ttl),
+    atomic multicasts, receive_many and the codecs of lab_codec. Not supported: 'stream' mode (the
+    constructor rejects it), bounded queues (maxlen/overflow), splitting of large messages (chunked
+    messages sent by Channel are received, though), the member cache and instrumentation (metrics).
+
+    Example:
+
+        client = redis.asyncio.StrictRedis()
+        nodes = [AsyncChannel(n_bits=10, client=client) for _ in range(1000)]
+        ids = await asyncio.gather(*(node.join('node') for node in nodes))
+        for node, pid in zip(nodes, ids):
+            node.bind(pid)
+    """
+
+    MODES = ('queue', 'inbox')
+
+    def __init__(self, n_bits: int = 5, host_ip: str = 'localhost', port_no: int = 6379,
+                 mode: str = 'queue', lanes: int = 1, serializer: str = 'pickle', accept: set = None, client=None):
+        assert mode in self.MODES, 'unknown channel mode (AsyncChannel supports queue and inbox mode)'
+        assert 1 <= lanes <= MAX_LANES, 'unsupported number of priority lanes'
+        # create redis client or use a shared one
+        self.channel = client if client is not None else redis.asyncio.StrictRedis(host=host_ip, port=port_no, db=0)
+        self.own_client: bool = client is None
+        # register membership scripts (shared with Channel)
+        self.__join_script = self.channel.register_script(JOIN_SCRIPT)
+        self.__leave_script = self.channel.register_script(LEAVE_SCRIPT)
+        # register expiring push and batch receive scripts (shared with Channel)
+        self.__push_script = self.channel.register_script(PUSH_SCRIPT)
+        self.__pop_many_script = self.channel.register_script(POP_MANY_SCRIPT)
+        # member id bound to this instance
+        self.pid = None
+        # Number of bits for pid addresses
+        self.n_bits: int = n_bits
+        # Maximum corresponding pid
+        self.MAXPROC: int = pow(2, n_bits)
+        # Queue layout: pairwise queues or one inbox per member
+        self.mode: str = mode
+        # number of priority lanes (see Channel)
+        self.lanes: int = lanes
+        # messages received from senders that have not been asked for yet ('inbox' mode)
+        self.stash: deque = deque()
+        # codec for outgoing messages and names of accepted codecs for incoming messages (None: all)
+        self.codec = lab_codec.get(serializer)
+        self.accept = accept
+        # create instance logger
+        self.logger = logging.getLogger('vs2lab.channel.AsyncChannel')
+        self.logger.debug('New AsyncChannel created.')
+
+    @staticmethod
+    def __decode_set(raw) -> set:
+        return {i.decode() for i in raw}
+
+    async def __known(self, pids: list) -> list:
+        # membership of several ids in one pipelined round trip (see Channel)
+        async with self.channel.pipeline(transaction=False) as pipe:
+            for pid in pids:
+                pipe.sismember('members', pid)
+            return [bool(k) for k in await pipe.execute()]
+
+    async def close(self) -> None:
+        """
+        Close the redis client (unless it is shared).
+        :return: None
+        """
+        if self.own_client:
+            await self.channel.aclose()
+
+    async def join(self, subgroup: str) -> str:
+        """
+        Join as a member to the global channel and associate with a (sub)group.
+        :param subgroup: an identifier for the grouping
+        :return: global member id
+        """
+        # take a unique member id off the pool of free ids (see Channel.join)
+        new_pid = await self.__join_script(keys=['members', pool_key(self.MAXPROC), subgroup, 'free-pools'],
+                                           args=[self.MAXPROC, Channel.MEMBERS_TOPIC, self.mode])
+        assert new_pid is not None, 'no free member id'
+        new_pid: str = new_pid.decode()
+        self.logger.info("Member %s joining %s.", new_pid, subgroup)
+        return new_pid
+
+    async def leave(self, subgroup: str) -> None:
+        """
+        Unregister the bound member from the global channel (and subgroup).
+        :param subgroup: subgroup identifier
+        :return: None
+        """
+        pid: str = self.pid
+        assert await self.channel.sismember('members', pid), 'member unknown'
+        self.logger.info("Member %s leaving %s", pid, subgroup)
+
+        self.pid = None
+        self.stash.clear()
+        await self.__leave_script(keys=['members', subgroup, 'free-pools', 'xchan:' + pid],
+                                  args=[pid, Channel.MEMBERS_TOPIC, self.mode, MAX_LANES])
+
+    async def exists(self, pid: str) -> bool:
+        """
+        Check if pid is in global member set
+        :param pid: process identifier
+        :return: boolean value, true if pid is a member
+        """
+        return bool(await self.channel.sismember('members', str(pid)))
+
+    def bind(self, pid: str) -> str:
+        """
+        Associate this instance with a channel member id.
+        :param pid: identifier of member
+        :return: member id
+        """
+        self.pid = pid
+        self.logger.debug("Member %s bound", pid)
+        return pid
+
+    async def subgroup(self, subgroup: str) -> set:
+        """
+        Retrieve members of a subgroup.
+        :param subgroup: subgroup string identifier
+        :return: set of member process identifiers
+        """
+        return self.__decode_set(await self.channel.smembers(subgroup))
+
+    async def in_subgroup(self, subgroup: str, pid: str) -> bool:
+        """
+        Check if a member belongs to a subgroup (without retrieving the subgroup).
+        :param subgroup: subgroup string identifier
+        :param pid: member identifier
+        :return: boolean value, true if pid is in the subgroup
+        """
+        return bool(await self.channel.sismember(subgroup, str(pid)))
+
+    async def __push(self, destinations: list, payload: bytes, atomic: bool, ttl: float, lane: int) -> None:
+        assert 0 <= lane < self.lanes, 'unknown priority lane'
+        if ttl:
+            # stamp the message with its expiry time and let the lists expire with it (see Channel),
+            # the script pushes to all queues atomically
+            expires: float = time.time() + ttl
+            if self.mode == 'inbox':
+                message: bytes = wrap(self.pid, payload, expires)
+                keys: list = [inbox_key(destination, lane) for destination in destinations]
+            else:
+                message: bytes = stamp(payload, expires)
+                keys: list = [queue_key(self.pid, destination, lane) for destination in destinations]
+            await self.__push_script(keys=keys, args=[message, 0, 'reject', int(ttl * 1000)])
+            return
+        async with self.channel.pipeline(transaction=atomic) as pipe:
+            if self.mode == 'inbox':
+                envelope: bytes = wrap(self.pid, payload)
+                keys: list = [inbox_key(destination, lane) for destination in destinations]
+            else:
+                envelope: bytes = payload
+                keys: list = [queue_key(self.pid, destination, lane) for destination in destinations]
+            for key in keys:
+                pipe.rpush(key, envelope)
+                # the message never expires: keep the list from expiring with messages Channel sent with a ttl
+                pipe.persist(key)
+            await pipe.execute()
+
+    async def send_to(self, destination_set: set, message: object, atomic: bool = False, ttl: float = None,
+                      priority: int = 0) -> None:
+        """
+        Sends an asynchronous, persistent multicast message.
+        :param destination_set: a set of member identifiers
+        :param message: the message object to be send
+        :param atomic: deliver the multicast atomically (MULTI/EXEC)
+        :param ttl: time to live of the message in seconds (0 or None: never expires)
+        :param priority: priority lane of the message (0 ... lanes - 1, higher lanes are received first)
+        :return: None
+        """
+        destinations: list = list(destination_set)
+        assert all(type(k) is str for k in destinations), 'type error'
+        known: list = await self.__known([self.pid] + destinations)
+        assert known[0], 'unknown sender'
+        assert all(known[1:]), 'unknown receiver'
+        self.logger.debug("%s sends %s to %s", self.pid, message, destination_set)
+        await self.__push(destinations, self.codec.dumps(message), atomic, ttl, priority)
+
+    async def send_to_all(self, message: object, atomic: bool = False, ttl: float = None, priority: int = 0) -> None:
+        """
+        Sends an asynchronous, persistent broadcast message to all registered members.
+        :param message: the message object to be send
+        :param atomic: deliver the broadcast atomically (MULTI/EXEC)
+        :param ttl: time to live of the message in seconds (0 or None: never expires)
+        :param priority: priority lane of the message (0 ... lanes - 1, higher lanes are received first)
+        :return: None
+        """
+        members: set = self.__decode_set(await self.channel.smembers('members'))
+        assert self.pid in members, 'unknown sender'
+        self.logger.debug("%s sends %s to all members", self.pid, message)
+        await self.__push(list(members), self.codec.dumps(message), atomic, ttl, priority)
+
+    async def receive_from_any(self, timeout: int = 0) -> tuple:
+        """
+        Wait for the next message on any of the member's incoming queues.
+        :param timeout: optional timeout for blocking read.
+        :return: tuple of sender id and message or None on timeout
+        """
+        if self.mode == 'inbox':
+            assert await self.channel.sismember('members', self.pid), 'unknown receiver'
+            return await self.__pop_inbox(None, timeout)
+        members: set = self.__decode_set(await self.channel.smembers('members'))
+        assert self.pid in members, 'unknown receiver'
+        return await self.__pop(self.__in_queues(members), timeout)
+
+    async def receive_from(self, sender_set: set, timeout: int = 0) -> tuple:
+        """
+        Wait for the next message from one of the members in sender_set.
+        :param sender_set: set of ids to watch respective incoming queues for a new message
+        :param timeout: optional timeout for blocking call
+        :return: tuple of sender id and message or None on timeout
+        """
+        senders: list = list(sender_set)
+        known: list = await self.__known([self.pid] + senders)
+        assert known[0], 'unknown receiver'
+        assert all(known[1:]), 'unknown sender'
+        if self.mode == 'inbox':
+            return await self.__pop_inbox(set(senders), timeout)
+        return await self.__pop(self.__in_queues(senders), timeout)
+
+    async def receive_many(self, sender_set: set = None, max_count: int = 100, timeout: int = 0) -> list:
+        """
+        Wait for a first message and take further queued messages up to max_count without waiting again
+        (see Channel.receive_many).
+        :param sender_set: set of ids to receive messages from, None for any member
+        :param max_count: maximum number of messages to return
+        :param timeout: optional timeout for blocking call
+        :return: list of (sender, message) tuples, empty on timeout
+        """
+        senders: list = list(sender_set) if sender_set is not None else []
+        known: list = await self.__known([self.pid] + senders)
+        assert known[0], 'unknown receiver'
+        assert all(known[1:]), 'unknown sender'
+        if self.mode == 'inbox':
+            return await self.__pop_inbox_many(None if sender_set is None else set(senders), max_count, timeout)
+        if sender_set is None:
+            senders = list(self.__decode_set(await self.channel.smembers('members')))
+        return await self.__pop_many(self.__in_queues(senders), max_count, timeout)
+
+    def __in_queues(self, senders) -> list:
+        # incoming queues, higher priority lanes first (BLPOP serves the first non-empty key)
+        return [queue_key(sender, self.pid, lane) for lane in reversed(range(self.lanes)) for sender in senders]
+
+    async def __reassemble(self, key, header: bytes, frames: list = ()):
+        # copy the frames of a chunked message into a preallocated buffer (see Channel),
+        # frames popped along with the header are passed in, the others are popped here
+        _, count, total = CHUNK_HEADER.unpack_from(header)
+        buffer: bytearray = bytearray(total)
+        pos: int = 0
+        for frame in frames:
+            buffer[pos:pos + len(frame)] = frame
+            pos += len(frame)
+        count -= len(frames)
+        while count > 0:
+            batch = await self.channel.lpop(key, min(count, 8))
+            if not batch:
+                self.logger.warning("Discarding incomplete message from %s", key)
+                return None
+            for frame in batch:
+                buffer[pos:pos + len(frame)] = frame
+                pos += len(frame)
+            count -= len(batch)
+        return memoryview(buffer)
+
+    async def __pop(self, in_queues: list, timeout: float) -> tuple:
+        deadline: float = time.monotonic() + timeout
+        while True:
+            remaining: float = 0
+            if timeout > 0:
+                remaining = remaining_timeout(deadline)  # never below the shortest timeout redis honors
+                if remaining is None:
+                    return None
+            result = await self.channel.blpop(in_queues, remaining)
+            if result is None:
+                return None
+            raw = result[1]
+            if raw[0] == CHUNK:
+                raw = await self.__reassemble(result[0], raw)
+                if raw is None:
+                    continue
+            payload, expires = unstamp(raw)
+            if expires is not None and expires < time.time():
+                # discard expired messages (see Channel)
+                continue
+            sender: str = queue_sender(result[0].decode())
+            message = lab_codec.loads(payload, self.accept)
+            self.logger.debug("%s received %s from %s", self.pid, message, sender)
+            return sender, message
+
+    async def __pop_inbox(self, sender_set, timeout: float) -> tuple:
+        # serve stashed messages first, in order of arrival
+        for i, (sender, message) in enumerate(self.stash):
+            if sender_set is None or sender in sender_set:
+                del self.stash[i]
+                return sender, message
+
+        deadline: float = time.monotonic() + timeout
+        while True:
+            remaining: float = 0
+            if timeout > 0:
+                remaining = remaining_timeout(deadline)  # never below the shortest timeout redis honors
+                if remaining is None:
+                    return None
+            result = await self.channel.blpop([inbox_key(self.pid, lane) for lane in reversed(range(self.lanes))],
+                                              remaining)
+            if result is None:
+                return None
+            envelope = result[1]
+            if envelope[0] == CHUNK:
+                envelope = await self.__reassemble(result[0], envelope)
+                if envelope is None:
+                    continue
+            sender, payload, expires = unwrap(envelope)
+            if expires is not None and expires < time.time():
+                continue
+            message = lab_codec.loads(payload, self.accept)
+            self.logger.debug("%s received %s from %s", self.pid, message, sender)
+            if sender_set is None or sender in sender_set:
+                return sender, message
+            self.stash.append((sender, message))
+
+    async def __pop_many(self, in_queues: list, max_count: int, timeout: float) -> list:
+        # wait for a first message, then drain the queues in one atomic script call (see Channel)
+        first = await self.__pop(in_queues, timeout)
+        if first is None:
+            return []
+        result: list = [first]
+        if max_count <= 1:
+            return result
+        taken: list = await self.__pop_many_script(keys=in_queues, args=[max_count - 1])
+        for key, raw_messages in zip(in_queues, taken):
+            sender: str = queue_sender(key)
+            for raw in raw_messages:
+                payload, expires = unstamp(raw)
+                if expires is None or expires >= time.time():
+                    result.append((sender, lab_codec.loads(payload, self.accept)))
+        return result
+
+    async def __pop_inbox_many(self, sender_set, max_count: int, timeout: float) -> list:
+        # wait for a first message, then drain the inboxes with LPOP count (see Channel)
+        first = await self.__pop_inbox(sender_set, timeout)
+        if first is None:
+            return []
+        result: list = [first]
+        budget: int = max_count - 1
+        for key in [inbox_key(self.pid, lane) for lane in reversed(range(self.lanes))]:
+            if budget <= 0:
+                break
+            raw_messages = await self.channel.lpop(key, budget) or []
+            budget -= len(raw_messages)
+            i: int = 0
+            while i < len(raw_messages):
+                envelope = raw_messages[i]
+                i += 1
+                if envelope[0] == CHUNK:
+                    frames: list = raw_messages[i:i + CHUNK_HEADER.unpack_from(envelope)[1]]
+                    i += len(frames)
+                    envelope = await self.__reassemble(key, envelope, frames)
+                    if envelope is None:
+                        continue
+                sender, payload, expires = unwrap(envelope)
+                if expires is None or expires >= time.time():
+                    self.stash.append((sender, lab_codec.loads(payload, self.accept)))
+
+        # take matching messages off the stash, keep the others in order
+        keep: deque = deque()
+        for sender, message in self.stash:
+            if len(result) < max_count and (sender_set is None or sender in sender_set):
+                result.append((sender, message))
+            else:
+                keep.append((sender, message))
+        self.stash = keep
+        return result
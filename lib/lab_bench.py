@@ -0,0 +1,429 @@
+"""
+Channel benchmark
+
+Runs workloads over a grid of member counts and payload sizes against channel backends and reports
+throughput (messages or operations per second) and latency percentiles.
+
+Workloads:
+- pingpong: pairs of members bounce a message back and forth (latency: round trip)
+- fanout:   one member multicasts to all others (latency: send to receipt)
+- fanin:    all other members send to one member receiving with receive_from_any (latency: send to receipt)
+- churn:    all members join and leave repeatedly (latency: one join plus leave)
+
+Members of the redis and shm backends run as processes, so the numbers are not bounded by the GIL of
+a single process (--threads runs them as threads of one process instead). Members of the local backend
+are always threads. Every member creates its own channel instance, the members join before they are
+started and leave after the run. Run as a script, processes are spawned like in the labs (see
+lab4/chord/doit.py). Timestamps are taken with time.perf_counter() (a system-wide monotonic clock on Linux) and
+travel with the messages.
+
+Backends: redis (queue mode), redis-inbox, redis-stream, local (LocalChannel), shm (SharedMemoryChannel).
+The redis backends need a running server, members leave the channel after each run.
+
+Usage:
+
+    python -m lib.lab_bench --backends redis local --members 2 8 --payloads 16 4096 --json bench.json
+"""
+
+import argparse
+import csv
+import functools
+import json
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+
+from lib import lab_channel, lab_channel_local
+
+WORKLOADS = ('pingpong', 'fanout', 'fanin', 'churn')
+BACKENDS = ('redis', 'redis-inbox', 'redis-stream', 'local', 'shm')
+FIELDS = ('workload', 'backend', 'members', 'payload', 'count', 'seconds', 'rate',
+          'p50_ms', 'p99_ms', 'p999_ms')
+# seconds a member waits for a message before the run is aborted
+RECEIVE_TIMEOUT = 30
+
+
+class Backend:
+    """
+    Creates the channel instances of one benchmark run and releases them afterwards.
+    """
+
+    def __init__(self, name: str, members: int, payload: int, host_ip: str = 'localhost', port_no: int = 6379,
+                 threads: bool = False):
+        assert name in BACKENDS, 'unknown backend'
+        self.name: str = name
+        # run members as processes (LocalChannel members are threads of one process)
+        self.processes: bool = name != 'local' and not threads
+        # enough ids for all members and the churn workload
+        self.n_bits: int = max(5, (4 * members).bit_length())
+        self.host_ip: str = host_ip
+        self.port_no: int = port_no
+        self.hub = None
+        if name == 'local':
+            self.hub = lab_channel_local.LocalHub()
+        elif name == 'shm':
+            # every ring holds a few messages of the payload size
+            capacity: int = max(1 << 16, 8 * (payload + 256))
+            self.hub = lab_channel_local.SharedMemoryHub(n_bits=self.n_bits, capacity=capacity)
+
+    def channel(self):
+        """
+        Create a channel instance (one per member).
+        :return: channel
+        """
+        if self.name == 'local':
+            return lab_channel_local.LocalChannel(n_bits=self.n_bits, hub=self.hub)
+        if self.name == 'shm':
+            return lab_channel_local.SharedMemoryChannel(self.hub)
+        mode: str = self.name.partition('-')[2] or 'queue'
+        return lab_channel.Channel(n_bits=self.n_bits, host_ip=self.host_ip, port_no=self.port_no, mode=mode)
+
+    def close(self) -> None:
+        """
+        Release the backend's resources.
+        :return: None
+        """
+        if self.name == 'shm':
+            self.hub.unlink()
+
+
+def percentile(ordered: list, fraction: float) -> float:
+    """
+    Nearest-rank percentile of a sorted list.
+    :param ordered: sorted values
+    :param fraction: percentile as fraction (e.g. 0.99)
+    :return: value or None for an empty list
+    """
+    if not ordered:
+        return None
+    rank: int = max(int(fraction * len(ordered) + 0.999999) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def run_members(targets: list, processes: bool = False) -> tuple:
+    """
+    Run member functions in threads or processes, start them together and wait for all of them.
+    Every target is called with a barrier it has to pass once its setup is done and returns
+    its latency samples, the measured time ends when the last member is done.
+    :param targets: list of functions taking the start barrier (picklable for processes)
+    :param processes: run the members as processes instead of threads
+    :return: tuple of elapsed seconds and list of all latency samples
+    """
+    if processes:
+        return run_processes(targets)
+    start = threading.Barrier(len(targets) + 1)
+    samples: list = []
+    errors: list = []
+
+    def member(target):
+        try:
+            samples.extend(target(start))
+        except BaseException as e:
+            errors.append(e)
+            start.abort()
+
+    threads: list = [threading.Thread(target=member, args=(target,), daemon=True) for target in targets]
+    for thread in threads:
+        thread.start()
+    try:
+        start.wait()
+    except threading.BrokenBarrierError:
+        pass
+    t0: float = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed: float = time.perf_counter() - t0
+    if errors:
+        raise errors[0]
+    return elapsed, samples
+
+
+def run_process(target, start, results) -> None:
+    """
+    Body of a member process: run the target and send its samples (or its error) back through a queue.
+    :param target: member function taking the start barrier
+    :param start: start barrier
+    :param results: queue for (samples, error) tuples
+    :return: None
+    """
+    try:
+        results.put((target(start), None))
+    except BaseException as e:
+        start.abort()
+        results.put(([], RuntimeError('benchmark member failed: {!r}'.format(e))))
+
+
+def run_processes(targets: list) -> tuple:
+    """
+    Run member functions in processes (see run_members) with the current start method.
+    Targets are module level functions with bound arguments, so they can be passed to spawned processes.
+    A member that dies without reporting (e.g. killed by a signal) fails the run.
+    :param targets: list of functions taking the start barrier
+    :return: tuple of elapsed seconds and list of all latency samples
+    """
+    start = multiprocessing.Barrier(len(targets) + 1)
+    results = multiprocessing.Queue()
+    procs: list = [multiprocessing.Process(target=run_process, args=(target, start, results), daemon=True)
+                   for target in targets]
+    for proc in procs:
+        proc.start()
+    try:
+        # members that fail to start break the barrier after the timeout
+        start.wait(RECEIVE_TIMEOUT)
+    except threading.BrokenBarrierError:
+        pass
+    t0: float = time.perf_counter()
+    samples: list = []
+    errors: list = []
+    # drain the queue before joining, a process exits only after its result is flushed
+    pending: int = len(procs)
+    while pending > 0:
+        try:
+            member_samples, error = results.get(timeout=1)
+        except queue.Empty:
+            exitcodes: list = [proc.exitcode for proc in procs if proc.exitcode not in (None, 0)]
+            if exitcodes:
+                for proc in procs:
+                    proc.terminate()
+                raise RuntimeError('benchmark member exited with code {}'.format(exitcodes[0]))
+            continue
+        pending -= 1
+        samples.extend(member_samples)
+        if error is not None:
+            errors.append(error)
+    elapsed: float = time.perf_counter() - t0
+    for proc in procs:
+        proc.join()
+    if errors:
+        raise errors[0]
+    return elapsed, samples
+
+
+def receive(chan) -> tuple:
+    result = chan.receive_from_any(RECEIVE_TIMEOUT)
+    if result is None:
+        raise RuntimeError('benchmark member timed out')
+    return result
+
+
+def ping(backend: Backend, pid: str, peer: str, rounds: int, payload: bytes, start) -> list:
+    """
+    Member sending messages to a peer and waiting for each echo (pingpong).
+    :return: round trip latency samples
+    """
+    chan = backend.channel()
+    chan.bind(pid)
+    start.wait()
+    samples: list = []
+    for i in range(rounds):
+        sent: float = time.perf_counter()
+        chan.send_to({peer}, (i, sent, payload))
+        receive(chan)
+        samples.append(time.perf_counter() - sent)
+    return samples
+
+
+def pong(backend: Backend, pid: str, peer: str, rounds: int, start) -> list:
+    """
+    Member echoing messages back to a peer (pingpong).
+    :return: no samples
+    """
+    chan = backend.channel()
+    chan.bind(pid)
+    start.wait()
+    for _ in range(rounds):
+        _, message = receive(chan)
+        chan.send_to({peer}, message)
+    return []
+
+
+def multicast(backend: Backend, pid: str, destinations: set, rounds: int, payload: bytes, start) -> list:
+    """
+    Member sending timestamped messages to a set of destinations (fanout and fanin).
+    :return: no samples
+    """
+    chan = backend.channel()
+    chan.bind(pid)
+    start.wait()
+    for i in range(rounds):
+        chan.send_to(destinations, (i, time.perf_counter(), payload))
+    return []
+
+
+def sink(backend: Backend, pid: str, count: int, start) -> list:
+    """
+    Member receiving timestamped messages from any sender (fanout and fanin).
+    :return: send to receipt latency samples
+    """
+    chan = backend.channel()
+    chan.bind(pid)
+    start.wait()
+    samples: list = []
+    for _ in range(count):
+        _, (_, sent, _) = receive(chan)
+        samples.append(time.perf_counter() - sent)
+    return samples
+
+
+def cycle(backend: Backend, rounds: int, start) -> list:
+    """
+    Member joining and leaving the channel repeatedly (churn).
+    :return: join plus leave latency samples
+    """
+    chan = backend.channel()
+    start.wait()
+    samples: list = []
+    for _ in range(rounds):
+        began: float = time.perf_counter()
+        chan.bind(chan.join('bench'))
+        chan.leave('bench')
+        samples.append(time.perf_counter() - began)
+    return samples
+
+
+def pingpong(backend: Backend, members: int, payload: bytes, messages: int) -> tuple:
+    """
+    Pairs of members exchange messages round trips.
+    :return: tuple of message count, elapsed seconds and latency samples
+    """
+    pairs: int = max(members // 2, 1)
+    rounds: int = max(messages // pairs // 2, 1)
+    chan = backend.channel()
+    pids: list = [chan.join('bench') for _ in range(2 * pairs)]
+    targets: list = []
+    for i in range(0, 2 * pairs, 2):
+        targets.append(functools.partial(ping, backend, pids[i], pids[i + 1], rounds, payload))
+        targets.append(functools.partial(pong, backend, pids[i + 1], pids[i], rounds))
+    elapsed, samples = run_members(targets, backend.processes)
+    leave(chan, pids)
+    return 2 * pairs * rounds, elapsed, samples
+
+
+def fanout(backend: Backend, members: int, payload: bytes, messages: int) -> tuple:
+    """
+    One member multicasts messages to all other members.
+    :return: tuple of delivered message count, elapsed seconds and latency samples
+    """
+    receivers: int = max(members - 1, 1)
+    rounds: int = max(messages // receivers, 1)
+    chan = backend.channel()
+    pids: list = [chan.join('bench') for _ in range(receivers + 1)]
+    targets: list = [functools.partial(multicast, backend, pids[0], set(pids[1:]), rounds, payload)]
+    targets += [functools.partial(sink, backend, pid, rounds) for pid in pids[1:]]
+    elapsed, samples = run_members(targets, backend.processes)
+    leave(chan, pids)
+    return rounds * receivers, elapsed, samples
+
+
+def fanin(backend: Backend, members: int, payload: bytes, messages: int) -> tuple:
+    """
+    All other members send messages to one member receiving from any sender.
+    :return: tuple of message count, elapsed seconds and latency samples
+    """
+    senders: int = max(members - 1, 1)
+    rounds: int = max(messages // senders, 1)
+    chan = backend.channel()
+    pids: list = [chan.join('bench') for _ in range(senders + 1)]
+    targets: list = [functools.partial(sink, backend, pids[0], rounds * senders)]
+    targets += [functools.partial(multicast, backend, pid, {pids[0]}, rounds, payload) for pid in pids[1:]]
+    elapsed, samples = run_members(targets, backend.processes)
+    leave(chan, pids)
+    return rounds * senders, elapsed, samples
+
+
+def churn(backend: Backend, members: int, payload: bytes, messages: int) -> tuple:
+    """
+    All members join and leave the channel repeatedly (payload is not used).
+    :return: tuple of join/leave cycle count, elapsed seconds and latency samples
+    """
+    rounds: int = max(messages // members, 1)
+    targets: list = [functools.partial(cycle, backend, rounds) for _ in range(members)]
+    elapsed, samples = run_members(targets, backend.processes)
+    return rounds * members, elapsed, samples
+
+
+def leave(chan, pids: list) -> None:
+    """
+    Let the members of a finished run leave the channel.
+    LocalChannel binds threads, so the members are bound to the calling thread first.
+    :return: None
+    """
+    for pid in pids:
+        chan.bind(pid)
+        chan.leave('bench')
+
+
+def run(workload: str, backend_name: str, members: int, payload_size: int, messages: int,
+        host_ip: str = 'localhost', port_no: int = 6379, threads: bool = False) -> dict:
+    """
+    Run a single workload configuration.
+    :param workload: one of WORKLOADS
+    :param backend_name: one of BACKENDS
+    :param members: number of channel members
+    :param payload_size: payload bytes per message
+    :param messages: (approximate) number of messages or operations
+    :param host_ip: redis host
+    :param port_no: redis port
+    :param threads: run the members as threads of this process (redis and shm backends)
+    :return: result record with the keys in FIELDS (latencies in ms)
+    """
+    assert workload in WORKLOADS, 'unknown workload'
+    backend: Backend = Backend(backend_name, members, payload_size, host_ip, port_no, threads)
+    try:
+        count, elapsed, samples = globals()[workload](backend, members, bytes(payload_size), messages)
+    finally:
+        backend.close()
+    samples.sort()
+    result: dict = {'workload': workload, 'backend': backend_name, 'members': members, 'payload': payload_size,
+                    'count': count, 'seconds': round(elapsed, 6), 'rate': round(count / elapsed, 1)}
+    for key, fraction in (('p50_ms', 0.5), ('p99_ms', 0.99), ('p999_ms', 0.999)):
+        value = percentile(samples, fraction)
+        result[key] = round(value * 1000, 4) if value is not None else None
+    return result
+
+
+def main(argv: list = None) -> list:
+    parser = argparse.ArgumentParser(description='Benchmark channel backends.')
+    parser.add_argument('--workloads', nargs='+', choices=WORKLOADS, default=list(WORKLOADS))
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=['redis', 'local'])
+    parser.add_argument('--members', nargs='+', type=int, default=[2, 8, 32])
+    parser.add_argument('--payloads', nargs='+', type=int, default=[16, 1024, 65536])
+    parser.add_argument('--messages', type=int, default=10000, help='messages (or operations) per run')
+    parser.add_argument('--host', default='localhost', help='redis host')
+    parser.add_argument('--port', type=int, default=6379, help='redis port')
+    parser.add_argument('--threads', action='store_true',
+                        help='run the members of the redis and shm backends as threads of one process')
+    parser.add_argument('--json', help='write results to a JSON file')
+    parser.add_argument('--csv', help='write results to a CSV file')
+    args = parser.parse_args(argv)
+
+    results: list = []
+    print(' '.join('{:>10}'.format(field) for field in FIELDS))
+    for workload in args.workloads:
+        for backend_name in args.backends:
+            for members in args.members:
+                # churn does not send messages: one run per member count
+                for payload_size in (args.payloads if workload != 'churn' else [0]):
+                    result: dict = run(workload, backend_name, members, payload_size, args.messages,
+                                       args.host, args.port, args.threads)
+                    results.append(result)
+                    print(' '.join('{:>10}'.format(str(result[field])) for field in FIELDS))
+                    sys.stdout.flush()
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+    return results
+
+
+if __name__ == '__main__':
+    # we need to spawn processes for support of windows
+    multiprocessing.set_start_method('spawn')
+    main()
@@ -1,10 +1,302 @@
 import logging
 import os
-import pickle
-import random
+import threading
+import time
+from collections import deque
 
 import redis
 
+from lib import lab_codec, lab_metrics
+from lib.lab_wire import MAX_LANES, CHUNK, CHUNK_HEADER, queue_key, queue_sender, inbox_key, stream_key, pool_key, \
+    remaining_timeout, wrap, unwrap, stamp, unstamp, split
+
+
+class QueueFull(Exception):
+    """
+    Raised by send operations if a receiver's queue is full and the overflow policy is 'reject'
+    (or 'block' and the sender waited longer than the block timeout).
+    """
+
+    def __init__(self, key: str):
+        super().__init__('queue full: {}'.format(key))
+        self.key = key
+
+
+# Lua helpers shared by the membership scripts.
+# The membership scripts derive further key names from the sets they read (the sender sets
+# "xchan:<member>" of other members, free id pools "free:<size>", queues of the departing member),
+# so these keys are not declared in KEYS. This is fine on a single redis server (or a replicated
+# primary), but the scripts cannot run on a redis cluster, where all keys of a script must be declared
+# and stored in one hash slot. The channel does not support redis cluster.
+SCRIPT_HELPERS = """
+-- call a command with a fixed first argument on a long list of values in batches
+local function batched(command, first, values)
+    for i = 1, #values, 1000 do
+        redis.call(command, first, unpack(values, i, math.min(i + 999, #values)))
+    end
+end
+-- queue name of a sender/receiver pair and priority lane (see lab_wire.queue_key)
+local function queue_key(sender, receiver, lane)
+    return 'queue:' .. sender .. ':' .. receiver .. ':' .. lane
+end
+"""
+
+# Join a member atomically (see Channel.join)
+# KEYS: member set, free id pool, subgroup, registry of free id pools
+# ARGV: pool size (MAXPROC), membership change topic, channel mode
+# returns the new id (or nil if all ids are taken)
+JOIN_SCRIPT = SCRIPT_HELPERS + """
+local members, pool, subgroup, pools = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local size = tonumber(ARGV[1])
+-- fill the pool of free ids on first use (once per pool size)
+if redis.call('SADD', pools, size) == 1 then
+    local ids = {}
+    for i = 0, size - 1 do
+        ids[#ids + 1] = tostring(i)
+    end
+    batched('SADD', pool, ids)
+end
+-- take a random free id, skipping ids taken via pools of other sizes
+local pid
+repeat
+    pid = redis.call('SPOP', pool)
+    if not pid then
+        return nil
+    end
+until redis.call('SISMEMBER', members, pid) == 0
+if ARGV[3] == 'queue' then
+    -- register the new and all existing members as senders of each other's incoming queues
+    local others = redis.call('SMEMBERS', members)
+    for _, other in ipairs(others) do
+        redis.call('SADD', 'xchan:' .. other, pid)
+    end
+    batched('SADD', 'xchan:' .. pid, others)
+end
+redis.call('SADD', members, pid)
+redis.call('SADD', subgroup, pid)
+redis.call('PUBLISH', ARGV[2], '+' .. pid)
+return pid
+"""
+
+# Push a message to the lists of several receivers atomically with a length limit and expiry
+# ('queue' and 'inbox' mode, see Channel.__push)
+# KEYS: receiver lists
+# ARGV: message, max length (0: unbounded), overflow policy ('drop_oldest' or 'reject'), ttl in ms (0: none)
+# returns 0 or, if the policy is 'reject' and a list is full, its 1-based index (nothing is pushed then)
+PUSH_SCRIPT = """
+local maxlen, policy, ttl = tonumber(ARGV[2]), ARGV[3], tonumber(ARGV[4])
+if maxlen > 0 and policy == 'reject' then
+    for i, key in ipairs(KEYS) do
+        if redis.call('LLEN', key) >= maxlen then
+            return i
+        end
+    end
+end
+for _, key in ipairs(KEYS) do
+    local before = redis.call('PTTL', key)
+    redis.call('RPUSH', key, ARGV[1])
+    if maxlen > 0 then
+        redis.call('LTRIM', key, -maxlen, -1)
+    end
+    -- a list expires with its latest expiring message, a message without ttl keeps it
+    if ttl > 0 then
+        if before == -2 or (before >= 0 and before < ttl) then
+            redis.call('PEXPIRE', key, ttl)
+        end
+    elseif before >= 0 then
+        redis.call('PERSIST', key)
+    end
+end
+return 0
+"""
+
+# Take up to a number of messages off several lists atomically ('queue' mode, see Channel.receive_many).
+# A list is taken from up to its first chunk header (chunked messages are left for Channel.__pop).
+# KEYS: lists, in the order they are served
+# ARGV: maximum number of messages
+# returns a list of the taken messages per key
+POP_MANY_SCRIPT = """
+local budget = tonumber(ARGV[1])
+local taken = {}
+for i, key in ipairs(KEYS) do
+    local messages = {}
+    if budget > 0 then
+        for _, message in ipairs(redis.call('LRANGE', key, 0, budget - 1)) do
+            if string.byte(message, 1) == 0xfe then
+                break
+            end
+            messages[#messages + 1] = message
+        end
+        if #messages > 0 then
+            redis.call('LTRIM', key, #messages, -1)
+            budget = budget - #messages
+        end
+    end
+    taken[i] = messages
+end
+return taken
+"""
+
+# Add a message to the streams of several receivers atomically with a length limit ('stream' mode)
+# KEYS: receiver streams
+# ARGV: sender, message, max length (0: unbounded), overflow policy ('drop_oldest' or 'reject'), expiry time
+# returns 0 or, if the policy is 'reject' and a stream is full, its 1-based index (nothing is added then)
+XADD_SCRIPT = """
+local maxlen, policy = tonumber(ARGV[3]), ARGV[4]
+if maxlen > 0 and policy == 'reject' then
+    for i, key in ipairs(KEYS) do
+        if redis.call('XLEN', key) >= maxlen then
+            return i
+        end
+    end
+end
+for _, key in ipairs(KEYS) do
+    local args = {key}
+    if maxlen > 0 then
+        args = {key, 'MAXLEN', '~', maxlen}
+    end
+    args[#args + 1] = '*'
+    for _, field in ipairs({'s', ARGV[1], 'm', ARGV[2]}) do
+        args[#args + 1] = field
+    end
+    if ARGV[5] ~= '' then
+        args[#args + 1] = 'e'
+        args[#args + 1] = ARGV[5]
+    end
+    redis.call('XADD', unpack(args))
+end
+return 0
+"""
+
+# Remove a member atomically (see Channel.leave)
+# KEYS: member set, subgroup, registry of free id pools, sender set of the member
+# ARGV: member id, membership change topic, channel mode, number of priority lanes (MAX_LANES)
+LEAVE_SCRIPT = SCRIPT_HELPERS + """
+local members, subgroup, pools, xchan = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local pid = ARGV[1]
+redis.call('SREM', members, pid)
+redis.call('SREM', subgroup, pid)
+redis.call('PUBLISH', ARGV[2], '-' .. pid)
+-- return the id to all pools covering it
+for _, size in ipairs(redis.call('SMEMBERS', pools)) do
+    if tonumber(pid) < tonumber(size) then
+        redis.call('SADD', 'free:' .. size, pid)
+    end
+end
+-- delete the incoming and outgoing queues of the member in all priority lanes (receive operations only
+-- accept members as senders, so nobody will receive these messages) and unregister it as sender
+local lanes = tonumber(ARGV[4])
+if ARGV[3] == 'queue' then
+    local queues = {}
+    for _, other in ipairs(redis.call('SMEMBERS', xchan)) do
+        for lane = 0, lanes - 1 do
+            queues[#queues + 1] = queue_key(other, pid, lane)
+            queues[#queues + 1] = queue_key(pid, other, lane)
+        end
+        redis.call('SREM', 'xchan:' .. other, pid)
+    end
+    for i = 1, #queues, 1000 do
+        redis.call('DEL', unpack(queues, i, math.min(i + 999, #queues)))
+    end
+    redis.call('DEL', xchan)
+else
+    redis.call('DEL', 'inbox:' .. pid, 'stream:' .. pid)
+    for lane = 1, lanes - 1 do
+        redis.call('DEL', 'inbox:' .. pid .. ':' .. lane)
+    end
+end
+"""
+
+
+# process-wide connection pools by host and port (see connection_pool)
+POOLS: dict = {}
+POOLS_LOCK = threading.Lock()
+LOCAL_HOSTS = ('localhost', '127.0.0.1', '::1')
+
+
+def connection_pool(host_ip: str = 'localhost', port_no: int = 6379, max_connections: int = None,
+                    health_check_interval: int = 30, prefer_unix_socket: bool = True) -> redis.ConnectionPool:
+    """
+    Get the process-wide redis connection pool for a server, creating it on first use.
+    All channels of a process share the pool and reuse its connections. TCP connections use keepalive
+    and connections idle for more than health_check_interval seconds are checked before use.
+    If the server runs locally and listens on a unix domain socket, the socket is used instead of TCP.
+    The settings of the first call for a host and port apply.
+    :param host_ip: redis host
+    :param port_no: redis port
+    :param max_connections: maximum number of connections, callers wait for a free connection (None: unlimited)
+    :param health_check_interval: seconds a connection may be idle before it is checked
+    :param prefer_unix_socket: use the unix socket of a local server
+    :return: connection pool
+    """
+    with POOLS_LOCK:
+        pool = POOLS.get((host_ip, port_no))
+        if pool is None:
+            kwargs: dict = {'health_check_interval': health_check_interval}
+            path = unix_socket(host_ip, port_no) if prefer_unix_socket else None
+            if path:
+                kwargs.update(connection_class=redis.UnixDomainSocketConnection, path=path)
+            else:
+                kwargs.update(host=host_ip, port=port_no, socket_keepalive=True)
+            if max_connections is None:
+                pool = redis.ConnectionPool(**kwargs)
+            else:
+                pool = redis.BlockingConnectionPool(max_connections=max_connections, timeout=None, **kwargs)
+            POOLS[(host_ip, port_no)] = pool
+        return pool
+
+
+def unix_socket(host_ip: str, port_no: int):
+    """
+    Ask a local redis server for the path of its unix domain socket.
+    :param host_ip: redis host
+    :param port_no: redis port
+    :return: socket path or None if the server is remote, has no socket or does not tell
+    """
+    if host_ip not in LOCAL_HOSTS:
+        return None
+    try:
+        with redis.StrictRedis(host=host_ip, port=port_no, socket_connect_timeout=1) as probe:
+            path = probe.config_get('unixsocket').get('unixsocket')
+    except redis.RedisError:
+        return None
+    if path and os.path.exists(path):
+        return path
+    return None
+
+
+def flushall(host_ip: str = 'localhost', port_no: int = 6379) -> None:
+    """
+    Remove all keys of the redis server (e.g. before a new simulation run).
+    :param host_ip: redis host
+    :param port_no: redis port
+    :return: None
+    """
+    redis.StrictRedis(connection_pool=connection_pool(host_ip, port_no)).flushall()
+
+
+class QueueOptions:
+    """
+    Delivery settings of a Channel's queues (see Channel): length limit and overflow policy, default time
+    to live of messages, frame size of large messages and number of priority lanes.
+    """
+
+    OVERFLOW = ('drop_oldest', 'reject', 'block')
+
+    def __init__(self, maxlen: int = None, overflow: str = 'drop_oldest', block_timeout: float = None,
+                 ttl: float = None, chunk_size: int = 1 << 20, lanes: int = 1):
+        assert overflow in self.OVERFLOW, 'unknown overflow policy'
+        assert 1 <= lanes <= MAX_LANES, 'unsupported number of priority lanes'
+        # queue length limit, overflow policy and default time to live of messages (seconds)
+        self.maxlen = maxlen
+        self.overflow: str = overflow
+        self.block_timeout = block_timeout
+        self.ttl = ttl
+        # maximum size of list elements, larger messages are split into frames (None: never split)
+        self.chunk_size = chunk_size
+        # number of priority lanes (receivers drain higher lanes first)
+        self.lanes: int = lanes
+
 
 class Channel:
     """
@@ -22,7 +314,7 @@ class Channel:
     Receive operations of a caller pop messages from respective sender-caller queues for a set of senders.
 
     Queues are implemented as redis lists.
-    The key is a string representation of a list containing sender and receiver ids.
+    The key contains sender and receiver ids and the priority lane (see lab_wire.queue_key).
     That is, sender and receiver can always be identified by parsing the queue keys.
 
     Redis data Structures:
@@ -33,31 +325,266 @@ class Channel:
     Subgroup Member Sets
         Key: <subgroup>
         Value: redis set of member ID strings
-    Global Queue List (containing all possible queue keys)
-        Key: "xchan"
-        Value: redis list of queue identifier objects
+    Sender Sets (the senders of all possible incoming queues of a member, 'queue' mode)
+        Key: "xchan:<member>"
+        Value: redis set of member ID strings
     Queues
-        Key: "['<member1>','<member2>']"
-        Value: redis list of message objects send fom member1 to member2
+        Key: "queue:<member1>:<member2>:<lane>"
+        Value: redis list of message objects send fom member1 to member2 (lane 0 unless priority lanes are used)
+    Free Member Id Pools
+        Key: "free:<MAXPROC>" (registry of pools: "free-pools", set of MAXPROC values)
+        Value: redis set of unused member ID strings
+    Membership Change Topic
+        Channel: "members-changed"
+        Messages: "+<member>" on join, "-<member>" on leave (published within the membership transaction)
+
+    Join and leave run as lua scripts, i.e. in one atomic round trip each. Leaving deletes the
+    incoming queues of the departing member and, in 'queue' mode, also its outgoing queues: receive
+    operations only accept members as senders, so messages it sent can no longer be received.
+    The scripts access keys they do not declare, so the channel needs a single redis server
+    (not a redis cluster).
+
+    In 'inbox' mode, the pairwise queues are replaced by a single incoming queue per member.
+    Every message is wrapped in an envelope that carries the sender id. Receiving from a subset of
+    senders filters client-side: messages from other senders are stashed locally and delivered by
+    later receive calls in arrival order. The cost of a receive call does not grow with the group
+    size and no "xchan" bookkeeping is needed.
+
+    Inbox Queues ('inbox' mode)
+        Key: "inbox:<member>"
+        Value: redis list of envelopes (<flags: byte><sender length: byte><sender>[<expiry time: double>]<message>)
+
+    The 'stream' mode uses a redis stream per member as inbox. The member reads its stream through a
+    consumer group, so a message stays pending until it is acknowledged. Messages handed out by a
+    receive call are acknowledged with the next call that reads from redis (or explicitly by ack()),
+    which gives at-least-once delivery: a member that crashes and is bound to its id again first gets
+    its pending messages re-delivered, and other members can take over the pending messages of a
+    crashed member with reclaim(). Each read fetches up to 'batch' entries at once. Acknowledged
+    entries are deleted from the stream.
+
+    Inbox Streams ('stream' mode)
+        Key: "stream:<member>"
+        Value: redis stream of entries {"s": <sender>, "m": <message>[, "e": <expiry time>]},
+               read by consumer group "members"
+
+    The settings of the following paragraphs (maxlen, overflow, block_timeout, ttl, chunk_size, lanes)
+    are passed as one QueueOptions instance ('options').
+
+    Queues (and inboxes or streams) can be bounded to 'maxlen' messages. The overflow policy decides
+    what happens when a message is sent to a full queue: 'drop_oldest' (default) trims the oldest
+    messages ('stream' mode: approximately), 'reject' raises QueueFull without delivering the message
+    to any receiver and 'block' waits until all receivers have room (raising QueueFull after
+    'block_timeout' seconds, if given).
+
+    Messages can expire: a time to live (channel default 'ttl' or per send call, in seconds) adds an
+    expiry time to the message (envelope flag in 'inbox' mode, field "e" in 'stream' mode and a
+    stamp <0x00><expiry time: double><message> in 'queue' mode). Receivers silently discard expired
+    messages. Lists expire as a whole once their latest expiring message has expired, so queues
+    of crashed members do not keep stale messages forever. Expiry times are unix timestamps, member
+    clocks are assumed to be synchronized.
+
+    Large messages ('queue' and 'inbox' mode) are split into frames of at most 'chunk_size' bytes
+    (see lab_wire.split): a header element <0xfe><number of frames: uint32><message length: uint64>
+    followed by the frames, all pushed by one RPUSH so they are contiguous in the list. Frames are
+    taken from the serialized buffers without copying (pickle protocol 5 out-of-band buffers, e.g.
+    bytearrays or numpy arrays, are not copied into one bytes object at all). The receiver pops
+    the frames in batches into a preallocated bytearray and decodes from a memoryview of it.
+    Messages with an expiry time or to bounded queues are not split.
+
+    Control messages can overtake bulk traffic on priority lanes ('queue' and 'inbox' mode): with
+    'lanes' > 1 (up to MAX_LANES), send calls take a priority between 0 (default) and lanes - 1 and
+    every pair of members (or inbox) gets one list per lane. Receive calls list the higher lanes
+    first in their BLPOP, so one blocking call always takes the most urgent message available.
+    Messages of one sender stay in order within a lane only. All members should use the same
+    number of lanes.
+
+    Priority Lanes
+        Key: "queue:<member1>:<member2>:<lane>" ('queue' mode) or "inbox:<member>:<lane>" ('inbox' mode)
+        Value: as lane 0, which uses the keys above
+
+    Messages are serialized by a codec (see lab_codec) selected by name: 'pickle' (default, protocol 5
+    with out-of-band buffers), 'compact' (tuples/lists of ints, strings etc. without pickle) or 'auto'
+    (compact where possible, pickle otherwise). Serialized messages carry a codec header byte, so
+    members with different codecs can talk to each other. A receiver can restrict the accepted
+    codecs, e.g. accept={'compact'} never unpickles received bytes.
+
+    All channels of a process share a connection pool per redis server (see connection_pool()),
+    alternatively a client or connection pool can be passed in.
+
+    A channel created with a lab_metrics.Metrics instance reports per-operation latency histograms
+    ("op_seconds" by op), the time receive calls wait for redis versus the time spent decoding
+    ("receive_wait_seconds", "decode_seconds"), message and byte counters and, on request, the depth
+    of incoming queues (sample_queue_depths()). See lab_metrics for the exporters.
+
+    Optionally, a channel keeps a local cache of the global member set that is kept current via the
+    membership change topic. Member validation then becomes a local set lookup. A cache miss falls back
+    to a redis lookup, so members that joined a moment ago are never rejected.
     """
 
-    def __init__(self, n_bits: int = 5, host_ip: str = 'localhost', port_no: int = 6379):
-        # create redis client
-        self.channel = redis.StrictRedis(host=host_ip, port=port_no, db=0)
+    MEMBERS_TOPIC = 'members-changed'
+    MODES = ('queue', 'inbox', 'stream')
+    GROUP = 'members'
+
+    def __init__(self, n_bits: int = 5, host_ip: str = 'localhost', port_no: int = 6379,
+                 cache_members: bool = False, mode: str = 'queue', batch: int = 100, options: QueueOptions = None,
+                 serializer: str = 'pickle', accept: set = None, client: redis.StrictRedis = None,
+                 pool: redis.ConnectionPool = None, max_connections: int = None, metrics: lab_metrics.Metrics = None):
+        options = options if options is not None else QueueOptions()
+        assert mode in self.MODES, 'unknown channel mode'
+        assert options.lanes == 1 or mode != 'stream', 'priority lanes require queue or inbox mode'
+        # create redis client on the process-wide connection pool (unless a client or pool is given)
+        if client is None:
+            if pool is None:
+                pool = connection_pool(host_ip, port_no, max_connections)
+            client = redis.StrictRedis(connection_pool=pool)
+        self.channel = client
+        # register membership scripts (run via EVALSHA)
+        self.__join_script = self.channel.register_script(JOIN_SCRIPT)
+        self.__leave_script = self.channel.register_script(LEAVE_SCRIPT)
+        # register bounded/expiring push scripts
+        self.__push_script = self.channel.register_script(PUSH_SCRIPT)
+        self.__xadd_script = self.channel.register_script(XADD_SCRIPT)
+        # register batch receive script
+        self.__pop_many_script = self.channel.register_script(POP_MANY_SCRIPT)
         # create dict of local pid bindings
         self.os_members = {}
         # Number of bits for pid addresses
         self.n_bits: int = n_bits
         # Maximum corresponding pid
         self.MAXPROC: int = pow(2, n_bits)
+        # Queue layout: pairwise queues or one inbox per member
+        self.mode: str = mode
+        # messages received from senders that have not been asked for yet, per member id
+        self.stash = {}
+        # queue length limit, overflow policy, message expiry, frame size and priority lanes
+        self.options: QueueOptions = options
+        # 'stream' mode: entries per read,
+        # delivered but unacknowledged entries and members that recovered their pending entries
+        self.batch: int = batch
+        self.unacked = {}
+        self.recovered = set()
+        # codec for outgoing messages and names of accepted codecs for incoming messages (None: all)
+        self.codec = lab_codec.get(serializer)
+        self.accept = accept
+        # instrumentation: operation counters and latency histograms (discarded by default)
+        self.metrics = metrics if metrics is not None else lab_metrics.NULL
         # create instance logger
         self.logger = logging.getLogger('vs2lab.channel.Channel')
+        # local copy of the global member set (None if caching is disabled)
+        self.members_cache = None
+        self.__pubsub = None
+        self.__cache_pid = os.getpid()
+        if cache_members:
+            self.__watch_members()
         self.logger.debug('New Channel created.')
 
+    def __watch_members(self) -> None:
+        """
+        Subscribe to the membership change topic and keep the local member cache current in a daemon thread.
+        The subscription is set up before the initial snapshot is loaded, so no change can be missed.
+        :return: None
+        """
+        self.__cache_pid = os.getpid()
+        self.__pubsub = self.channel.pubsub()
+        self.__pubsub.subscribe(self.MEMBERS_TOPIC)
+        self.members_cache = self.__decode_set(self.channel.smembers('members'))
+        listener = threading.Thread(target=self.__listen_members, args=(self.__pubsub,),
+                                    name='ChannelMembers', daemon=True)
+        listener.start()
+
+    def __listen_members(self, pubsub) -> None:
+        """
+        Apply membership changes to the local cache until the channel is closed.
+        If the subscription fails for good, the cache is dropped and members are looked up in redis.
+        :param pubsub: subscription to the membership change topic
+        :return: None
+        """
+        try:
+            for event in pubsub.listen():
+                if event['type'] == 'subscribe' and self.__pubsub is pubsub:
+                    # (re)subscribed, e.g. after a reconnect: changes might have been missed, reload snapshot
+                    self.members_cache = self.__decode_set(self.channel.smembers('members'))
+                elif event['type'] == 'message' and self.members_cache is not None:
+                    change: str = event['data'].decode()
+                    if change[0] == '+':
+                        self.members_cache.add(change[1:])
+                    else:
+                        self.members_cache.discard(change[1:])
+                elif event['type'] == 'unsubscribe':
+                    break
+        except redis.RedisError as e:
+            self.logger.warning("Member cache disabled, watching membership changes failed: %s", e)
+        finally:
+            if self.__pubsub is pubsub:
+                # nobody keeps the cache current any more: fall back to redis lookups
+                self.__pubsub = None
+                self.members_cache = None
+            pubsub.close()
+
+    def close(self) -> None:
+        """
+        Stop watching membership changes (if caching is enabled).
+        :return: None
+        """
+        pubsub, self.__pubsub = self.__pubsub, None
+        if pubsub is not None:
+            self.members_cache = None
+            if self.__cache_pid == os.getpid():
+                pubsub.unsubscribe()
+
+    def __member_cache(self):
+        """
+        Get the local member cache. In a process forked from the one that set up the cache, the
+        listener thread is gone and the inherited cache would go stale (e.g. still list members that
+        left, whose queues would then be recreated), so the child subscribes anew on first use.
+        :return: set of member identifiers or None if caching is disabled
+        """
+        if self.__cache_pid != os.getpid() and self.__pubsub is not None:
+            # the inherited subscription shares its socket with the parent: abandon it without closing
+            self.__pubsub = None
+            self.members_cache = None
+            self.__watch_members()
+        return self.members_cache
+
+    def __known(self, pids: list) -> list:
+        """
+        Check membership of a list of ids, preferably from the local member cache.
+        :param pids: list of member identifiers
+        :return: list of booleans, true if the respective pid is a member
+        """
+        cache = self.__member_cache()
+        if cache is not None and all(pid in cache for pid in pids):
+            return [True] * len(pids)
+        # cache disabled or missed (e.g. a member joined just now): ask redis, one SISMEMBER per id
+        # in a single pipelined round trip (works with any redis version, unlike SMISMEMBER)
+        with self.channel.pipeline(transaction=False) as pipe:
+            for pid in pids:
+                pipe.sismember('members', pid)
+            return [bool(k) for k in pipe.execute()]
+
+    def __members(self) -> set:
+        """
+        Retrieve the global member set, preferably from the local member cache.
+        :return: set of member identifiers
+        """
+        cache = self.__member_cache()
+        if cache is not None:
+            return set(cache)
+        return self.__decode_set(self.channel.smembers('members'))
+
     @staticmethod
     def __decode_set(raw) -> set:
         return {i.decode() for i in raw}
 
+    def __encode(self, message: object) -> list:
+        return self.codec.dumps_parts(message)
+
+    def __decode(self, raw: bytes) -> object:
+        start: float = time.perf_counter()
+        message = lab_codec.loads(raw, self.accept)
+        self.metrics.observe('decode_seconds', time.perf_counter() - start)
+        return message
+
     def join(self, subgroup: str) -> str:
         """
         Join a process as a member to the global channel and associate it with a (sub)group. 
@@ -66,45 +593,28 @@ class Channel:
         :param subgroup: an identifier for the grouping
         :return: global member id of the process.
         """
-        # For concurrently assigning unique member ids, we need to use a transaction
-        # atomically reading and writing the member set. This can be implemented by
-        # means of the pipeline construct.
-        with self.channel.pipeline() as pipe:
-            while 1:
-                try:
-                    # Put a WATCH on the key that holds the member set
-                    pipe.watch('members')
-                    # After WATCHing, the pipeline is put into immediate execution
-                    # mode until we tell it to start buffering commands again.
-                    # This allows us to get the current value of the global member set
-                    raw_members = pipe.smembers('members')
-                    members = self.__decode_set(raw_members)
-                    # Now construct new/unused random member id
-                    remaining_ids = list(set([str(i) for i in range(self.MAXPROC)]) - members)
-                    new_pid = random.choice(remaining_ids)
-                    # Then we can put the pipeline back into buffered mode with MULTI
-                    pipe.multi()
-                    # Add new member id to global member set and subgroup
-                    pipe.sadd('members', new_pid)
-                    pipe.sadd(subgroup, new_pid)
-                    # and finally, execute the pipeline (the set command)
-                    pipe.execute()
-                    # if a WatchError wasn't raised during execution,
-                    # everything we just did happened atomically.
-                    break
-                except redis.WatchError:
-                    # another client must have changed 'members' between
-                    # the time we started WATCHing it and the pipeline's execution.
-                    # our best bet is to just retry.
-                    continue
-        self.logger.info("Member {} joining {}.".format(new_pid, subgroup))
-
-        # construct bidirectional queue names for new member and all existing members (if any)
-        if len(members) > 0:
-            xchan: list = [[new_pid, other] for other in members] + [[other, new_pid] for other in members]
-            # push queue names to global list of all possible transfer queues
-            for xc in xchan:
-                self.channel.rpush('xchan', pickle.dumps(xc))
+        # For concurrently assigning unique member ids, the join script takes a random id off
+        # the pool of free ids (SPOP) and adds it to the member set and subgroup. It also registers
+        # the queue names between the new and all existing members ('queue' mode). Redis runs the
+        # script atomically, so concurrent joins neither collide nor need to retry.
+        # The pool is filled once on first use.
+        with self.metrics.timer('op_seconds', op='join'):
+            new_pid = self.__join_script(keys=['members', pool_key(self.MAXPROC), subgroup, 'free-pools'],
+                                         args=[self.MAXPROC, self.MEMBERS_TOPIC, self.mode])
+        assert new_pid is not None, 'no free member id'
+        new_pid: str = new_pid.decode()
+        cache = self.__member_cache()
+        if cache is not None:
+            cache.add(new_pid)
+        self.logger.info("Member %s joining %s.", new_pid, subgroup)
+
+        if self.mode == 'stream':
+            # create the inbox stream and the consumer group reading it
+            try:
+                self.channel.xgroup_create(stream_key(new_pid), self.GROUP, id='0', mkstream=True)
+            except redis.ResponseError as e:
+                if 'BUSYGROUP' not in str(e):
+                    raise
         return new_pid
 
     def leave(self, subgroup: str):
@@ -116,26 +626,23 @@ class Channel:
         # retrieve member id via os pid and validate it
         os_pid: int = os.getpid()
         pid: str = self.os_members[os_pid]
-        assert self.channel.sismember('members', pid), 'member unknown'
-        self.logger.info("Member {} leaving {}".format(pid, subgroup))
+        assert self.__known([pid])[0], 'member unknown'
+        self.logger.info("Member %s leaving %s", pid, subgroup)
 
-        # remove binding and global member element
+        # In one atomic script: remove global member and subgroup element, return the id to the free id
+        # pools and delete the member's incoming queues (or inbox)
         del self.os_members[os_pid]
-        self.channel.srem('members', pid)
+        with self.metrics.timer('op_seconds', op='leave'):
+            self.__leave_script(keys=['members', subgroup, 'free-pools', 'xchan:' + pid],
+                                args=[pid, self.MEMBERS_TOPIC, self.mode, MAX_LANES])
+        cache = self.__member_cache()
+        if cache is not None:
+            cache.discard(pid)
 
-        # decode member set binary elements to string list
-        raw_members: set = self.channel.smembers('members')
-        members: set = self.__decode_set(raw_members)
-
-        # construct bidirectional queue names for new member and all existing members (if any)
-        if len(members) > 0:
-            xchan: list = [[pid, other] for other in members] + [[other, pid] for other in members]
-            # pop queue names from global list of all possible transfer queues
-            for xc in xchan:
-                self.channel.lrem('xchan', 0, pickle.dumps(xc))
-
-        # remove member id from subgroup set
-        self.channel.srem(subgroup, pid)
+        # messages to the departing member will never be received
+        self.stash.pop(pid, None)
+        self.unacked.pop(pid, None)
+        self.recovered.discard(pid)
 
     def exists(self, pid: str) -> bool:
         """
@@ -143,7 +650,7 @@ class Channel:
         :param pid: process identifier
         :return: boolean value, true if pid is a member
         """
-        return self.channel.sismember('members', pid)
+        return self.__known([str(pid)])[0]
 
     def bind(self, pid: str) -> int:
         """
@@ -155,7 +662,7 @@ class Channel:
         # retrieve os pid and map to given member id
         os_pid: int = os.getpid()
         self.os_members[os_pid] = pid
-        self.logger.debug("Member {} bound {}".format(pid, os_pid))
+        self.logger.debug("Member %s bound %s", pid, os_pid)
         return os_pid
 
     def subgroup(self, subgroup: str) -> set:
@@ -166,52 +673,453 @@ class Channel:
         """
         return self.__decode_set(self.channel.smembers(subgroup))
 
-    @staticmethod
-    def __queue_key(sender: str, receiver: str) -> str:
+    def in_subgroup(self, subgroup: str, pid: str) -> bool:
+        """
+        Check if a member belongs to a subgroup (without retrieving the subgroup).
+        :param subgroup: subgroup string identifier
+        :param pid: member identifier
+        :return: boolean value, true if pid is in the subgroup
         """
-        Construct queue name from sender and receiver ids.
-        :param sender: member identifier
-        :param receiver: member identifier
-        :return: redis key
+        return bool(self.channel.sismember(subgroup, str(pid)))
+
+    def __push(self, caller: str, destinations: list, parts: list, atomic: bool, ttl: float, lane: int) -> None:
+        """
+        Push a serialized message to the incoming queues of a list of destinations in a single pipeline
+        (or a single script call for bounded queues or expiring messages, which is always atomic).
+        :param caller: member identifier of the sender
+        :param destinations: list of member identifiers
+        :param parts: serialized message as list of buffers (see lab_codec.Codec.dumps_parts)
+        :param atomic: if true, the pipeline is wrapped in MULTI/EXEC and the multicast is applied all-or-nothing
+        :param ttl: time to live of the message in seconds (None: channel default, 0: never expires)
+        :param lane: priority lane
+        :return: None
         """
-        return str([sender, receiver])
+        assert 0 <= lane < self.options.lanes, 'unknown priority lane'
+        ttl = self.options.ttl if ttl is None else ttl
+        size: int = sum(memoryview(part).nbytes for part in parts)
+        if ttl or (self.options.maxlen and (self.options.overflow != 'drop_oldest' or self.mode != 'stream')):
+            self.__push_bounded(caller, destinations, b''.join(parts), ttl, lane)
+        else:
+            self.__push_pipeline(caller, destinations, parts, atomic, lane)
+        self.metrics.inc('messages_sent_total', len(destinations))
+        self.metrics.inc('bytes_sent_total', size * len(destinations))
 
-    def send_to(self, destination_set: set, message: object) -> None:
+    def __push_pipeline(self, caller: str, destinations: list, parts: list, atomic: bool, lane: int) -> None:
+        """
+        Push a serialized message to the incoming queues of a list of destinations in a single pipeline.
+        Large messages are split into frames ('queue' and 'inbox' mode). The message never expires, so
+        the lists are made persistent (an expiring message sent before must not take it along).
+        :param caller: member identifier of the sender
+        :param destinations: list of member identifiers
+        :param parts: serialized message as list of buffers
+        :param atomic: if true, the pipeline is wrapped in MULTI/EXEC
+        :param lane: priority lane
+        :return: None
+        """
+        with self.channel.pipeline(transaction=atomic) as pipe:
+            if self.mode == 'inbox':
+                elements: list = split([wrap(caller, b'')] + parts, self.options.chunk_size)
+                for destination in destinations:
+                    pipe.rpush(inbox_key(destination, lane), *elements)
+                    pipe.persist(inbox_key(destination, lane))
+            elif self.mode == 'stream':
+                payload: bytes = b''.join(parts)
+                for destination in destinations:
+                    pipe.xadd(stream_key(destination), {'s': caller, 'm': payload},
+                              maxlen=self.options.maxlen, approximate=True)
+            else:
+                elements: list = split(parts, self.options.chunk_size)
+                for destination in destinations:
+                    pipe.rpush(queue_key(caller, destination, lane), *elements)
+                    pipe.persist(queue_key(caller, destination, lane))
+            pipe.execute()
+
+    def __reassemble(self, key: str, header: bytes, frames: list):
+        """
+        Reassemble a chunked message into a preallocated buffer.
+        Frames that have not been taken off the list yet are popped in batches.
+        :param key: list the message was taken from
+        :param header: header element of the message
+        :param frames: frames of the message already taken off the list (in order)
+        :return: memoryview of the message or None if frames are missing
+        """
+        _, count, total = CHUNK_HEADER.unpack_from(header)
+        buffer: bytearray = bytearray(total)
+        pos: int = 0
+        for frame in frames:
+            buffer[pos:pos + len(frame)] = frame
+            pos += len(frame)
+        missing: int = count - len(frames)
+        while missing > 0:
+            # a few frames per round trip keep the memory overhead bounded
+            batch = self.channel.lpop(key, min(missing, 8))
+            if not batch:
+                self.logger.warning("Discarding incomplete message from %s", key)
+                return None
+            for frame in batch:
+                buffer[pos:pos + len(frame)] = frame
+                pos += len(frame)
+            missing -= len(batch)
+        return memoryview(buffer)
+
+    def __push_bounded(self, caller: str, destinations: list, payload: bytes, ttl: float, lane: int) -> None:
+        """
+        Push a serialized message to the incoming queues of a list of destinations by a script that
+        applies the queue length limit and the message expiry.
+        :param caller: member identifier of the sender
+        :param destinations: list of member identifiers
+        :param payload: serialized message
+        :param ttl: time to live of the message in seconds (0 or None: never expires)
+        :param lane: priority lane
+        :return: None
+        """
+        expires = time.time() + ttl if ttl else None
+        maxlen: int = self.options.maxlen or 0
+        # 'block' is 'reject' retried with backoff until all queues have room
+        policy: str = 'drop_oldest' if self.options.overflow == 'drop_oldest' else 'reject'
+        if self.mode == 'stream':
+            keys: list = [stream_key(destination) for destination in destinations]
+            args: list = [caller, payload, maxlen, policy, repr(expires) if expires is not None else '']
+            script = self.__xadd_script
+        else:
+            if self.mode == 'inbox':
+                keys: list = [inbox_key(destination, lane) for destination in destinations]
+                message: bytes = wrap(caller, payload, expires)
+            else:
+                keys: list = [queue_key(caller, destination, lane) for destination in destinations]
+                message: bytes = stamp(payload, expires)
+            args: list = [message, maxlen, policy, int(ttl * 1000) if ttl else 0]
+            script = self.__push_script
+
+        start: float = time.monotonic()
+        delay: float = 0.001
+        while True:
+            full: int = script(keys=keys, args=args)
+            if full == 0:
+                break
+            block_timeout = self.options.block_timeout
+            if self.options.overflow == 'reject' or (block_timeout is not None
+                                                     and time.monotonic() - start >= block_timeout):
+                self.metrics.inc('messages_rejected_total', len(destinations))
+                raise QueueFull(keys[full - 1])
+            # wait for the receiver to catch up
+            time.sleep(delay)
+            delay = min(2 * delay, 0.1)
+        if self.options.overflow == 'block':
+            self.metrics.observe('send_blocked_seconds', time.monotonic() - start)
+
+    def __expired(self, expires) -> bool:
+        """
+        Check whether a received message has expired (and count it).
+        :param expires: expiry time of the message or None
+        :return: true if the message is to be discarded
+        """
+        if expires is None or expires >= time.time():
+            return False
+        self.metrics.inc('messages_expired_total')
+        return True
+
+    def __in_queues(self, caller: str, senders) -> list:
+        """
+        Construct the incoming queue keys of the caller, higher priority lanes first
+        (BLPOP serves the first non-empty key).
+        :param caller: member identifier of the receiver
+        :param senders: iterable of sender ids
+        :return: list of queue keys
+        """
+        return [queue_key(sender, caller, lane) for lane in reversed(range(self.options.lanes)) for sender in senders]
+
+    def __inboxes(self, caller: str) -> list:
+        """
+        Construct the inbox keys of the caller, higher priority lanes first ('inbox' mode).
+        :param caller: member identifier of the receiver
+        :return: list of inbox keys
+        """
+        return [inbox_key(caller, lane) for lane in reversed(range(self.options.lanes))]
+
+    def __pop(self, in_queues: list, timeout: float) -> tuple:
+        """
+        Block until a message appears on one of the given pairwise queues and take it off.
+        :param in_queues: list of queue keys, queues listed first are served first
+        :param timeout: timeout for blocking read (0 blocks forever)
+        :return: tuple of sender id and message or None on timeout
+        """
+        deadline: float = time.monotonic() + timeout
+        while True:
+            remaining: float = 0
+            if timeout > 0:
+                remaining = remaining_timeout(deadline)
+                if remaining is None:
+                    return None
+            start: float = time.perf_counter()
+            result = self.channel.blpop(in_queues, remaining)
+            self.metrics.observe('receive_wait_seconds', time.perf_counter() - start)
+            if result is None:
+                return None
+            # extract sender id from key part
+            key: str = result[0].decode()
+            raw = result[1]
+            if raw[0] == CHUNK:
+                raw = self.__reassemble(key, raw, [])
+                if raw is None:
+                    continue
+            payload, expires = unstamp(raw)
+            if self.__expired(expires):
+                continue
+            sender: str = queue_sender(key)
+            # deserialize msg content
+            return sender, self.__decode(payload)
+
+    def __pop_inbox(self, caller: str, sender_set, timeout: float) -> tuple:
+        """
+        Take the next message from a set of senders off the caller's inbox ('inbox' and 'stream' mode).
+        Messages from other senders are stashed for later receive calls.
+        :param caller: member identifier of the receiver
+        :param sender_set: set of sender ids to accept or None to accept any sender
+        :param timeout: timeout for blocking read (0 blocks forever)
+        :return: tuple of sender id and message or None on timeout
+        """
+        stash: deque = self.stash.setdefault(caller, deque())
+        deadline: float = time.monotonic() + timeout
+        start: int = 0
+        while True:
+            # serve stashed messages first, in order of arrival
+            for i in range(start, len(stash)):
+                sender, message, entry = stash[i]
+                if sender_set is None or sender in sender_set:
+                    del stash[i]
+                    if entry is not None:
+                        # acknowledge the entry with the next read
+                        self.unacked.setdefault(caller, []).append(entry)
+                    return sender, message
+            start = len(stash)
+
+            remaining: float = 0
+            if timeout > 0:
+                remaining = remaining_timeout(deadline)
+                if remaining is None:
+                    return None
+            records = self.__fetch(caller, remaining)
+            if records is None:
+                return None
+            stash.extend(records)
+
+    def __fetch(self, caller: str, timeout: float) -> list:
+        """
+        Block until messages appear in the caller's inbox and read them ('inbox' and 'stream' mode).
+        :param caller: member identifier of the receiver
+        :param timeout: timeout for blocking read (0 blocks forever)
+        :return: list of (sender, message, entry) records, entry is the (key, id) pair of a stream entry or None,
+                 (the list is empty if all messages read had expired), None on timeout
+        """
+        if self.mode == 'inbox':
+            start: float = time.perf_counter()
+            result = self.channel.blpop(self.__inboxes(caller), timeout)
+            self.metrics.observe('receive_wait_seconds', time.perf_counter() - start)
+            if result is None:
+                return None
+            envelope = result[1]
+            if envelope[0] == CHUNK:
+                envelope = self.__reassemble(result[0].decode(), envelope, [])
+                if envelope is None:
+                    return []
+            sender, payload, expires = unwrap(envelope)
+            if self.__expired(expires):
+                return []
+            return [(sender, self.__decode(payload), None)]
+
+        key: str = stream_key(caller)
+        if caller not in self.recovered:
+            # a member bound to this id before might have crashed: re-deliver its pending entries first
+            self.recovered.add(caller)
+            entries, last = [], '0'
+            while True:
+                more: list = self.__read_stream(caller, key, last)
+                if not more:
+                    break
+                entries, last = entries + more, more[-1][0]
+            if entries:
+                return self.__records(caller, key, entries)
+        entries: list = self.__read_stream(caller, key, '>', timeout)
+        if not entries:
+            return None
+        return self.__records(caller, key, entries)
+
+    def __read_stream(self, caller: str, key: str, start: str, timeout: float = None) -> list:
+        """
+        Read entries from an inbox stream via the consumer group, acknowledging entries delivered before.
+        :param caller: member identifier of the consumer
+        :param key: stream key
+        :param start: '>' for new entries or an entry id to read the caller's pending entries after it
+        :param timeout: timeout for blocking read (0 blocks forever, None does not block)
+        :return: list of (id, fields) stream entries
+        """
+        block = None
+        if timeout is not None:
+            block = max(int(timeout * 1000), 1) if timeout > 0 else 0
+        began: float = time.perf_counter()
+        with self.channel.pipeline(transaction=False) as pipe:
+            self.__queue_acks(pipe, caller)
+            pipe.xreadgroup(self.GROUP, caller, {key: start}, count=self.batch, block=block)
+            response = pipe.execute()[-1]
+        self.metrics.observe('receive_wait_seconds', time.perf_counter() - began)
+        return response[0][1] if response else []
+
+    def __records(self, caller: str, key: str, entries: list) -> list:
+        """
+        Decode stream entries to (sender, message, entry) records.
+        Deleted (trimmed) and expired entries are acknowledged right away.
+        :param caller: member identifier of the consumer
+        :param key: stream key
+        :param entries: list of (id, fields) stream entries
+        :return: list of (sender, message, entry) records
+        """
+        records: list = []
+        for entry_id, fields in entries:
+            if not fields or (b'e' in fields and self.__expired(float(fields[b'e']))):
+                self.unacked.setdefault(caller, []).append((key, entry_id))
+                continue
+            records.append((fields[b's'].decode(), self.__decode(fields[b'm']), (key, entry_id)))
+        return records
+
+    def __queue_acks(self, pipe, caller: str) -> None:
+        """
+        Add acknowledgements of all delivered stream entries of a member to a pipeline.
+        Acknowledged entries are deleted, so the stream length is the number of unprocessed messages.
+        :param pipe: redis pipeline
+        :param caller: member identifier of the consumer
+        :return: None
+        """
+        entries: list = self.unacked.pop(caller, [])
+        keys: dict = {}
+        for key, entry_id in entries:
+            keys.setdefault(key, []).append(entry_id)
+        for key, ids in keys.items():
+            pipe.xack(key, self.GROUP, *ids)
+            pipe.xdel(key, *ids)
+
+    def ack(self) -> None:
+        """
+        Acknowledge all stream entries received by the caller so far ('stream' mode).
+        Without calling ack(), entries are acknowledged by the next receive call that reads from redis.
+        :return: None
+        """
+        caller: str = self.os_members[os.getpid()]
+        with self.channel.pipeline(transaction=False) as pipe:
+            self.__queue_acks(pipe, caller)
+            pipe.execute()
+
+    def reclaim(self, pid: str, min_idle_time: int = 10000) -> list:
+        """
+        Take over the unacknowledged messages of a (crashed) member ('stream' mode).
+        All entries of the member's stream that are pending for at least min_idle_time are
+        transferred to the caller. They are acknowledged by the caller's next receive call or ack().
+        :param pid: member identifier of the crashed member
+        :param min_idle_time: minimum time in ms since the entries were delivered
+        :return: list of (sender, message) tuples
+        """
+        assert self.mode == 'stream', 'reclaim requires stream mode'
+        caller: str = self.os_members[os.getpid()]
+        key: str = stream_key(pid)
+        cursor, entries = b'0-0', []
+        while True:
+            response = self.channel.xautoclaim(key, self.GROUP, caller, min_idle_time,
+                                               start_id=cursor, count=self.batch)
+            cursor, entries = response[0], entries + response[1]
+            if cursor == b'0-0':
+                break
+        records: list = self.__records(caller, key, entries)
+        self.unacked.setdefault(caller, []).extend(entry for _, _, entry in records)
+        self.logger.info("%s reclaimed %s messages of %s", caller, len(records), pid)
+        return [(sender, message) for sender, message, _ in records]
+
+    def send_to(self, destination_set: set, message: object, atomic: bool = False, ttl: float = None,
+                priority: int = 0) -> None:
         """
         Sends an asynchronous, persistent multicast message.
+        Sender and receivers are validated in one pipelined round trip
+        and the message is pushed to all receivers in one pipelined round trip.
         :param destination_set: a set of member identifiers
         :param message: the message object to be send (see 'message format' in class doc)
+        :param atomic: deliver the multicast atomically (MULTI/EXEC)
+        :param ttl: time to live of the message in seconds (None: channel default, 0: never expires)
+        :param priority: priority lane of the message (0 ... lanes - 1, higher lanes are received first)
         :return: None
         """
+        start: float = time.perf_counter()
+        destinations: list = list(destination_set)
         # destination_set needs to contain string identifiers
-        assert all(type(k) is str for k in destination_set), 'type error'
+        assert all(type(k) is str for k in destinations), 'type error'
 
-        # lookup member id by pid and validate it
+        # lookup member id by pid and validate it together with all destinations
         caller: str = self.os_members[os.getpid()]
-        assert self.channel.sismember('members', caller), 'unknown sender'
-        self.logger.debug("{} sends {} to {}".format(caller, message, destination_set))
+        known: list = self.__known([caller] + destinations)
+        assert known[0], 'unknown sender'
+        assert all(known[1:]), 'unknown receiver'
+        self.logger.debug("%s sends %s to %s", caller, message, destination_set)
 
         # push message to incoming queues of all destinations
-        for destination in destination_set:
-            assert self.channel.sismember('members', destination), 'unknown receiver'
-            self.channel.rpush(self.__queue_key(caller, destination), pickle.dumps(message))
+        self.__push(caller, destinations, self.__encode(message), atomic, ttl, priority)
+        self.metrics.observe('op_seconds', time.perf_counter() - start, op='send_to')
 
-    def send_to_all(self, message: object) -> None:
+    def send_to_all(self, message: object, atomic: bool = False, ttl: float = None, priority: int = 0) -> None:
         """
         Sends an asynchronous, persistent broadcast message.
         The message is delivered to all queues of currently registered members.
         :param message: the message object to be send
+        :param atomic: deliver the broadcast atomically (MULTI/EXEC)
+        :param ttl: time to live of the message in seconds (None: channel default, 0: never expires)
+        :param priority: priority lane of the message (0 ... lanes - 1, higher lanes are received first)
         :return: None
         """
-        # lookup member id by pid and validate it
+        # lookup member id by pid and validate it against all members
+        start: float = time.perf_counter()
         caller: str = self.os_members[os.getpid()]
-        assert self.channel.sismember('members', caller), 'unknown sender'
-        self.logger.debug("{} sends {} to all members".format(caller, message))
+        members: set = self.__members()
+        assert caller in members or self.__known([caller])[0], 'unknown sender'
+        self.logger.debug("%s sends %s to all members", caller, message)
 
-        members = self.__decode_set(self.channel.smembers('members'))
-        # push message to incoming queues of all members
-        for destination in members:
-            self.channel.rpush([self.__queue_key(caller, destination)], pickle.dumps(message))
+        # serialize once and push message to incoming queues of all members
+        self.__push(caller, list(members), self.__encode(message), atomic, ttl, priority)
+        self.metrics.observe('op_seconds', time.perf_counter() - start, op='send_to_all')
+
+    def __received(self, op: str, start: float, result) -> None:
+        """
+        Record the duration of a receive call and count the received message.
+        :param op: operation name
+        :param start: start time (time.perf_counter())
+        :param result: received (sender, message) tuple or None on timeout
+        :return: None
+        """
+        self.metrics.observe('op_seconds', time.perf_counter() - start, op=op)
+        if result is not None:
+            self.metrics.inc('messages_received_total')
+
+    def sample_queue_depths(self, pid: str = None) -> dict:
+        """
+        Sample the number of messages waiting for a member and report them as 'queue_depth' gauges.
+        :param pid: member identifier (default: the caller)
+        :return: dict of queue (or inbox/stream) keys and their lengths
+        """
+        if pid is None:
+            pid = self.os_members[os.getpid()]
+        if self.mode == 'inbox':
+            keys: list = self.__inboxes(pid)
+        elif self.mode == 'stream':
+            keys: list = [stream_key(pid)]
+        else:
+            senders: list = sorted(self.__decode_set(self.channel.smembers('xchan:' + pid)))
+            keys: list = self.__in_queues(pid, senders)
+        with self.channel.pipeline(transaction=False) as pipe:
+            for key in keys:
+                if self.mode == 'stream':
+                    pipe.xlen(key)
+                else:
+                    pipe.llen(key)
+            depths: dict = dict(zip(keys, pipe.execute()))
+        for key, depth in depths.items():
+            self.metrics.set('queue_depth', depth, queue=key)
+        return depths
 
     def receive_from_any(self, timeout: int = 0) -> tuple:
         """
@@ -220,25 +1128,27 @@ class Channel:
         :return: list containing the queue name and message
         """
         # lookup member id by pid and validate it
+        start: float = time.perf_counter()
         caller = self.os_members[os.getpid()]
-        assert self.channel.sismember('members', str(caller)), 'unknown receiver'
+        if self.mode != 'queue':
+            assert self.__known([caller])[0], 'unknown receiver'
+            self.logger.debug("%s receives from its inbox", caller)
+            result = self.__pop_inbox(caller, None, timeout)
+        else:
+            members: set = self.__members()
+            assert caller in members or self.__known([caller])[0], 'unknown receiver'
 
-        # decode member set binary elements
-        members: set = self.__decode_set(self.channel.smembers('members'))
-        # construct incoming message queues for all members
-        in_queues: set = {self.__queue_key(member, caller) for member in members}
-        self.logger.debug("{} receives from {}".format(caller, in_queues))
+            # construct incoming message queues for all members
+            in_queues: list = self.__in_queues(caller, members)
+            self.logger.debug("%s receives from %s", caller, in_queues)
 
-        # block until new msg appears on one of the incoming queues
-        result = self.channel.blpop(in_queues, timeout)
+            # block until new msg appears on one of the incoming queues
+            result = self.__pop(in_queues, timeout)
+        self.__received('receive_from_any', start, result)
         if result is not None:
-            # extract sender id from key part
-            key: str = result[0].decode()
-            sender: str = key.split("'")[1]
-            # deserialize msg content
-            message = pickle.loads(result[1])
+            sender, message = result
             # log and return results
-            self.logger.debug("{} received {} from {}".format(caller, message, sender))
+            self.logger.debug("%s received %s from %s", caller, message, sender)
             return sender, message
 
     def receive_from(self, sender_set: set, timeout: int = 0) -> tuple:
@@ -252,24 +1162,140 @@ class Channel:
         assert (type(k) is str for k in sender_set), 'Address type mismatch.'
 
         # lookup member id by pid and validate it
+        start: float = time.perf_counter()
         caller: str = self.os_members[os.getpid()]
-        assert self.channel.sismember('members', caller), 'unknown receiver'
-        self.logger.debug("{} receives from {}".format(caller, sender_set))
+        senders: list = list(sender_set)
+        known: list = self.__known([caller] + senders)
+        assert known[0], 'unknown receiver'
+        assert all(known[1:]), 'unknown sender'
+        self.logger.debug("%s receives from %s", caller, sender_set)
 
-        # validate all senders and construct incoming queues for them
-        in_queues: set = set()
-        for sender in sender_set:
-            assert self.channel.sismember('members', sender), 'unknown sender'
-            in_queues.add(self.__queue_key(sender, caller))
+        if self.mode != 'queue':
+            # filter the inbox for messages from the senders
+            result = self.__pop_inbox(caller, set(senders), timeout)
+        else:
+            # construct incoming queues for all senders
+            in_queues: list = self.__in_queues(caller, senders)
 
-        # block until new msg appears on one of the queues
-        result = self.channel.blpop(in_queues, timeout)
+            # block until new msg appears on one of the queues
+            result = self.__pop(in_queues, timeout)
+        self.__received('receive_from', start, result)
         if result is not None:
-            # extract sender id from key part
-            key: str = result[0].decode()
-            sender: str = key.split("'")[1]
-            # deserialize msg content
-            message = pickle.loads(result[1])
+            sender, message = result
             # log and return results
-            self.logger.debug("{} received {} from {}".format(caller, message, sender))
+            self.logger.debug("%s received %s from %s", caller, message, sender)
             return sender, message
+
+    def receive_many(self, sender_set: set = None, max_count: int = 100, timeout: int = 0) -> list:
+        """
+        Make a blocking call to take up to max_count messages off the callers' queues.
+        The call blocks until a first message arrives and then drains messages that are already
+        queued without blocking again ('queue' mode: one script call across all incoming queues).
+        :param sender_set: set of ids to receive messages from, None for any member
+        :param max_count: maximum number of messages to return
+        :param timeout: optional timeout for blocking call
+        :return: list of (sender, message) tuples, empty on timeout
+        """
+        # lookup member id by pid and validate it (and the senders)
+        start: float = time.perf_counter()
+        caller: str = self.os_members[os.getpid()]
+        senders: list = list(sender_set) if sender_set is not None else []
+        known: list = self.__known([caller] + senders)
+        assert known[0], 'unknown receiver'
+        assert all(known[1:]), 'unknown sender'
+        self.logger.debug("%s receives up to %s messages from %s",
+                          caller, max_count, 'any' if sender_set is None else sender_set)
+
+        if self.mode != 'queue':
+            result: list = self.__pop_inbox_many(caller, None if sender_set is None else set(senders),
+                                                 max_count, timeout)
+        else:
+            if sender_set is None:
+                senders = list(self.__members())
+            in_queues: list = self.__in_queues(caller, senders)
+            result: list = self.__pop_many(in_queues, max_count, timeout)
+        self.metrics.observe('op_seconds', time.perf_counter() - start, op='receive_many')
+        self.metrics.inc('messages_received_total', len(result))
+        self.logger.debug("%s received %s messages", caller, len(result))
+        return result
+
+    def __pop_many(self, in_queues: list, max_count: int, timeout: float) -> list:
+        """
+        Block until a message appears on one of the given pairwise queues, then drain further
+        messages up to max_count from all queues in one atomic script call (peeking and trimming
+        in separate round trips could lose or duplicate messages of competing receivers).
+        :param in_queues: list of queue keys
+        :param max_count: maximum number of messages
+        :param timeout: timeout for blocking read (0 blocks forever)
+        :return: list of (sender, message) tuples
+        """
+        first = self.__pop(in_queues, timeout)
+        if first is None:
+            return []
+        result: list = [first]
+        if max_count <= 1:
+            return result
+
+        # take messages up to max_count off the queues, chunked messages are left for later receive calls
+        taken: list = self.__pop_many_script(keys=in_queues, args=[max_count - 1])
+        for key, raw_messages in zip(in_queues, taken):
+            sender: str = queue_sender(key)
+            for raw in raw_messages:
+                payload, expires = unstamp(raw)
+                if not self.__expired(expires):
+                    result.append((sender, self.__decode(payload)))
+        return result
+
+    def __pop_inbox_many(self, caller: str, sender_set, max_count: int, timeout: float) -> list:
+        """
+        Take up to max_count messages from a set of senders off the caller's inbox ('inbox' and 'stream' mode).
+        :param caller: member identifier of the receiver
+        :param sender_set: set of sender ids to accept or None to accept any sender
+        :param max_count: maximum number of messages
+        :param timeout: timeout for blocking read (0 blocks forever)
+        :return: list of (sender, message) tuples
+        """
+        first = self.__pop_inbox(caller, sender_set, timeout)
+        if first is None:
+            return []
+        result: list = [first]
+        stash: deque = self.stash[caller]
+
+        # drain messages that are already in the inbox without blocking (higher priority lanes first)
+        if self.mode == 'inbox':
+            budget: int = max_count - 1
+            for key in self.__inboxes(caller):
+                if budget <= 0:
+                    break
+                raw_messages = self.channel.lpop(key, budget) or []
+                budget -= len(raw_messages)
+                i: int = 0
+                while i < len(raw_messages):
+                    envelope = raw_messages[i]
+                    i += 1
+                    if envelope[0] == CHUNK:
+                        # frames popped along with the header are passed on, the others are popped now
+                        frames: list = raw_messages[i:i + CHUNK_HEADER.unpack_from(envelope)[1]]
+                        i += len(frames)
+                        envelope = self.__reassemble(key, envelope, frames)
+                        if envelope is None:
+                            continue
+                    sender, payload, expires = unwrap(envelope)
+                    if not self.__expired(expires):
+                        stash.append((sender, self.__decode(payload), None))
+        else:
+            key: str = stream_key(caller)
+            stash.extend(self.__records(caller, key, self.__read_stream(caller, key, '>')))
+
+        # take matching messages off the stash, keep the others in order
+        keep: deque = deque()
+        for record in stash:
+            sender, message, entry = record
+            if len(result) < max_count and (sender_set is None or sender in sender_set):
+                result.append((sender, message))
+                if entry is not None:
+                    self.unacked.setdefault(caller, []).append(entry)
+            else:
+                keep.append(record)
+        self.stash[caller] = keep
+        return result
@@ -0,0 +1,821 @@
+import logging
+import os
+import random
+import struct
+import threading
+import time
+import multiprocessing
+from collections import deque
+from multiprocessing import shared_memory
+
+from lib import lab_codec
+from lib.lab_wire import wrap, unwrap
+
+
+class LocalHub:
+    """
+    LocalHub holds the state of an in-process channel: members, subgroups, free member ids and
+    message queues. All LocalChannel instances on the same hub form one channel.
+    The state is protected by a single lock. Every member has a condition on that lock, which is
+    notified when a message is put into one of its queues.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # global member set and subgroup member sets
+        self.members: set = set()
+        self.subgroups: dict = {}
+        # pools of free member ids by MAXPROC: list for random picks, set for lookups
+        self.pools: dict = {}
+        # incoming queues per member: {receiver: {sender: deque of (message, expiry time) tuples}}
+        self.queues: dict = {}
+        # condition per member, notified on new messages
+        self.ready: dict = {}
+
+    def flush(self) -> None:
+        """
+        Remove all members and messages (e.g. before a new simulation run).
+        :return: None
+        """
+        with self.lock:
+            self.members.clear()
+            self.subgroups.clear()
+            self.pools.clear()
+            self.queues.clear()
+            self.ready.clear()
+
+    def take_id(self, size: int):
+        """
+        Take a random free member id off the pool for an id range (caller holds the lock).
+        :param size: number of ids (MAXPROC)
+        :return: member id or None if all ids are taken
+        """
+        if size not in self.pools:
+            self.pools[size] = ([str(i) for i in range(size)], {str(i) for i in range(size)})
+        free, pooled = self.pools[size]
+        while free:
+            # swap a random id to the end and take it off
+            i: int = random.randrange(len(free))
+            free[i], free[-1] = free[-1], free[i]
+            pid: str = free.pop()
+            pooled.discard(pid)
+            # ids taken via a pool of another size are skipped
+            if pid not in self.members:
+                return pid
+        return None
+
+    def return_id(self, pid: str) -> None:
+        """
+        Return a member id to all pools covering it (caller holds the lock).
+        :param pid: member id
+        :return: None
+        """
+        for size, (free, pooled) in self.pools.items():
+            if int(pid) < size and pid not in pooled:
+                free.append(pid)
+                pooled.add(pid)
+
+
+# default hub of the process
+LOCAL_HUB = LocalHub()
+
+
+class LocalChannel:
+    """
+    LocalChannel is an in-process channel backend with the API of lab_channel.Channel.
+    Members are threads of one process, there is no redis server and no socket round trip.
+
+    Members join and obtain an identifier like with Channel. Other than Channel, bind() associates
+    the calling thread (not the os process) with a member id, so a single LocalChannel instance can
+    be shared by all threads. Channels on the same hub (default: the process-wide LOCAL_HUB) form
+    one channel.
+
+    Every member has one queue per sender. Messages are kept in arrival order per sender, a receive
+    call from several senders serves them round-robin. Messages may expire (ttl), multicasts are
+    always delivered atomically. Priority lanes are not supported.
+
+    By default messages are passed by reference without serialization, so senders must not modify
+    a message after sending it. With a serializer (see lab_codec), messages are copied by encoding
+    them like Channel does.
+
+    Example:
+
+        chan = LocalChannel()
+        def member():
+            chan.bind(chan.join('peer'))
+            ...
+        threads = [threading.Thread(target=member) for _ in range(8)]
+    """
+
+    def __init__(self, n_bits: int = 5, hub: LocalHub = None, serializer: str = None, accept: set = None):
+        # shared channel state
+        self.hub: LocalHub = hub if hub is not None else LOCAL_HUB
+        # create dict of local thread bindings
+        self.thread_members = {}
+        # Number of bits for pid addresses
+        self.n_bits: int = n_bits
+        # Maximum corresponding pid
+        self.MAXPROC: int = pow(2, n_bits)
+        # codec for messages (None: pass by reference) and names of accepted codecs
+        self.codec = lab_codec.get(serializer) if serializer is not None else None
+        self.accept = accept
+        # create instance logger
+        self.logger = logging.getLogger('vs2lab.channel.LocalChannel')
+        self.logger.debug('New LocalChannel created.')
+
+    def close(self) -> None:
+        """
+        Nothing to release, for compatibility with Channel.
+        :return: None
+        """
+
+    def __encode(self, message: object) -> object:
+        if self.codec is None:
+            return message
+        return self.codec.dumps(message)
+
+    def __decode(self, raw: object) -> object:
+        if self.codec is None:
+            return raw
+        return lab_codec.loads(raw, self.accept)
+
+    def __caller(self) -> str:
+        return self.thread_members[threading.get_ident()]
+
+    def join(self, subgroup: str) -> str:
+        """
+        Join a thread as a member to the channel and associate it with a (sub)group.
+        :param subgroup: an identifier for the grouping
+        :return: member id
+        """
+        hub: LocalHub = self.hub
+        with hub.lock:
+            new_pid = hub.take_id(self.MAXPROC)
+            assert new_pid is not None, 'no free member id'
+            hub.members.add(new_pid)
+            hub.subgroups.setdefault(subgroup, set()).add(new_pid)
+            hub.queues[new_pid] = {}
+            hub.ready[new_pid] = threading.Condition(hub.lock)
+        self.logger.info("Member %s joining %s.", new_pid, subgroup)
+        return new_pid
+
+    def leave(self, subgroup: str) -> None:
+        """
+        Unregister the calling thread's member from the channel (and subgroup).
+        Its incoming queues are dropped, messages it sent remain queued.
+        :param subgroup: subgroup identifier
+        :return: None
+        """
+        hub: LocalHub = self.hub
+        pid: str = self.thread_members.pop(threading.get_ident())
+        with hub.lock:
+            assert pid in hub.members, 'member unknown'
+            hub.members.discard(pid)
+            hub.subgroups.get(subgroup, set()).discard(pid)
+            del hub.queues[pid]
+            del hub.ready[pid]
+            hub.return_id(pid)
+        self.logger.info("Member %s leaving %s", pid, subgroup)
+
+    def exists(self, pid: str) -> bool:
+        """
+        Check if pid is in global member set
+        :param pid: process identifier
+        :return: boolean value, true if pid is a member
+        """
+        return str(pid) in self.hub.members
+
+    def bind(self, pid: str) -> int:
+        """
+        Associate the calling thread with a channel member id.
+        :param pid: identifier of member
+        :return: thread id
+        """
+        ident: int = threading.get_ident()
+        self.thread_members[ident] = pid
+        self.logger.debug("Member %s bound %s", pid, ident)
+        return ident
+
+    def subgroup(self, subgroup: str) -> set:
+        """
+        Retrieve members of a subgroup.
+        :param subgroup: subgroup string identifier
+        :return: set of member identifiers
+        """
+        with self.hub.lock:
+            return set(self.hub.subgroups.get(subgroup, ()))
+
+    def in_subgroup(self, subgroup: str, pid: str) -> bool:
+        """
+        Check if a member belongs to a subgroup (without copying the subgroup).
+        :param subgroup: subgroup string identifier
+        :param pid: member identifier
+        :return: boolean value, true if pid is in the subgroup
+        """
+        with self.hub.lock:
+            return str(pid) in self.hub.subgroups.get(subgroup, ())
+
+    def __push(self, caller: str, destinations: list, message: object, ttl: float) -> None:
+        # caller holds the lock: the multicast is atomic
+        hub: LocalHub = self.hub
+        entry: tuple = (self.__encode(message), time.time() + ttl if ttl else None)
+        for destination in destinations:
+            queues: dict = hub.queues[destination]
+            if caller not in queues:
+                queues[caller] = deque()
+            queues[caller].append(entry)
+            hub.ready[destination].notify_all()
+
+    def send_to(self, destination_set: set, message: object, atomic: bool = False, ttl: float = None,
+                priority: int = 0) -> None:
+        """
+        Sends an asynchronous multicast message (always delivered atomically).
+        :param destination_set: a set of member identifiers
+        :param message: the message object to be send
+        :param atomic: for compatibility with Channel
+        :param ttl: time to live of the message in seconds (0 or None: never expires)
+        :param priority: for compatibility with Channel, only the default lane 0
+        :return: None
+        """
+        assert priority == 0, 'priority lanes not supported by LocalChannel'
+        destinations: list = list(destination_set)
+        assert all(type(k) is str for k in destinations), 'type error'
+        caller: str = self.__caller()
+        with self.hub.lock:
+            assert caller in self.hub.members, 'unknown sender'
+            assert all(k in self.hub.members for k in destinations), 'unknown receiver'
+            self.__push(caller, destinations, message, ttl)
+        self.logger.debug("%s sends %s to %s", caller, message, destination_set)
+
+    def send_to_all(self, message: object, atomic: bool = False, ttl: float = None, priority: int = 0) -> None:
+        """
+        Sends an asynchronous broadcast message to all members (always delivered atomically).
+        :param message: the message object to be send
+        :param atomic: for compatibility with Channel
+        :param ttl: time to live of the message in seconds (0 or None: never expires)
+        :param priority: for compatibility with Channel, only the default lane 0
+        :return: None
+        """
+        assert priority == 0, 'priority lanes not supported by LocalChannel'
+        caller: str = self.__caller()
+        with self.hub.lock:
+            assert caller in self.hub.members, 'unknown sender'
+            self.__push(caller, list(self.hub.members), message, ttl)
+        self.logger.debug("%s sends %s to all members", caller, message)
+
+    def __take(self, caller: str, sender_set, max_count: int, timeout: float) -> list:
+        """
+        Block until messages from a set of senders are queued for the caller and take them off.
+        :param caller: member identifier of the receiver
+        :param sender_set: set of sender ids or None for any sender
+        :param max_count: maximum number of messages
+        :param timeout: timeout for blocking read (0 blocks forever)
+        :return: list of (sender, message) tuples, empty on timeout
+        """
+        hub: LocalHub = self.hub
+        deadline: float = time.monotonic() + timeout
+        with hub.lock:
+            assert caller in hub.members, 'unknown receiver'
+            queues: dict = hub.queues[caller]
+            ready: threading.Condition = hub.ready[caller]
+            while True:
+                result: list = []
+                for sender in list(sender_set if sender_set is not None else queues):
+                    queue = queues.get(sender)
+                    while queue and len(result) < max_count:
+                        payload, expires = queue.popleft()
+                        # expired messages are discarded
+                        if expires is None or expires >= time.time():
+                            result.append((sender, self.__decode(payload)))
+                    if queue is not None and sender_set is None:
+                        # move served sender to the end (round-robin between senders)
+                        del queues[sender]
+                        queues[sender] = queue
+                    if len(result) >= max_count:
+                        break
+                if result:
+                    return result
+                remaining = None
+                if timeout > 0:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return []
+                ready.wait(remaining)
+
+    def receive_from_any(self, timeout: int = 0) -> tuple:
+        """
+        Make a blocking request to take the next message off any of the callers' incoming queues.
+        :param timeout: optional timeout for blocking read.
+        :return: tuple of sender id and message or None on timeout
+        """
+        caller: str = self.__caller()
+        result: list = self.__take(caller, None, 1, timeout)
+        if result:
+            self.logger.debug("%s received %s from %s", caller, result[0][1], result[0][0])
+            return result[0]
+
+    def receive_from(self, sender_set: set, timeout: int = 0) -> tuple:
+        """
+        Make a blocking call to take the next message from the members in sender_set.
+        :param sender_set: set of ids to watch respective incoming queues for a new message
+        :param timeout: optional timeout for blocking call
+        :return: tuple of sender id and message or None on timeout
+        """
+        caller: str = self.__caller()
+        senders: set = set(sender_set)
+        assert all(self.exists(k) for k in senders), 'unknown sender'
+        result: list = self.__take(caller, senders, 1, timeout)
+        if result:
+            self.logger.debug("%s received %s from %s", caller, result[0][1], result[0][0])
+            return result[0]
+
+    def receive_many(self, sender_set: set = None, max_count: int = 100, timeout: int = 0) -> list:
+        """
+        Make a blocking call to take up to max_count messages off the callers' queues.
+        :param sender_set: set of ids to receive messages from, None for any member
+        :param max_count: maximum number of messages to return
+        :param timeout: optional timeout for blocking call
+        :return: list of (sender, message) tuples, empty on timeout
+        """
+        caller: str = self.__caller()
+        senders = set(sender_set) if sender_set is not None else None
+        assert senders is None or all(self.exists(k) for k in senders), 'unknown sender'
+        result: list = self.__take(caller, senders, max_count, timeout)
+        self.logger.debug("%s received %s messages", caller, len(result))
+        return result
+
+
+class SharedMemoryHub:
+    """
+    SharedMemoryHub holds the state of a channel between processes of one host in a
+    multiprocessing.shared_memory block. Create it in the parent process (after choosing the start
+    method) and pass it to the spawned children, e.g. as argument of multiprocessing.Process.
+
+    Layout of the shared memory block:
+
+    Member Table (MAXPROC slots of SLOT bytes)
+        <active: byte><subgroup length: byte><subgroup: utf-8, up to SLOT - 2 bytes>
+    Free Id Pool
+        <count: uint32><free member ids: MAXPROC x uint32, the first count entries are valid>
+    Inbox Rings (MAXPROC rings of HEAD + capacity bytes)
+        <read counter: uint64><write counter: uint64><data: capacity bytes>
+        Records: <length: uint32><envelope (see lab_wire.wrap)>, wrapping around the ring end
+
+    The member table and the free id pool are protected by one lock. Rings are protected by striped conditions: ring i
+    uses condition i % stripes, which is notified on every write to and read from the ring.
+    """
+
+    SLOT = 64
+    ID = struct.Struct('I')
+    HEAD = struct.Struct('QQ')
+    LENGTH = struct.Struct('!I')
+
+    def __init__(self, n_bits: int = 5, capacity: int = 1 << 16, stripes: int = 16):
+        self.n_bits: int = n_bits
+        self.MAXPROC: int = pow(2, n_bits)
+        self.capacity: int = capacity
+        self.ring_size: int = self.HEAD.size + capacity
+        self.pool_base: int = self.MAXPROC * self.SLOT
+        self.ring_base: int = self.pool_base + self.ID.size * (self.MAXPROC + 1)
+        # shared memory block, member table lock and ring conditions (inherited by spawned children)
+        self.shm = shared_memory.SharedMemory(create=True, size=self.ring_base + self.MAXPROC * self.ring_size)
+        for pid in range(self.MAXPROC):
+            self.ID.pack_into(self.shm.buf, self.pool_base + self.ID.size * (pid + 1), pid)
+        self.ID.pack_into(self.shm.buf, self.pool_base, self.MAXPROC)
+        context = multiprocessing.get_context()
+        self.table_lock = context.Lock()
+        self.conditions: list = [context.Condition() for _ in range(min(stripes, self.MAXPROC))]
+
+    def close(self) -> None:
+        """
+        Detach this process from the shared memory block.
+        :return: None
+        """
+        self.shm.close()
+
+    def unlink(self) -> None:
+        """
+        Detach and destroy the shared memory block (in the creating process, after all children exited).
+        :return: None
+        """
+        self.shm.close()
+        self.shm.unlink()
+
+    def condition(self, pid: str):
+        return self.conditions[int(pid) % len(self.conditions)]
+
+    def active(self, pid: str) -> bool:
+        return self.shm.buf[int(pid) * self.SLOT] == 1
+
+    def take_id(self):
+        """
+        Take a random free member id off the pool (caller holds the table lock).
+        :return: member id or None if all ids are taken
+        """
+        buf = self.shm.buf
+        count: int = self.ID.unpack_from(buf, self.pool_base)[0]
+        if count == 0:
+            return None
+        # move the last entry into the place of the taken one
+        entry: int = self.pool_base + self.ID.size * (random.randrange(count) + 1)
+        last: int = self.pool_base + self.ID.size * count
+        pid: int = self.ID.unpack_from(buf, entry)[0]
+        self.ID.pack_into(buf, entry, self.ID.unpack_from(buf, last)[0])
+        self.ID.pack_into(buf, self.pool_base, count - 1)
+        return str(pid)
+
+    def return_id(self, pid: str) -> None:
+        """
+        Return a member id to the pool (caller holds the table lock).
+        :param pid: member id
+        :return: None
+        """
+        count: int = self.ID.unpack_from(self.shm.buf, self.pool_base)[0]
+        self.ID.pack_into(self.shm.buf, self.pool_base + self.ID.size * (count + 1), int(pid))
+        self.ID.pack_into(self.shm.buf, self.pool_base, count + 1)
+
+    def ring(self, pid: str) -> int:
+        """
+        Offset of a member's inbox ring in the shared memory block.
+        :param pid: member id
+        :return: offset
+        """
+        return self.ring_base + int(pid) * self.ring_size
+
+    def free_space(self, ring: int) -> int:
+        read, written = self.HEAD.unpack_from(self.shm.buf, ring)
+        return self.capacity - (written - read)
+
+    def __copy_in(self, ring: int, counter: int, data: bytes) -> None:
+        buf = self.shm.buf
+        base: int = ring + self.HEAD.size
+        pos: int = counter % self.capacity
+        first: int = min(len(data), self.capacity - pos)
+        buf[base + pos:base + pos + first] = data[:first]
+        buf[base:base + len(data) - first] = data[first:]
+
+    def __copy_out(self, ring: int, counter: int, length: int) -> bytes:
+        buf = self.shm.buf
+        base: int = ring + self.HEAD.size
+        pos: int = counter % self.capacity
+        first: int = min(length, self.capacity - pos)
+        return bytes(buf[base + pos:base + pos + first]) + bytes(buf[base:base + length - first])
+
+    def write(self, ring: int, envelope: bytes) -> None:
+        """
+        Append a record to a ring (caller holds the ring's condition and checked the free space).
+        :param ring: ring offset
+        :param envelope: record content
+        :return: None
+        """
+        read, written = self.HEAD.unpack_from(self.shm.buf, ring)
+        self.__copy_in(ring, written, self.LENGTH.pack(len(envelope)) + envelope)
+        self.HEAD.pack_into(self.shm.buf, ring, read, written + self.LENGTH.size + len(envelope))
+
+    def read(self, ring: int, max_count: int) -> list:
+        """
+        Take up to max_count records off a ring (caller holds the ring's condition).
+        :param ring: ring offset
+        :param max_count: maximum number of records
+        :return: list of record contents
+        """
+        read, written = self.HEAD.unpack_from(self.shm.buf, ring)
+        records: list = []
+        while read < written and len(records) < max_count:
+            length: int = self.LENGTH.unpack(self.__copy_out(ring, read, self.LENGTH.size))[0]
+            records.append(self.__copy_out(ring, read + self.LENGTH.size, length))
+            read += self.LENGTH.size + length
+        self.HEAD.pack_into(self.shm.buf, ring, read, written)
+        return records
+
+    def clear(self, ring: int) -> None:
+        """
+        Drop all records of a ring (caller holds the ring's condition).
+        :param ring: ring offset
+        :return: None
+        """
+        self.HEAD.pack_into(self.shm.buf, ring, 0, 0)
+
+
+class SharedMemoryChannel:
+    """
+    SharedMemoryChannel is a channel backend for processes of one host with the API of
+    lab_channel.Channel. Messages are exchanged through inbox ring buffers in shared memory
+    (see SharedMemoryHub) instead of a redis server.
+
+    Like Channel, bind() associates the calling os process with a member id. Each member has one
+    inbox ring. Messages are serialized by a codec (see lab_codec) and wrapped in an envelope that
+    carries the sender id. Receiving from a subset of senders stashes messages from other senders
+    locally for later receive calls, as in Channel's 'inbox' mode. A sender blocks while the ring of
+    a receiver is full, a message larger than the ring capacity is rejected with a ValueError.
+    Messages may expire (ttl) and multicasts may be atomic. Priority lanes are not supported.
+
+    Example:
+
+        hub = SharedMemoryHub(n_bits=6)
+        procs = [multiprocessing.Process(target=run, args=(hub,)) for _ in range(8)]
+        ...
+        hub.unlink()
+
+        def run(hub):
+            chan = SharedMemoryChannel(hub)
+            chan.bind(chan.join('peer'))
+    """
+
+    def __init__(self, hub: SharedMemoryHub, serializer: str = 'pickle', accept: set = None):
+        # shared channel state
+        self.hub: SharedMemoryHub = hub
+        # create dict of local pid bindings
+        self.os_members = {}
+        # Number of bits for pid addresses and maximum corresponding pid (fixed by the hub)
+        self.n_bits: int = hub.n_bits
+        self.MAXPROC: int = hub.MAXPROC
+        # messages received from senders that have not been asked for yet, per member id
+        self.stash = {}
+        # codec for outgoing messages and names of accepted codecs for incoming messages (None: all)
+        self.codec = lab_codec.get(serializer)
+        self.accept = accept
+        # create instance logger
+        self.logger = logging.getLogger('vs2lab.channel.SharedMemoryChannel')
+        self.logger.debug('New SharedMemoryChannel created.')
+
+    def close(self) -> None:
+        """
+        Detach from the shared memory block.
+        :return: None
+        """
+        self.hub.close()
+
+    def __caller(self) -> str:
+        return self.os_members[os.getpid()]
+
+    def join(self, subgroup: str) -> str:
+        """
+        Join a process as a member to the channel and associate it with a (sub)group.
+        :param subgroup: an identifier for the grouping
+        :return: member id
+        """
+        hub: SharedMemoryHub = self.hub
+        raw_group: bytes = subgroup.encode()
+        assert len(raw_group) <= hub.SLOT - 2, 'subgroup name too long'
+        with hub.table_lock:
+            new_pid = hub.take_id()
+            assert new_pid is not None, 'no free member id'
+            # clear the inbox before the member becomes visible
+            with hub.condition(new_pid):
+                hub.clear(hub.ring(new_pid))
+            slot: int = int(new_pid) * hub.SLOT
+            hub.shm.buf[slot + 1:slot + 2 + len(raw_group)] = bytes([len(raw_group)]) + raw_group
+            hub.shm.buf[slot] = 1
+        self.logger.info("Member %s joining %s.", new_pid, subgroup)
+        return new_pid
+
+    def leave(self, subgroup: str) -> None:
+        """
+        Unregister a process from the channel (and subgroup).
+        Messages in its inbox are dropped, messages it sent remain queued.
+        :param subgroup: subgroup identifier
+        :return: None
+        """
+        hub: SharedMemoryHub = self.hub
+        pid: str = self.os_members.pop(os.getpid())
+        assert hub.active(pid), 'member unknown'
+        self.logger.info("Member %s leaving %s", pid, subgroup)
+        with hub.table_lock:
+            hub.shm.buf[int(pid) * hub.SLOT] = 0
+            hub.return_id(pid)
+        with hub.condition(pid):
+            hub.clear(hub.ring(pid))
+            # wake up senders waiting for space
+            hub.condition(pid).notify_all()
+        self.stash.pop(pid, None)
+
+    def exists(self, pid: str) -> bool:
+        """
+        Check if pid is in global member set
+        :param pid: process identifier
+        :return: boolean value, true if pid is a member
+        """
+        return self.hub.active(str(pid))
+
+    def bind(self, pid: str) -> int:
+        """
+        Associate os pid with channel member id.
+        :param pid: identifier of process member
+        :return: os pid value
+        """
+        os_pid: int = os.getpid()
+        self.os_members[os_pid] = pid
+        self.logger.debug("Member %s bound %s", pid, os_pid)
+        return os_pid
+
+    def __members(self) -> set:
+        buf = self.hub.shm.buf
+        return {str(i) for i in range(self.MAXPROC) if buf[i * self.hub.SLOT] == 1}
+
+    def subgroup(self, subgroup: str) -> set:
+        """
+        Retrieve members of a subgroup.
+        :param subgroup: subgroup string identifier
+        :return: set of member identifiers
+        """
+        hub: SharedMemoryHub = self.hub
+        raw_group: bytes = subgroup.encode()
+        members: set = set()
+        with hub.table_lock:
+            for i in range(self.MAXPROC):
+                slot: int = i * hub.SLOT
+                length: int = hub.shm.buf[slot + 1]
+                if hub.shm.buf[slot] == 1 and bytes(hub.shm.buf[slot + 2:slot + 2 + length]) == raw_group:
+                    members.add(str(i))
+        return members
+
+    def in_subgroup(self, subgroup: str, pid: str) -> bool:
+        """
+        Check if a member belongs to a subgroup (reads only the member's slot).
+        :param subgroup: subgroup string identifier
+        :param pid: member identifier
+        :return: boolean value, true if pid is in the subgroup
+        """
+        hub: SharedMemoryHub = self.hub
+        if not 0 <= int(pid) < self.MAXPROC:
+            return False
+        raw_group: bytes = subgroup.encode()
+        slot: int = int(pid) * hub.SLOT
+        with hub.table_lock:
+            length: int = hub.shm.buf[slot + 1]
+            return hub.shm.buf[slot] == 1 and bytes(hub.shm.buf[slot + 2:slot + 2 + length]) == raw_group
+
+    def __push(self, caller: str, destinations: list, payload: bytes, atomic: bool, ttl: float) -> None:
+        """
+        Write a serialized message to the inbox rings of a list of destinations.
+        :param caller: member identifier of the sender
+        :param destinations: list of member identifiers
+        :param payload: serialized message
+        :param atomic: if true, the message is written to all rings while holding all their conditions
+        :param ttl: time to live of the message in seconds (0 or None: never expires)
+        :return: None
+        """
+        hub: SharedMemoryHub = self.hub
+        envelope: bytes = wrap(caller, payload, time.time() + ttl if ttl else None)
+        needed: int = hub.LENGTH.size + len(envelope)
+        if needed > hub.capacity:
+            raise ValueError('message exceeds ring capacity')
+        if not atomic:
+            for destination in destinations:
+                ring: int = hub.ring(destination)
+                condition = hub.condition(destination)
+                with condition:
+                    # block while the receiver's ring is full
+                    condition.wait_for(lambda: hub.free_space(ring) >= needed or not hub.active(destination))
+                    if hub.active(destination):
+                        hub.write(ring, envelope)
+                        condition.notify_all()
+            return
+
+        # acquire the conditions of all destinations in a fixed order (no deadlock between senders)
+        stripes: list = sorted({int(d) % len(hub.conditions) for d in destinations})
+        while True:
+            for stripe in stripes:
+                hub.conditions[stripe].acquire()
+            full = [d for d in destinations if hub.free_space(hub.ring(d)) < needed and hub.active(d)]
+            if not full:
+                for destination in destinations:
+                    if hub.active(destination):
+                        hub.write(hub.ring(destination), envelope)
+                for stripe in stripes:
+                    hub.conditions[stripe].notify_all()
+                    hub.conditions[stripe].release()
+                return
+            for stripe in reversed(stripes):
+                hub.conditions[stripe].release()
+            # wait for space in a full ring, then try again
+            ring: int = hub.ring(full[0])
+            with hub.condition(full[0]):
+                hub.condition(full[0]).wait_for(lambda: hub.free_space(ring) >= needed or not hub.active(full[0]))
+
+    def send_to(self, destination_set: set, message: object, atomic: bool = False, ttl: float = None,
+                priority: int = 0) -> None:
+        """
+        Sends an asynchronous multicast message.
+        :param destination_set: a set of member identifiers
+        :param message: the message object to be send
+        :param atomic: deliver the multicast atomically
+        :param ttl: time to live of the message in seconds (0 or None: never expires)
+        :param priority: for compatibility with Channel, only the default lane 0
+        :return: None
+        """
+        assert priority == 0, 'priority lanes not supported by SharedMemoryChannel'
+        destinations: list = list(destination_set)
+        assert all(type(k) is str for k in destinations), 'type error'
+        caller: str = self.__caller()
+        assert self.exists(caller), 'unknown sender'
+        assert all(self.exists(k) for k in destinations), 'unknown receiver'
+        self.logger.debug("%s sends %s to %s", caller, message, destination_set)
+        self.__push(caller, destinations, self.codec.dumps(message), atomic, ttl)
+
+    def send_to_all(self, message: object, atomic: bool = False, ttl: float = None, priority: int = 0) -> None:
+        """
+        Sends an asynchronous broadcast message to all members.
+        :param message: the message object to be send
+        :param atomic: deliver the broadcast atomically
+        :param ttl: time to live of the message in seconds (0 or None: never expires)
+        :param priority: for compatibility with Channel, only the default lane 0
+        :return: None
+        """
+        assert priority == 0, 'priority lanes not supported by SharedMemoryChannel'
+        caller: str = self.__caller()
+        members: set = self.__members()
+        assert caller in members, 'unknown sender'
+        self.logger.debug("%s sends %s to all members", caller, message)
+        self.__push(caller, list(members), self.codec.dumps(message), atomic, ttl)
+
+    def __take(self, caller: str, sender_set, max_count: int, timeout: float) -> list:
+        """
+        Take up to max_count messages from a set of senders, stashing messages from other senders.
+        Blocks until at least one message is available.
+        :param caller: member identifier of the receiver
+        :param sender_set: set of sender ids or None for any sender
+        :param max_count: maximum number of messages
+        :param timeout: timeout for blocking read (0 blocks forever)
+        :return: list of (sender, message) tuples, empty on timeout
+        """
+        hub: SharedMemoryHub = self.hub
+        assert hub.active(caller), 'unknown receiver'
+        stash: deque = self.stash.setdefault(caller, deque())
+        ring: int = hub.ring(caller)
+        condition = hub.condition(caller)
+        deadline: float = time.monotonic() + timeout
+        result: list = []
+        while True:
+            # serve stashed messages first, in order of arrival
+            keep: deque = deque()
+            for sender, message in stash:
+                if len(result) < max_count and (sender_set is None or sender in sender_set):
+                    result.append((sender, message))
+                else:
+                    keep.append((sender, message))
+            stash = self.stash[caller] = keep
+            if result:
+                return result
+
+            with condition:
+                while True:
+                    envelopes: list = hub.read(ring, max_count)
+                    if envelopes:
+                        # wake up senders waiting for space
+                        condition.notify_all()
+                        break
+                    remaining = None
+                    if timeout > 0:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return []
+                    condition.wait(remaining)
+            for envelope in envelopes:
+                sender, payload, expires = unwrap(envelope)
+                # expired messages are discarded
+                if expires is None or expires >= time.time():
+                    stash.append((sender, lab_codec.loads(payload, self.accept)))
+
+    def receive_from_any(self, timeout: int = 0) -> tuple:
+        """
+        Make a blocking request to take the next message off the caller's inbox.
+        :param timeout: optional timeout for blocking read.
+        :return: tuple of sender id and message or None on timeout
+        """
+        caller: str = self.__caller()
+        result: list = self.__take(caller, None, 1, timeout)
+        if result:
+            self.logger.debug("%s received %s from %s", caller, result[0][1], result[0][0])
+            return result[0]
+
+    def receive_from(self, sender_set: set, timeout: int = 0) -> tuple:
+        """
+        Make a blocking call to take the next message from the members in sender_set.
+        :param sender_set: set of ids to watch for a new message
+        :param timeout: optional timeout for blocking call
+        :return: tuple of sender id and message or None on timeout
+        """
+        caller: str = self.__caller()
+        senders: set = set(sender_set)
+        assert all(self.exists(k) for k in senders), 'unknown sender'
+        result: list = self.__take(caller, senders, 1, timeout)
+        if result:
+            self.logger.debug("%s received %s from %s", caller, result[0][1], result[0][0])
+            return result[0]
+
+    def receive_many(self, sender_set: set = None, max_count: int = 100, timeout: int = 0) -> list:
+        """
+        Make a blocking call to take up to max_count messages off the caller's inbox.
+        :param sender_set: set of ids to receive messages from, None for any member
+        :param max_count: maximum number of messages to return
+        :param timeout: optional timeout for blocking call
+        :return: list of (sender, message) tuples, empty on timeout
+        """
+        caller: str = self.__caller()
+        senders = set(sender_set) if sender_set is not None else None
+        assert senders is None or all(self.exists(k) for k in senders), 'unknown sender'
+        result: list = self.__take(caller, senders, max_count, timeout)
+        self.logger.debug("%s received %s messages", caller, len(result))
+        return result
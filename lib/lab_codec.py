@@ -0,0 +1,272 @@
+import pickle
+import struct
+
+
+class Codec:
+    """
+    Codec serializes message objects to bytes and back.
+
+    Every serialized message starts with a header byte identifying the codec that produced it.
+    Receivers look up the decoder by that byte, so sender and receiver do not need to agree on a
+    codec up front. A receiver may restrict the codecs it accepts (e.g. to avoid unpickling bytes
+    from untrusted senders).
+
+    Codecs are registered by name and header byte (see register()).
+    """
+    name: str = None
+    header: int = None
+
+    def dumps(self, obj: object) -> bytes:
+        """
+        Serialize an object.
+        :param obj: message object
+        :return: serialized message, starting with the codec's header byte
+        """
+        raise NotImplementedError
+
+    def dumps_parts(self, obj: object) -> list:
+        """
+        Serialize an object into a list of buffers to be concatenated (avoids copying large buffers).
+        :param obj: message object
+        :return: list of bytes-like objects, starting with the codec's header byte
+        """
+        return [self.dumps(obj)]
+
+    def loads(self, data: memoryview) -> object:
+        """
+        Deserialize an object (without header byte).
+        :param data: serialized message
+        :return: message object
+        """
+        raise NotImplementedError
+
+
+class CompactCodec(Codec):
+    """
+    Compact codec for the small protocol messages of the labs.
+
+    Supports None, bool, int (64 bit), float, str, bytes and (nested) tuples and lists of those.
+    Values are encoded as a type tag byte followed by the value. Integers and lengths are encoded as
+    variable length integers (7 bit groups, zigzag encoding for signed values), so a message like
+    (12, '5', 'ENTER') takes 15 bytes.
+    Decoding never executes code, so it is safe for bytes from untrusted senders.
+    """
+    name = 'compact'
+    header = 0x01
+
+    def dumps(self, obj: object) -> bytes:
+        parts: list = [bytes([self.header])]
+        self.__encode(obj, parts)
+        return b''.join(parts)
+
+    def __encode(self, obj: object, parts: list) -> None:
+        if obj is None:
+            parts.append(b'N')
+        elif obj is True:
+            parts.append(b'T')
+        elif obj is False:
+            parts.append(b'F')
+        elif type(obj) is int:
+            if not -2 ** 63 <= obj < 2 ** 63:
+                raise TypeError('integer out of range')
+            parts.append(b'i' + self.__varint((obj << 1) ^ (obj >> 63)))
+        elif type(obj) is float:
+            parts.append(struct.pack('!cd', b'd', obj))
+        elif type(obj) is str:
+            raw: bytes = obj.encode()
+            parts.append(b's' + self.__varint(len(raw)))
+            parts.append(raw)
+        elif type(obj) is bytes:
+            parts.append(b'b' + self.__varint(len(obj)))
+            parts.append(obj)
+        elif type(obj) in (tuple, list):
+            parts.append((b't' if type(obj) is tuple else b'l') + self.__varint(len(obj)))
+            for item in obj:
+                self.__encode(item, parts)
+        else:
+            raise TypeError('type not supported by compact codec: {}'.format(type(obj).__name__))
+
+    @staticmethod
+    def __varint(value: int) -> bytes:
+        raw: bytearray = bytearray()
+        while value > 0x7f:
+            raw.append((value & 0x7f) | 0x80)
+            value >>= 7
+        raw.append(value)
+        return bytes(raw)
+
+    @staticmethod
+    def __read_varint(data: memoryview, pos: int) -> tuple:
+        value, shift = 0, 0
+        while True:
+            if pos >= len(data):
+                raise ValueError('truncated compact message')
+            byte: int = data[pos]
+            pos += 1
+            value |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return value, pos
+            shift += 7
+
+    def loads(self, data: memoryview) -> object:
+        obj, end = self.__decode(data, 0)
+        if end != len(data):
+            raise ValueError('trailing bytes in compact message')
+        return obj
+
+    def __decode(self, data: memoryview, pos: int) -> tuple:
+        if pos >= len(data):
+            raise ValueError('truncated compact message')
+        tag: bytes = bytes(data[pos:pos + 1])
+        pos += 1
+        if tag == b'N':
+            return None, pos
+        if tag == b'T':
+            return True, pos
+        if tag == b'F':
+            return False, pos
+        if tag == b'd':
+            self.__check_length(data, pos + 8)
+            return struct.unpack_from('!d', data, pos)[0], pos + 8
+        length, pos = self.__read_varint(data, pos)
+        if tag == b'i':
+            return (length >> 1) ^ -(length & 1), pos
+        if tag in (b's', b'b'):
+            self.__check_length(data, pos + length)
+        if tag == b's':
+            return str(data[pos:pos + length], 'utf-8'), pos + length
+        if tag == b'b':
+            return bytes(data[pos:pos + length]), pos + length
+        if tag in (b't', b'l'):
+            items: list = []
+            for _ in range(length):
+                item, pos = self.__decode(data, pos)
+                items.append(item)
+            return (tuple(items) if tag == b't' else items), pos
+        raise ValueError('unknown compact type tag {!r}'.format(tag))
+
+    @staticmethod
+    def __check_length(data: memoryview, end: int) -> None:
+        if end > len(data):
+            raise ValueError('truncated compact message')
+
+
+class PickleCodec(Codec):
+    """
+    Pickle codec (protocol 5) with out-of-band buffers.
+
+    Large binary buffers (e.g. bytearray, numpy arrays or pickle.PickleBuffer objects) are not copied
+    into the pickle stream but appended as separate frames. On decoding they are handed to pickle as
+    memoryviews of the received bytes, so they are not copied again.
+
+    Layout: <buffer count: uint32><pickle length: uint64><buffer lengths: uint64 ...><pickle><buffers ...>
+    """
+    name = 'pickle'
+    header = 0x02
+
+    def dumps(self, obj: object) -> bytes:
+        return b''.join(self.dumps_parts(obj))
+
+    def dumps_parts(self, obj: object) -> list:
+        # out-of-band buffers are returned as memoryviews of the original objects (no copy)
+        buffers: list = []
+        body: bytes = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        raws: list = [buffer.raw() for buffer in buffers]
+        lengths: list = [len(body)] + [raw.nbytes for raw in raws]
+        head: bytes = struct.pack('!BI{}Q'.format(len(lengths)), self.header, len(raws), *lengths)
+        return [head, body] + raws
+
+    def loads(self, data: memoryview) -> object:
+        count: int = struct.unpack_from('!I', data)[0]
+        lengths: tuple = struct.unpack_from('!{}Q'.format(count + 1), data, 4)
+        pos: int = 4 + 8 * (count + 1)
+        frames: list = []
+        for length in lengths:
+            frames.append(data[pos:pos + length])
+            pos += length
+        return pickle.loads(frames[0], buffers=frames[1:])
+
+
+class AutoCodec(Codec):
+    """
+    Use the compact codec where possible and fall back to pickle for other messages.
+    Messages are tagged with the header of the codec actually used, so the codec has no header
+    (and no decoder) of its own.
+    """
+    name = 'auto'
+    header = None
+
+    def __init__(self, first: Codec, fallback: Codec):
+        self.first = first
+        self.fallback = fallback
+
+    def dumps(self, obj: object) -> bytes:
+        try:
+            return self.first.dumps(obj)
+        except (TypeError, ValueError):
+            # e.g. a dict, an integer out of range or a str with lone surrogates
+            return self.fallback.dumps(obj)
+
+    def dumps_parts(self, obj: object) -> list:
+        try:
+            return self.first.dumps_parts(obj)
+        except (TypeError, ValueError):
+            return self.fallback.dumps_parts(obj)
+
+
+# Registry of codecs by name and by header byte
+CODECS: dict = {}
+HEADERS: dict = {}
+# first byte of a pickle stream (protocol >= 2) sent without codec header by older channels
+PICKLE_PROTO = 0x80
+# header bytes not available to codecs (lab_channel marks messages stamped with an expiry time by 0x00
+# and chunked messages by 0xfe)
+RESERVED = (0x00, 0xfe, PICKLE_PROTO)
+
+
+def register(codec: Codec) -> None:
+    """
+    Register a codec by name and header byte.
+    :param codec: codec instance
+    :return: None
+    """
+    assert codec.name not in CODECS, 'codec name already registered'
+    CODECS[codec.name] = codec
+    if codec.header is not None:
+        assert codec.header not in HEADERS and codec.header not in RESERVED, 'codec header already in use'
+        HEADERS[codec.header] = codec
+
+
+def get(name: str) -> Codec:
+    """
+    Look up a codec by name.
+    :param name: codec name
+    :return: codec instance
+    """
+    assert name in CODECS, 'unknown codec'
+    return CODECS[name]
+
+
+def loads(data: bytes, accept: set = None) -> object:
+    """
+    Deserialize a message by means of the codec given in its header byte.
+    :param data: serialized message (bytes-like, e.g. a memoryview of a reassembled message)
+    :param accept: set of accepted codec names, None accepts all registered codecs
+    :return: message object
+    """
+    view = memoryview(data)
+    header: int = view[0]
+    codec = CODECS['pickle'] if header == PICKLE_PROTO else HEADERS.get(header)
+    if codec is None:
+        raise ValueError('unknown codec header {:#04x}'.format(header))
+    if accept is not None and codec.name not in accept:
+        raise ValueError('codec {} not accepted'.format(codec.name))
+    if header == PICKLE_PROTO:
+        # plain pickle stream without header byte (sent by older channels)
+        return pickle.loads(data)
+    return codec.loads(view[1:])
+
+
+register(CompactCodec())
+register(PickleCodec())
+register(AutoCodec(CODECS['compact'], CODECS['pickle']))
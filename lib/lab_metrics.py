@@ -0,0 +1,225 @@
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+# upper bounds of the latency histogram buckets in seconds (50us ... 10s)
+BUCKETS: tuple = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                  0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class Histogram:
+    """
+    Latency histogram with fixed buckets (see BUCKETS), count and sum.
+    """
+
+    def __init__(self):
+        self.counts: list = [0] * len(BUCKETS)
+        self.count: int = 0
+        self.sum: float = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, fraction: float) -> float:
+        """
+        Estimate a quantile as the upper bound of the bucket containing it.
+        :param fraction: quantile as fraction (e.g. 0.99)
+        :return: upper bucket bound in seconds or None if nothing was observed
+        """
+        if self.count == 0:
+            return None
+        rank: float = fraction * self.count
+        seen: int = 0
+        for bound, n in zip(BUCKETS, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+
+class Metrics:
+    """
+    Metrics collects counters, gauges and latency histograms of channel operations.
+
+    Values are identified by a name and optional labels (keyword arguments), e.g.
+    metrics.observe('op_seconds', 0.002, op='send_to'). A channel created with a Metrics instance
+    reports to it, several channels may share one instance. All methods are thread safe.
+
+    Exporters: to_prometheus() renders the Prometheus text format (see write_textfile() for the
+    textfile collector of the node exporter), snapshot() returns a plain dict (see dump_on_exit()).
+    """
+
+    def __init__(self, prefix: str = 'vs2lab_channel'):
+        self.prefix: str = prefix
+        self.lock = threading.Lock()
+        # {(name, labels): value}, labels as sorted tuple of (key, value) pairs
+        self.counters: dict = {}
+        self.gauges: dict = {}
+        self.histograms: dict = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        """
+        Increase a counter.
+        :param name: counter name
+        :param value: increment
+        :return: None
+        """
+        key: tuple = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels) -> None:
+        """
+        Set a gauge (e.g. a sampled queue depth).
+        :param name: gauge name
+        :param value: current value
+        :return: None
+        """
+        key: tuple = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        """
+        Add a duration to a latency histogram.
+        :param name: histogram name
+        :param seconds: observed duration
+        :return: None
+        """
+        key: tuple = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Context manager observing the duration of its block in a latency histogram.
+        :param name: histogram name
+        """
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    @staticmethod
+    def __labels(labels: tuple, extra: str = '') -> str:
+        parts: list = ['{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels]
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    def to_prometheus(self) -> str:
+        """
+        Render all values in the Prometheus text exposition format.
+        :return: text
+        """
+        lines: list = []
+        with self.lock:
+            for kind, values in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in values}):
+                    metric: str = '{}_{}'.format(self.prefix, name)
+                    lines.append('# TYPE {} {}'.format(metric, kind))
+                    for (n, labels), value in sorted(values.items()):
+                        if n == name:
+                            lines.append('{}{} {}'.format(metric, self.__labels(labels), value))
+            for name in sorted({name for name, _ in self.histograms}):
+                metric: str = '{}_{}'.format(self.prefix, name)
+                lines.append('# TYPE {} histogram'.format(metric))
+                for (n, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                    if n != name:
+                        continue
+                    cumulative: int = 0
+                    for bound, count in zip(BUCKETS, histogram.counts):
+                        cumulative += count
+                        le: str = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append('{}_bucket{} {}'.format(metric, self.__labels(labels, 'le="{}"'.format(le)),
+                                                             cumulative))
+                    lines.append('{}_sum{} {}'.format(metric, self.__labels(labels), histogram.sum))
+                    lines.append('{}_count{} {}'.format(metric, self.__labels(labels), histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> dict:
+        """
+        Summarize all values: counters and gauges as numbers, histograms as count, sum, mean
+        and estimated p50/p99/p999 (bucket upper bounds).
+        :return: dict by name and rendered labels
+        """
+        def key(name, labels):
+            return name + self.__labels(labels)
+
+        with self.lock:
+            result: dict = {'counters': {key(n, l): v for (n, l), v in sorted(self.counters.items())},
+                            'gauges': {key(n, l): v for (n, l), v in sorted(self.gauges.items())},
+                            'histograms': {}}
+            for (n, l), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                result['histograms'][key(n, l)] = {
+                    'count': histogram.count, 'sum': histogram.sum,
+                    'mean': histogram.sum / histogram.count if histogram.count else None,
+                    'p50': histogram.quantile(0.5), 'p99': histogram.quantile(0.99),
+                    'p999': histogram.quantile(0.999)}
+        return result
+
+
+class NullMetrics:
+    """
+    Metrics sink that discards everything (default of channels without instrumentation).
+    """
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        pass
+
+    def set(self, name: str, value: float, **labels) -> None:
+        pass
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        pass
+
+    def timer(self, name: str, **labels):
+        return nullcontext()
+
+
+NULL = NullMetrics()
+
+
+def write_textfile(metrics: Metrics, path: str) -> None:
+    """
+    Write metrics in the Prometheus text format, replacing the file atomically
+    (as expected by the textfile collector of the node exporter).
+    :param metrics: metrics to export
+    :param path: target file, should end with '.prom'
+    :return: None
+    """
+    tmp: str = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp, 'w') as f:
+        f.write(metrics.to_prometheus())
+    os.replace(tmp, path)
+
+
+def dump_on_exit(metrics: Metrics, path: str = None) -> None:
+    """
+    Dump a metrics snapshot when the process exits.
+    :param metrics: metrics to export
+    :param path: JSON file ('.json') or Prometheus text file (other names), None logs the snapshot
+    :return: None
+    """
+    def dump():
+        if path is None:
+            logging.getLogger('vs2lab.metrics').info('Channel metrics: %s', json.dumps(metrics.snapshot()))
+        elif path.endswith('.json'):
+            with open(path, 'w') as f:
+                json.dump(metrics.snapshot(), f, indent=2)
+        else:
+            write_textfile(metrics, path)
+
+    atexit.register(dump)
@@ -0,0 +1,163 @@
+"""
+Redis layout and message formats shared by the channel implementations (see lab_channel.Channel and
+lab_async_channel.AsyncChannel): key names, message envelopes, expiry stamps, chunked messages and the
+timeouts of blocking reads.
+"""
+
+import struct
+import time
+
+
+# maximum number of priority lanes per queue (see lab_channel.Channel)
+MAX_LANES = 4
+
+
+def queue_key(sender: str, receiver: str, lane: int = 0) -> str:
+    """
+    Construct queue name "queue:<sender>:<receiver>:<lane>" from sender and receiver ids and priority lane.
+    The membership scripts of lab_channel build the same names in Lua.
+    :param sender: member identifier
+    :param receiver: member identifier
+    :param lane: priority lane, 0 is the default lane
+    :return: redis key
+    """
+    return 'queue:{}:{}:{}'.format(sender, receiver, lane)
+
+
+def queue_sender(key: str) -> str:
+    """
+    Extract the sender id from a queue name.
+    :param key: redis key of a queue
+    :return: member identifier of the sender
+    """
+    return key.split(':')[1]
+
+
+def inbox_key(receiver: str, lane: int = 0) -> str:
+    """
+    Construct inbox name from receiver id (and priority lane, 'inbox' mode).
+    :param receiver: member identifier
+    :param lane: priority lane, 0 is the default lane
+    :return: redis key
+    """
+    if lane == 0:
+        return 'inbox:' + receiver
+    return 'inbox:' + receiver + ':' + str(lane)
+
+
+def stream_key(receiver: str) -> str:
+    """
+    Construct inbox stream name from receiver id ('stream' mode).
+    :param receiver: member identifier
+    :return: redis key
+    """
+    return 'stream:' + receiver
+
+
+# shortest timeout of a blocking read: redis converts timeouts to whole milliseconds and 0 blocks forever
+# (0.001 s already ends up as 0 due to rounding, the server checks timeouts every 1/hz seconds anyway)
+MIN_TIMEOUT = 0.01
+
+
+def remaining_timeout(deadline: float):
+    """
+    Compute the timeout of the next blocking read of a receive call.
+    :param deadline: end of the receive call (time.monotonic())
+    :return: seconds left (at least MIN_TIMEOUT) or None if the deadline has passed
+    """
+    remaining: float = deadline - time.monotonic()
+    if remaining <= 0:
+        return None
+    return max(remaining, MIN_TIMEOUT)
+
+
+# envelope flag: an expiry time (unix time, double) follows the sender id
+FLAG_EXPIRES = 0x01
+# first byte of a stamped message in a pairwise queue (no codec uses header 0x00, see lab_codec)
+STAMP = 0x00
+
+
+def wrap(sender: str, payload: bytes, expires: float = None) -> bytes:
+    """
+    Wrap a serialized message in an envelope carrying the sender id (and expiry time).
+    :param sender: member identifier
+    :param payload: serialized message
+    :param expires: unix time after which the message is discarded, None if it never expires
+    :return: envelope bytes
+    """
+    raw_sender: bytes = sender.encode()
+    if expires is None:
+        return struct.pack('!BB', 0, len(raw_sender)) + raw_sender + payload
+    return struct.pack('!BB', FLAG_EXPIRES, len(raw_sender)) + raw_sender + struct.pack('!d', expires) + payload
+
+
+def unwrap(envelope: bytes) -> tuple:
+    """
+    Unwrap an envelope.
+    :param envelope: envelope bytes
+    :return: tuple of sender id, serialized message and expiry time (None if it never expires)
+    """
+    flags, length = struct.unpack_from('!BB', envelope)
+    sender: str = bytes(envelope[2:2 + length]).decode()
+    if flags & FLAG_EXPIRES:
+        return sender, envelope[10 + length:], struct.unpack_from('!d', envelope, 2 + length)[0]
+    return sender, envelope[2 + length:], None
+
+
+def stamp(payload: bytes, expires: float = None) -> bytes:
+    """
+    Prefix a serialized message for a pairwise queue with its expiry time.
+    :param payload: serialized message
+    :param expires: unix time after which the message is discarded, None if it never expires
+    :return: stamped message (the payload itself if it never expires)
+    """
+    if expires is None:
+        return payload
+    return struct.pack('!Bd', STAMP, expires) + payload
+
+
+def unstamp(raw: bytes) -> tuple:
+    """
+    Split a message taken off a pairwise queue into payload and expiry time.
+    :param raw: message bytes
+    :return: tuple of serialized message and expiry time (None if it never expires)
+    """
+    if raw[0] == STAMP:
+        return raw[9:], struct.unpack_from('!d', raw, 1)[0]
+    return raw, None
+
+
+# first byte of the header element of a chunked message (no codec uses header 0xfe, see lab_codec)
+CHUNK = 0xfe
+# header element: <CHUNK><number of frames: uint32><message length: uint64>
+CHUNK_HEADER = struct.Struct('!BIQ')
+
+
+def split(parts: list, chunk_size: int) -> list:
+    """
+    Split a message into list elements of at most chunk_size bytes.
+    A small message is a single element. A large message becomes a header element followed by
+    frames that are memoryviews of the given buffers (not copies). All elements of a message have
+    to be pushed by a single RPUSH, so they are contiguous in the receiver's list.
+    :param parts: message as list of bytes-like objects (see lab_codec.Codec.dumps_parts)
+    :param chunk_size: maximum frame size in bytes, None to never split
+    :return: list of list elements
+    """
+    views: list = [memoryview(part).cast('B') for part in parts]
+    total: int = sum(view.nbytes for view in views)
+    if chunk_size is None or total <= chunk_size:
+        return [b''.join(views)]
+    frames: list = []
+    for view in views:
+        for i in range(0, view.nbytes, chunk_size):
+            frames.append(view[i:i + chunk_size])
+    return [CHUNK_HEADER.pack(CHUNK, len(frames), total)] + frames
+
+
+def pool_key(size: int) -> str:
+    """
+    Construct the name of the pool of free member ids for an id range.
+    :param size: number of ids (MAXPROC)
+    :return: redis key
+    """
+    return 'free:' + str(size)
@@ -0,0 +1,46 @@
+"""
+Benchmark test (the redis backends need a running redis server, its keys are flushed)
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import unittest
+
+import redis
+
+from lib import lab_bench, lab_channel
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def killed(start):
+    start.wait()
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+class TestBench(unittest.TestCase):
+    """Test short benchmark runs"""
+
+    def test_all_backends(self):
+        # run as a script: member processes are spawned
+        backends = ['local', 'shm']
+        try:
+            lab_channel.flushall()
+            backends += ['redis', 'redis-inbox', 'redis-stream']
+        except redis.ConnectionError:
+            pass
+        result = subprocess.run([sys.executable, '-m', 'lib.lab_bench', '--backends'] + backends +
+                                ['--members', '2', '--payloads', '16', '--messages', '4'],
+                                cwd=ROOT, capture_output=True, text=True, timeout=300)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(len(result.stdout.splitlines()), 1 + len(lab_bench.WORKLOADS) * len(backends))
+
+    def test_killed_member_fails_the_run(self):
+        with self.assertRaisesRegex(RuntimeError, 'exited with code'):
+            lab_bench.run_members([killed], processes=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,316 @@
+"""
+Channel test (needs a running redis server, its keys are flushed)
+"""
+
+import asyncio
+import multiprocessing
+import threading
+import time
+import unittest
+
+import redis
+
+from lib import lab_async_channel, lab_channel, lab_channel_local
+
+
+def setUpModule():
+    try:
+        lab_channel.flushall()
+    except redis.ConnectionError:
+        raise unittest.SkipTest("redis server not available")
+
+
+class TestChannel(unittest.TestCase):
+    """Test message delivery in queue mode"""
+    mode = 'queue'
+
+    def setUp(self):
+        lab_channel.flushall()
+        self.channel = lab_channel.Channel(mode=self.mode, options=lab_channel.QueueOptions(chunk_size=1024))
+        self.sender = self.channel.join('sender')
+        self.receiver = self.channel.join('receiver')
+
+    def send(self, message, **kwargs):
+        self.channel.bind(self.sender)
+        self.channel.send_to({self.receiver}, message, **kwargs)
+
+    def receive(self, timeout=1):
+        self.channel.bind(self.receiver)
+        return self.channel.receive_from_any(timeout)
+
+    def test_expiring_message_keeps_later_message(self):
+        self.send('old', ttl=0.2)
+        self.send('keep')
+        time.sleep(0.4)
+        self.assertEqual(self.receive(), (self.sender, 'keep'))
+
+    def test_expired_message_is_discarded(self):
+        self.send('old', ttl=0.1)
+        time.sleep(0.2)
+        self.assertIsNone(self.receive(0.1))
+
+    def test_sub_millisecond_timeout(self):
+        start = time.monotonic()
+        self.assertIsNone(self.receive(0.0005))
+        self.send('late')
+        self.assertEqual(self.receive(0.0005), (self.sender, 'late'))
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_in_subgroup(self):
+        self.assertTrue(self.channel.in_subgroup('sender', self.sender))
+        self.assertFalse(self.channel.in_subgroup('sender', self.receiver))
+        self.assertFalse(self.channel.in_subgroup('nobody', self.sender))
+
+    def test_leave_deletes_incoming_queues(self):
+        # the leave script builds the queue names of all lanes like the python code
+        lanes = 1 if self.mode == 'stream' else 2
+        channel = lab_channel.Channel(mode=self.mode, options=lab_channel.QueueOptions(lanes=lanes))
+        channel.bind(self.sender)
+        for priority in range(lanes):
+            channel.send_to({self.receiver}, 'lost', priority=priority)
+        channel.bind(self.receiver)
+        channel.leave('receiver')
+        keys = [key.decode().split(':') for key in redis.StrictRedis().keys()]
+        self.assertEqual([key for key in keys if key[0] in ('queue', 'inbox', 'stream') and self.receiver in key], [])
+
+    def test_receive_many(self):
+        for i in range(10):
+            self.send(i)
+        self.send(bytes(3000))
+        self.channel.bind(self.receiver)
+        received = self.channel.receive_many(max_count=5, timeout=1)
+        self.assertEqual(received, [(self.sender, i) for i in range(5)])
+        received += self.channel.receive_many(max_count=100, timeout=1)
+        received += self.channel.receive_many(max_count=100, timeout=1)  # chunked message (see setUp)
+        self.assertEqual(received, [(self.sender, i) for i in range(10)] + [(self.sender, bytes(3000))])
+
+    def test_receive_many_keeps_newest_of_bounded_queue(self):
+        # senders trim bounded queues while the receiver takes messages off: old messages may be
+        # dropped, the newest message never
+        sender = lab_channel.Channel(mode=self.mode, options=lab_channel.QueueOptions(maxlen=3))
+        sender.bind(self.sender)
+        count = 2000
+
+        def send():
+            for i in range(count):
+                sender.send_to({self.receiver}, i)
+
+        thread = threading.Thread(target=send)
+        thread.start()
+        self.channel.bind(self.receiver)
+        received = []
+        while not received or received[-1] != count - 1:
+            batch = self.channel.receive_many(max_count=10, timeout=2)
+            self.assertTrue(batch, "newest message lost after " + str(received[-1:]))
+            received += [message for _, message in batch]
+        thread.join()
+        self.assertEqual(received, sorted(set(received)))
+
+    def test_leave_unregisters_sender(self):
+        if self.mode != 'queue':
+            self.skipTest('sender sets are used in queue mode only')
+        self.send('lost')
+        self.channel.leave('sender')
+        self.assertEqual(redis.StrictRedis().smembers('xchan:' + self.receiver), set())
+        self.assertEqual(redis.StrictRedis().keys('queue:*'), [])
+
+
+class TestInboxChannel(TestChannel):
+    """Test message delivery in inbox mode"""
+    mode = 'inbox'
+
+
+class TestStreamChannel(TestChannel):
+    """Test message delivery in stream mode"""
+    mode = 'stream'
+
+
+class TestMemberCache(unittest.TestCase):
+    """Test the local copy of the member set"""
+
+    def setUp(self):
+        lab_channel.flushall()
+        self.channel = lab_channel.Channel(cache_members=True)
+        self.sender = self.channel.join('sender')
+
+    def tearDown(self):
+        self.channel.close()
+
+    def test_lost_subscription_falls_back_to_redis(self):
+        time.sleep(0.2)  # let the listener subscribe
+        # a password makes the reconnect fail, so the subscription is lost for good
+        admin = redis.StrictRedis()
+        admin.config_set('requirepass', 'lost')
+        self.addCleanup(admin.config_set, 'requirepass', '')
+        admin.client_kill_filter(_type='pubsub')
+        deadline = time.monotonic() + 10  # the client retries reconnecting for a few seconds
+        while self.channel.members_cache is not None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        admin.config_set('requirepass', '')
+        self.assertIsNone(self.channel.members_cache)
+        # a member joining later is seen
+        receiver = lab_channel.Channel().join('receiver')
+        self.channel.bind(self.sender)
+        self.channel.send_to_all('hello')
+        self.channel.bind(receiver)
+        self.assertEqual(self.channel.receive_from({self.sender}, 1), (self.sender, 'hello'))
+
+    def test_forked_process_does_not_use_stale_cache(self):
+        peers = lab_channel.Channel()
+        peer = peers.join('peer')
+        time.sleep(0.2)  # let the listener see the join
+        self.assertTrue(self.channel.exists(peer))
+        context = multiprocessing.get_context('fork')
+        left, results = context.Event(), context.Queue()
+
+        def child():
+            # the inherited cache still lists the peer, the listener thread did not survive the fork
+            left.wait()
+            results.put(self.channel.exists(peer))
+
+        process = context.Process(target=child)
+        process.start()
+        peers.bind(peer)
+        peers.leave('peer')
+        left.set()
+        self.assertFalse(results.get(timeout=5))
+        process.join()
+
+
+class TestReceiveMany(unittest.TestCase):
+    """Test batch receive by competing receivers"""
+
+    def setUp(self):
+        lab_channel.flushall()
+        self.channel = lab_channel.Channel()
+        self.sender = self.channel.join('sender')
+        self.receiver = self.channel.join('receiver')
+
+    def test_competing_receivers_take_every_message_once(self):
+        # two instances bound to the same member drain its queues concurrently
+        count = 2000
+        self.channel.bind(self.sender)
+        for i in range(count):
+            self.channel.send_to({self.receiver}, i)
+        received = []
+
+        def receive():
+            channel = lab_channel.Channel()
+            channel.bind(self.receiver)
+            batch = channel.receive_many(max_count=10, timeout=1)
+            while batch:
+                received.extend(message for _, message in batch)
+                batch = channel.receive_many(max_count=10, timeout=0.2)
+
+        threads = [threading.Thread(target=receive) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(received), list(range(count)))
+
+
+class TestLocalBackends(unittest.TestCase):
+    """Test the in-process and shared-memory backends"""
+
+    def check(self, channel):
+        node = channel.join('node')
+        other = channel.join('other')
+        # subgroup lookups
+        self.assertTrue(channel.in_subgroup('node', node))
+        self.assertFalse(channel.in_subgroup('node', other))
+        self.assertFalse(channel.in_subgroup('node', str(channel.MAXPROC)))
+        self.assertEqual(channel.subgroup('node'), {node})
+        # message expiry, priority lanes are rejected
+        channel.bind(node)
+        channel.send_to({other}, 'old', ttl=0.1)
+        channel.send_to({other}, 'keep', atomic=True)
+        with self.assertRaises(AssertionError):
+            channel.send_to_all('urgent', priority=1)
+        time.sleep(0.2)
+        channel.bind(other)
+        self.assertEqual(channel.receive_many(timeout=1), [(node, 'keep')])
+        # member ids are taken off and returned to the free id pool
+        while len(channel.subgroup('peer')) < channel.MAXPROC - 2:
+            channel.join('peer')
+        with self.assertRaises(AssertionError):
+            channel.join('peer')
+        channel.leave('other')
+        self.assertEqual(channel.join('peer'), other)
+
+    def test_local_channel(self):
+        self.check(lab_channel_local.LocalChannel(hub=lab_channel_local.LocalHub()))
+
+    def test_shared_memory_channel(self):
+        hub = lab_channel_local.SharedMemoryHub()
+        try:
+            self.check(lab_channel_local.SharedMemoryChannel(hub))
+        finally:
+            hub.close()
+            hub.unlink()
+
+
+class TestAsyncChannel(unittest.IsolatedAsyncioTestCase):
+    """Test messages of async members to lists of sync members"""
+
+    async def test_expiring_message_keeps_later_message(self):
+        for mode in ('queue', 'inbox'):
+            lab_channel.flushall()
+            sync = lab_channel.Channel(mode=mode)
+            receiver = sync.join('receiver')
+            sync.bind(receiver)
+            node = lab_async_channel.AsyncChannel(mode=mode)
+            node.bind(await node.join('sender'))
+            sync.bind(node.pid)
+            sync.send_to({receiver}, 'old', ttl=0.2)  # the list expires with this message ...
+            await node.send_to({receiver}, 'keep')  # ... unless a message without ttl follows
+            time.sleep(0.4)
+            sync.bind(receiver)
+            self.assertEqual(sync.receive_from_any(1), (node.pid, 'keep'))
+            await node.close()
+
+    async def test_sub_millisecond_timeout(self):
+        for mode in ('queue', 'inbox'):
+            lab_channel.flushall()
+            node = lab_async_channel.AsyncChannel(mode=mode)
+            node.bind(await node.join('node'))
+            self.assertIsNone(await asyncio.wait_for(node.receive_from_any(0.0005), 1))
+            await node.send_to({node.pid}, 'self')
+            self.assertEqual(await asyncio.wait_for(node.receive_from({node.pid}, 0.0005), 1), (node.pid, 'self'))
+            await node.close()
+
+    async def test_receive_many(self):
+        for mode in ('queue', 'inbox'):
+            lab_channel.flushall()
+            node = lab_async_channel.AsyncChannel(mode=mode)
+            node.bind(await node.join('node'))
+            sync = lab_channel.Channel(mode=mode, options=lab_channel.QueueOptions(chunk_size=1024))
+            sync.bind(node.pid)
+            await node.send_to({node.pid}, 'old', ttl=0.1)
+            for i in range(3):
+                await node.send_to({node.pid}, i)
+            sync.send_to({node.pid}, b'x' * 5000)  # chunked message
+            await asyncio.sleep(0.2)
+            received = []
+            batch = await node.receive_many(max_count=10, timeout=1)
+            while batch:
+                received.extend(batch)
+                batch = await node.receive_many(max_count=10, timeout=0.1)
+            self.assertEqual(received, [(node.pid, 0), (node.pid, 1), (node.pid, 2), (node.pid, b'x' * 5000)])
+            await node.close()
+
+    def test_stream_mode_is_rejected(self):
+        with self.assertRaises(AssertionError):
+            lab_async_channel.AsyncChannel(mode='stream')
+
+    async def test_in_subgroup(self):
+        lab_channel.flushall()
+        node = lab_async_channel.AsyncChannel()
+        node.bind(await node.join('node'))
+        self.assertTrue(await node.in_subgroup('node', node.pid))
+        self.assertFalse(await node.in_subgroup('other', node.pid))
+        await node.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+"""
+Codec test
+"""
+
+import unittest
+
+from lib import lab_codec
+
+
+class TestAutoCodec(unittest.TestCase):
+    """Test the choice of codec per message"""
+
+    def setUp(self):
+        self.codec = lab_codec.get('auto')
+
+    def check(self, message, codec):
+        data = self.codec.dumps(message)
+        self.assertEqual(data[0], lab_codec.get(codec).header)
+        self.assertEqual(lab_codec.loads(data), message)
+        self.assertEqual(lab_codec.loads(b''.join(self.codec.dumps_parts(message))), message)
+
+    def test_compact_message(self):
+        self.check((1, 'a', b'b'), 'compact')
+
+    def test_fallback_to_pickle(self):
+        self.check({1: 2}, 'pickle')
+        self.check(bytearray(10), 'pickle')
+        self.check(2 ** 64, 'pickle')
+        self.check('\ud800', 'pickle')  # lone surrogate, not encodable as utf-8
+
+
+class TestCompactCodec(unittest.TestCase):
+    """Test decoding of malformed compact messages"""
+
+    def test_truncated_message(self):
+        data = lab_codec.get('compact').dumps((1.5, 'abc', (2 ** 40, b'xyz')))
+        for end in range(1, len(data)):
+            with self.assertRaisesRegex(ValueError, 'truncated'):
+                lab_codec.loads(data[:end])
+
+    def test_trailing_bytes(self):
+        with self.assertRaisesRegex(ValueError, 'trailing'):
+            lab_codec.loads(lab_codec.get('compact').dumps('abc') + b'N')
+
+
+if __name__ == '__main__':
+    unittest.main()